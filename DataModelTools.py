@@ -141,7 +141,7 @@ class User:
             print('Unable open connection {}.'.format(e))
             return[]
 
-    def OpenConnection(self):
+    def OpenConnection(self,LocalInfile=False):
         """
             This atribute was developed to resolve a connection issue.
             Originally, construtor openned a connection to the database 
@@ -153,6 +153,8 @@ class User:
             in each subroutine that queries data from the database. 
             The connection is opened using the user name and password
             stored in the user object.
+            LocalInfile enables LOAD DATA LOCAL INFILE on the connection
+            (used for bulk loading data files from this computer).
         """
         # Open connection to database. If the database is not accessible,
         # throw a mariadb exception.
@@ -161,7 +163,8 @@ class User:
                                     user = self.Name,
                                     host = self.Host,
                                     password= self.Password,
-                                    port=3306)
+                                    port=3306,
+                                    local_infile=LocalInfile)
         # Catch mariadb exception.
         except mariadb.Error as e:
             print('Unable open connection {}.'.format(e))
@@ -202,7 +205,9 @@ def MolecularToolsMainMenu(DataUser):
               - Query Data:     pulls data from database for later use.
             C - Model Data:     uses machine learning to construct a data model using
                                 neural networks.
-            D - Test Query:     Test connection to database.
+            D - Model Health Data: risk tables from the health survey summary.
+            E - Health Risk Model: trains a logistic regression model of heart
+                                attack risk on every survey record (slow).
             U - Update Data:    Allows users with the priviledge to create or insert
                                 data the option to do so.
     """
@@ -211,7 +216,7 @@ def MolecularToolsMainMenu(DataUser):
 
     MMName = 'MAIN MENU'
     MMOptions = [['A','Update Status'],['B','Compare Methods'],['C','Model Molecular Data'],
-                 ['D','Model Health Data'],
+                 ['D','Model Health Data'],['E','Health Risk Model'],
                   ['Q','Quit']]
     if DataUser.Update:
         MMOptions.append(['U','Update Molecule Database'])
@@ -236,6 +241,8 @@ def MolecularToolsMainMenu(DataUser):
             MolecularModelData.ModelData(DataUser)
         elif Option == 'D':
             HealthModelData.ModelData(DataUser)
+        elif Option == 'E':
+            HealthModelData.RiskModelData(DataUser)
         elif (Option == 'Q') or (Option == 'q'):
             print('Exiting Data Tools')
         elif (Option == 'U') and DataUser.Update:
@@ -247,8 +254,11 @@ def MolecularToolsMainMenu(DataUser):
         else:
             print('Input not recognized.')
 
-MolecularToolsStartUp()
-DataUser = User()
-MolecularToolsMainMenu(DataUser)
+# Worker processes (see HealthDatabase.ExtractData) import this module on
+# platforms that spawn new processes, so only start the menu when run directly.
+if __name__ == '__main__':
+    MolecularToolsStartUp()
+    DataUser = User()
+    MolecularToolsMainMenu(DataUser)
 
 
@@ -0,0 +1,248 @@
+# Largest number of rows sent to the server in one executemany call, and the
+# part of the server's max_allowed_packet that a chunk of rows is sized to fill
+# (see ChunkRows).
+MaxChunkRows = 10000
+PacketFraction = 0.5
+
+# Server variables used to write the rows (see ServerVariables).
+ServerNames = ['max_allowed_packet','auto_increment_increment','innodb_autoinc_lock_mode']
+
+def ServerVariables(Connection):
+
+    """
+        Returns a dictionary with the value of each server variable in
+        ServerNames. The variables are read once for a connection and passed
+        to InsertRows and UpdateRows (as Variables) for every table written on
+        it.
+    """
+    cur = Connection.cursor()
+    try:
+        cur.execute('SELECT {}'.format(', '.join(['@@' + Name for Name in ServerNames])))
+        return dict(zip(ServerNames,cur.fetchone()))
+    finally:
+        cur.close()
+
+def ChunkRows(DataRows, MaxPacket, SampleSize=100):
+
+    """
+        Returns the number of rows to send in each executemany call. The size
+        of a row is estimated from the first SampleSize rows of DataRows and
+        the chunk is sized to fill PacketFraction of the server's
+        max_allowed_packet (MaxPacket, in bytes), up to MaxChunkRows rows.
+    """
+    # Strings are sent with their length and numbers in (at most) 8 bytes plus
+    # the type of each parameter.
+    Sample = DataRows[:SampleSize]
+    RowBytes = sum([len(Value.encode()) + 4 if isinstance(Value,str) else 9 for Row in Sample for Value in Row])
+    RowBytes = max(RowBytes/max(len(Sample),1),1.)
+    return max(1,min(MaxChunkRows,int(MaxPacket*PacketFraction/RowBytes)))
+
+def ConsecutiveIDs(Variables):
+
+    """
+        Returns True if the server gives the rows of one INSERT consecutive
+        AUTO_INCREMENT IDs (see ServerVariables): auto_increment_increment is 1
+        and the IDs are not interleaved with other inserts
+        (innodb_autoinc_lock_mode is not 2).
+    """
+    return Variables['auto_increment_increment'] == 1 and Variables['innodb_autoinc_lock_mode'] != 2
+
+def AddIDRange(IDRanges, FirstID, NumRows):
+
+    """
+        Adds the range [FirstID, FirstID + NumRows - 1] of consecutive IDs to
+        the list IDRanges. A range that follows on from the last range of the
+        list is merged into it.
+    """
+    LastID = FirstID + NumRows - 1
+    if len(IDRanges) > 0 and IDRanges[-1][1] + 1 == FirstID:
+        IDRanges[-1][1] = LastID
+    else:
+        IDRanges.append([FirstID,LastID])
+    return IDRanges
+
+def InsertRows(Connection, TableName, DataColumns, DataRows, Ignore=False, ChunkSize=None, Commit=True,
+               Report=None, Variables=None):
+
+    """
+        Inserts DataRows (a list of rows with a value for each column in
+        DataColumns) into Table TableName with a parameterized INSERT that is
+        executed ChunkSize rows at a time (by default, sized by ChunkRows).
+        Variables holds the server variables of Connection (see
+        ServerVariables); they are read from the server if not given.
+        None is inserted as NULL. If Ignore is True, rows whose unique key is
+        already in the table are skipped by the server (INSERT IGNORE).
+        The rows are inserted in the current transaction of Connection, which
+        is committed if Commit is True. If an error occurs, the transaction is
+        rolled back (if Commit is True) and the error is raised.
+        Returns the number of rows inserted and the ranges [first, last] of the
+        AUTO_INCREMENT IDs generated for them (see AddIDRange). The range of a
+        chunk starts at the ID the server reports for its first row and is only
+        returned if the server gives the rows consecutive IDs (see
+        ConsecutiveIDs) and every row of the chunk was inserted. If rows are
+        skipped (Ignore), the server does not report which IDs the other rows
+        were given. Rows without a range can be found by their unique key.
+        If Report is a dictionary, the number of rows sent and inserted, the
+        number of chunks and the time taken are added to Report[TableName]
+        (see PrintInsertReport).
+    """
+    import time
+    import mariadb
+
+    InsertString = 'INSERT {}INTO {} ({}) VALUES ({})'.format('IGNORE ' if Ignore else '',TableName,
+                                                            ', '.join(DataColumns),', '.join(['?']*len(DataColumns)))
+    InsertCount = 0
+    ChunkCount = 0
+    IDRanges = []
+    InsertStart = time.perf_counter()
+    cur = Connection.cursor()
+    try:
+        if len(DataRows) > 0:
+            if Variables is None: Variables = ServerVariables(Connection)
+            RangeIDs = ConsecutiveIDs(Variables)
+            if ChunkSize is None:
+                ChunkSize = ChunkRows(DataRows,Variables['max_allowed_packet'])
+            for Start in range(0,len(DataRows),ChunkSize):
+                Chunk = DataRows[Start:Start+ChunkSize]
+                cur.executemany(InsertString,Chunk)
+                ChunkCount += 1
+                RowCount = cur.rowcount if cur.rowcount >= 0 else len(Chunk)
+                InsertCount += RowCount
+                # The ID generated for the first row of the chunk, if every row
+                # was inserted.
+                if RangeIDs and cur.rowcount == len(Chunk) and cur.lastrowid:
+                    AddIDRange(IDRanges,cur.lastrowid,len(Chunk))
+        if Commit:
+            Connection.commit()
+    except mariadb.Error:
+        if Commit:
+            Connection.rollback()
+        raise
+    finally:
+        cur.close()
+
+    if Report is not None:
+        TableReport = Report.setdefault(TableName,{'Rows': 0, 'Inserted': 0, 'Updated': 0, 'Chunks': 0, 'Time': 0.})
+        TableReport['Rows'] += len(DataRows)
+        TableReport['Inserted'] += InsertCount
+        TableReport['Chunks'] += ChunkCount
+        TableReport['Time'] += time.perf_counter() - InsertStart
+    return InsertCount, IDRanges
+
+def UpdateRows(Connection, TableName, DataColumns, DataRows, KeyColumns, ChunkSize=None, Commit=True, Report=None,
+               Variables=None):
+
+    """
+        Updates the rows of Table TableName that have the values of KeyColumns
+        (a unique key) in DataRows, a list of rows with a value for each column
+        in DataColumns. The other columns are set with a parameterized UPDATE
+        that is executed ChunkSize rows at a time (see InsertRows for the
+        server variables, the transaction and errors). Returns the number of rows whose values
+        changed. If Report is a dictionary, the number of rows sent and
+        updated, the number of chunks and the time taken are added to
+        Report[TableName] (see PrintInsertReport).
+    """
+    import time
+    import mariadb
+
+    SetColumns = [Column for Column in DataColumns if Column not in KeyColumns]
+    UpdateString = 'UPDATE {} SET {} WHERE {}'.format(TableName,', '.join([Column + ' = ?' for Column in SetColumns]),
+                                                      ' AND '.join([Column + ' = ?' for Column in KeyColumns]))
+    # The values of each row in the order of the parameters.
+    ColumnIndex = [DataColumns.index(Column) for Column in SetColumns + KeyColumns]
+    DataRows = [[Row[i] for i in ColumnIndex] for Row in DataRows]
+    UpdateCount = 0
+    ChunkCount = 0
+    UpdateStart = time.perf_counter()
+    cur = Connection.cursor()
+    try:
+        if len(DataRows) > 0:
+            if ChunkSize is None:
+                if Variables is None: Variables = ServerVariables(Connection)
+                ChunkSize = ChunkRows(DataRows,Variables['max_allowed_packet'])
+            for Start in range(0,len(DataRows),ChunkSize):
+                cur.executemany(UpdateString,DataRows[Start:Start+ChunkSize])
+                ChunkCount += 1
+                UpdateCount += max(cur.rowcount,0)
+        if Commit:
+            Connection.commit()
+    except mariadb.Error:
+        if Commit:
+            Connection.rollback()
+        raise
+    finally:
+        cur.close()
+
+    if Report is not None:
+        TableReport = Report.setdefault(TableName,{'Rows': 0, 'Inserted': 0, 'Updated': 0, 'Chunks': 0, 'Time': 0.})
+        TableReport['Rows'] += len(DataRows)
+        TableReport['Updated'] += UpdateCount
+        TableReport['Chunks'] += ChunkCount
+        TableReport['Time'] += time.perf_counter() - UpdateStart
+    return UpdateCount
+
+def ColumnRows(ColumnData, DataColumns):
+
+    """
+        Returns the rows of columnar data (see BulkInsert) with the values of
+        DataColumns as Python numbers and strings. NaN is returned as None.
+    """
+    import math
+
+    Columns = []
+    for Column in DataColumns:
+        Values = ColumnData[Column]
+        # NumPy and pandas values are converted to Python numbers and strings.
+        Values = Values.tolist() if hasattr(Values,'tolist') else list(Values)
+        Columns.append([None if isinstance(Value,float) and math.isnan(Value) else Value for Value in Values])
+    return list(zip(*Columns))
+
+def BulkInsert(Connection, TableName, ColumnData, DataColumns=None, Ignore=False, ChunkSize=None, Commit=True,
+               Report=None, Variables=None):
+
+    """
+        Inserts columnar data into Table TableName (see InsertRows).
+        ColumnData maps each column to its values: a dictionary of lists or
+        NumPy arrays, a pandas dataframe or a NumPy structured array. Only the
+        columns in DataColumns are inserted (default all the columns of a
+        dictionary or dataframe). NaN is inserted as NULL.
+        Returns the number of rows inserted and the ranges of the IDs generated.
+    """
+    if DataColumns is None:
+        DataColumns = list(ColumnData)
+    return InsertRows(Connection,TableName,DataColumns,ColumnRows(ColumnData,DataColumns),Ignore,ChunkSize,Commit,
+                      Report,Variables)
+
+def BulkUpdate(Connection, TableName, ColumnData, KeyColumns, DataColumns=None, ChunkSize=None, Commit=True,
+               Report=None, Variables=None):
+
+    """
+        Updates the rows of Table TableName with the values of columnar data
+        (see BulkInsert), matching them by KeyColumns (see UpdateRows).
+        Returns the number of rows whose values changed.
+    """
+    if DataColumns is None:
+        DataColumns = list(ColumnData)
+    return UpdateRows(Connection,TableName,DataColumns,ColumnRows(ColumnData,DataColumns),KeyColumns,ChunkSize,
+                      Commit,Report,Variables)
+
+def PrintInsertReport(Report):
+
+    """
+        Prints the rows sent, inserted and updated for each table in Report
+        (see InsertRows and UpdateRows), the number of chunks, the time spent
+        writing and the rate in rows per second.
+    """
+    ReportString =  '+{:-<74}+\n'.format('')
+    ReportString += '|{:^74}|\n'.format('INSERT SUMMARY')
+    ReportString += '+{:-<74}+\n'.format('')
+    ReportString += '|{:<17}|{:^9}|{:^9}|{:^9}|{:^7}|{:^9}|{:^8}|\n'.format('Table','Rows','Inserted','Updated',
+                                                                         'Chunks','Time (s)','Rows/s')
+    ReportString += '+{:-<17}+{:-<9}+{:-<9}+{:-<9}+{:-<7}+{:-<9}+{:-<8}+\n'.format('','','','','','','')
+    for TableName, TableReport in Report.items():
+        InsertRate = TableReport['Rows']/TableReport['Time'] if TableReport['Time'] > 0 else 0.
+        ReportString += '|{:<17}|{:^9}|{:^9}|{:^9}|{:^7}|{:^9.2f}|{:^8.0f}|\n'.format(
+            TableName,TableReport['Rows'],TableReport['Inserted'],TableReport['Updated'],TableReport['Chunks'],
+            TableReport['Time'],InsertRate)
+    ReportString += '+{:-<17}+{:-<9}+{:-<9}+{:-<9}+{:-<7}+{:-<9}+{:-<8}+\n'.format('','','','','','','')
+    print(ReportString)
@@ -1,3 +1,58 @@
+# Directory of the local Parquet cache of the cleaned survey data. One file is
+# written for each year loaded by ExtractData.
+CacheDir = 'brfsscache'
+
+# Table brfsscube holds the number of respondents for each combination of
+# CubeKeys together with the number of positive cases for each outcome in
+# CubeOutcomes ([column, code of a positive answer]).
+CubeKeys = ['YEAR','SEX','AGEG5YR','BMI5CAT','SMOKER','PACAT','RFDRHV']
+CubeOutcomes = [['CVDINFR',1],['CVDCRHD',1],['CVDSTRK',1],['CHCCOPD',1],['DIABETE',1],['RFHYPE',2],['RFCHOL',2],
+                ['ASTHMS',1]]
+CubeTotals = ['Respondents'] + [Outcome for Outcome, Code in CubeOutcomes]
+
+def BrfssTableQuery(TableName, Years=None):
+
+    """
+        Returns the query that creates a table for the BRFSS survey data with the
+        name TableName. The survey fields are the integer codes from the data
+        files and are stored as TINYINT. Fields that are checked when the data is
+        cleaned cannot be NULL; RACE and INCOMG are NULL when they are missing.
+        LLCPWT is the survey's final weight for the respondent.
+        The composite indexes follow the way the health data models select and 
+        group the data: by sex and BMI category, then physical activity, smoking
+        and age group. If Years is given, the table is partitioned by YEAR with
+        one partition (p{Year}) for each year so a query for one year only reads
+        that partition.
+    """
+    TableString = """CREATE TABLE IF NOT EXISTS {}(
+            PrtcpntID   INT UNSIGNED NOT NULL AUTO_INCREMENT, 
+            STATE       TINYINT UNSIGNED NOT NULL,
+            CVDINFR     TINYINT UNSIGNED NOT NULL,
+            CVDCRHD     TINYINT UNSIGNED NOT NULL,
+            CVDSTRK     TINYINT UNSIGNED NOT NULL,
+            CHCCOPD     TINYINT UNSIGNED NOT NULL,
+            DIABETE     TINYINT UNSIGNED NOT NULL,
+            SEX         TINYINT UNSIGNED NOT NULL,
+            RFHYPE      TINYINT UNSIGNED NOT NULL,
+            RFCHOL      TINYINT UNSIGNED NOT NULL,
+            ASTHMS      TINYINT UNSIGNED NOT NULL,
+            RACE        TINYINT UNSIGNED,
+            AGEG5YR     TINYINT UNSIGNED NOT NULL,
+            BMI5CAT     TINYINT UNSIGNED NOT NULL,
+            INCOMG      TINYINT UNSIGNED,
+            SMOKER      TINYINT UNSIGNED NOT NULL,
+            RFDRHV      TINYINT UNSIGNED NOT NULL,
+            PACAT       TINYINT UNSIGNED NOT NULL,
+            LLCPWT      DOUBLE,
+            YEAR        SMALLINT UNSIGNED NOT NULL,
+            PRIMARY KEY (PrtcpntID, YEAR),
+            INDEX idx_risk (SEX, BMI5CAT, PACAT, SMOKER, AGEG5YR),
+            INDEX idx_factor (SEX, AGEG5YR, BMI5CAT, SMOKER, PACAT, RFDRHV))""".format(TableName)
+    if Years is not None:
+        PartitionList = ['PARTITION p{0} VALUES IN ({0})'.format(Year) for Year in Years]
+        TableString += '\n            PARTITION BY LIST (YEAR) ({})'.format(', '.join(PartitionList))
+    return TableString + ';'
+
 def CreateDatabase(DataUser):
 
     """
@@ -9,9 +64,9 @@ def CreateDatabase(DataUser):
     """
     import mariadb
 
-    # Open cursor for data queries using the Connection in DataUser
-    DataUser.NewConnect()
-    cur = DataUser.Connection.cursor()
+    # Open cursor for data queries using a new connection from DataUser
+    CreateConnection = DataUser.OpenConnection()
+    cur = CreateConnection.cursor()
 
     # Map of relational database A
     HDCompString =  '\t+{:-<22}+\n'.format('')
@@ -32,28 +87,11 @@ def CreateDatabase(DataUser):
     except mariadb.Error as e1:
         print('Error creating Database healthdata: {error}'.format(error=e1))
 
-    # Create table brfssdata
+    # Create table brfssdata. The survey fields are stored as the integer codes
+    # used in the data files (see BrfssTableQuery) and the table is partitioned
+    # by YEAR with one partition for each year of survey data.
     DataBRFStringA = 'DROP TABLE IF EXISTS brfssdata;'
-    DataBRFStringB = """CREATE TABLE IF NOT EXISTS brfssdata(
-            PrtcpntID   INT NOT NULL PRIMARY KEY AUTO_INCREMENT, 
-            STATE       CHAR(2),
-            CVDINFR     CHAR,
-            CVDCRHD     CHAR,
-            CVDSTRK     CHAR,
-            CHCCOPD     CHAR,
-            DIABETE     CHAR,
-            SEX         CHAR,
-            RFHYPE      CHAR,
-            RFCHOL      CHAR,
-            ASTHMS      CHAR,
-            RACE        CHAR,
-            AGEG5YR     CHAR(2),
-            BMI5CAT     CHAR,
-            INCOMG      CHAR,
-            SMOKER      CHAR,
-            RFDRHV      CHAR,
-            PACAT       CHAR,
-            YEAR        CHAR(4));"""
+    DataBRFStringB = BrfssTableQuery('brfssdata',['2013','2014','2015','2016','2017','2018','2019'])
     try:
         cur.execute(DataBRFStringA)
         cur.execute(DataBRFStringB)
@@ -61,37 +99,1045 @@ def CreateDatabase(DataUser):
     except mariadb.Error as e2:
         print('Error creating Table brfssdata: {error}'.format(error=e2))
 
+    # Create table ingestcheckpoint. ExtractData records how far each data file
+    # has been loaded so an interrupted load can be resumed.
+    try:
+        cur.execute('DROP TABLE IF EXISTS ingestcheckpoint;')
+        CreateCheckpointTable(cur)
+    # If an error occurs executing the queries, then print the error and location.
+    except mariadb.Error as e3:
+        print('Error creating Table ingestcheckpoint: {error}'.format(error=e3))
+
+    # Create table brfsscube. The summary counts are updated as each block of
+    # records is inserted into brfssdata (see CreateCubeTable).
+    try:
+        cur.execute('DROP TABLE IF EXISTS brfsscube;')
+        CreateCubeTable(cur)
+    # If an error occurs executing the queries, then print the error and location.
+    except mariadb.Error as e4:
+        print('Error creating Table brfsscube: {error}'.format(error=e4))
+
     cur.close()
-    DataUser.CloseConnect()
+    DataUser.CloseConnection(CreateConnection)
 
-def UpdateDatabaseQuery(DataTable, DataColumns, DataTableName):
+def MigrateDatabase(DataUser):
 
-    import math
+    """
+        Converts Table brfssdata from the original schema, where every survey
+        field is stored as characters, to the integer schema of BrfssTableQuery.
+        The data is copied one year at a time into a new table which then
+        replaces brfssdata. Blank fields become NULL; the survey weight (LLCPWT)
+        is not in the original schema and is NULL until the data is loaded again.
+        Table brfsscube is built from the converted data (see PrepareCube). The
+        size of the table before and after the conversion is printed. If
+        brfssdata already uses the integer schema, only the LLCPWT column is
+        added if it is missing.
+    """
+    import mariadb
 
-    DataString = ''
-    for DataRow in DataTable:
-        RowString = '('
-        for DataElement in DataRow:
-            if isinstance(DataElement,(float, int)):
-                if math.isnan(DataElement):
-                    RowString += "' ', "
-                else:
-                    RowString += str(DataElement) + ", "
-            elif isinstance(DataElement,str):
-                RowString += "'{}', ".format(DataElement)
-        DataString += RowString[:-2] + '),\n'
+    HealthDataColumns = ['PrtcpntID','STATE','CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','SEX','RFHYPE',
+                         'RFCHOL','ASTHMS','RACE','AGEG5YR','BMI5CAT','INCOMG','SMOKER','RFDRHV','PACAT','YEAR']
+    SizeQuery = """SELECT DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME = ?"""
+
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE healthdata;')
 
-    DataColumnsString = str(tuple(DataColumns)).replace("'","")
-    DatabaseString = 'INSERT INTO {} {} VALUES\n'.format(DataTableName,DataColumnsString)
-    DatabaseString += DataString[:-2] + ';'
-    return DatabaseString
+        # 1. Check the type of the survey fields
+        cur.execute("""SELECT DATA_TYPE FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME = 'brfssdata' AND COLUMN_NAME = 'SEX'""")
+        if cur.fetchone()[0].lower() == 'tinyint':
+            print('Table brfssdata already uses the integer schema.')
+            # Tables converted before the survey weight was added have no LLCPWT.
+            cur.execute("""SELECT COUNT(*) FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME = 'brfssdata' AND COLUMN_NAME = 'LLCPWT'""")
+            if cur.fetchone()[0] == 0:
+                print('Adding column LLCPWT to Table brfssdata.')
+                cur.execute('ALTER TABLE brfssdata ADD COLUMN LLCPWT DOUBLE AFTER PACAT;')
+        else:
+            cur.execute(SizeQuery,('brfssdata',))
+            OldSize = cur.fetchone()[0]
 
-def ExtractData(DataUser):
+            # 2. Create the new table with a partition for each year in the data
+            cur.execute('SELECT DISTINCT YEAR FROM brfssdata ORDER BY YEAR')
+            Years = [Row[0].strip() for Row in cur.fetchall()]
+            cur.execute('DROP TABLE IF EXISTS brfssdata_new;')
+            cur.execute(BrfssTableQuery('brfssdata_new',Years))
 
-    import pandas as pd
-    import sys
+            # 3. Copy the data one year at a time. Blank characters become NULL.
+            SelectList = ["CAST(NULLIF(TRIM({0}),'') AS UNSIGNED)".format(Column) for Column in HealthDataColumns[1:]]
+            CopyString = """INSERT INTO brfssdata_new ({}) 
+                    SELECT PrtcpntID, {} FROM brfssdata WHERE YEAR = ?""".format(', '.join(HealthDataColumns),
+                                                                                 ', '.join(SelectList))
+            for Year in Years:
+                print('Converting {}'.format(Year))
+                cur.execute(CopyString,(Year,))
+                Connection.commit()
+
+            # 4. Swap the tables in one step and remove the original table
+            cur.execute('RENAME TABLE brfssdata TO brfssdata_old, brfssdata_new TO brfssdata;')
+            cur.execute('DROP TABLE brfssdata_old;')
+            cur.execute('ANALYZE TABLE brfssdata;')
+            cur.fetchall()
+            cur.execute(SizeQuery,('brfssdata',))
+            NewSize = cur.fetchone()[0]
+            print('Table brfssdata converted: {:.1f} MB before, {:.1f} MB after.'.format(OldSize/2**20,NewSize/2**20))
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e1:
+        print('Error converting Table brfssdata: {error}'.format(error=e1))
+        return
+
+    # 5. Create the summary cube for the converted data
+    PrepareCube(DataUser)
+
+def RecordLength(FirstLine):
+
+    """
+        Returns the length of one record, including the end of line characters,
+        and the end of line characters (\n or \r\n) from the first line of a
+        data file. A first line without an end of line is the only record of
+        the file.
+    """
+    EndOfLine = b'\r\n' if FirstLine.endswith(b'\r\n') else b'\n'
+    if not FirstLine.endswith(b'\n'):
+        return len(FirstLine) + len(EndOfLine), EndOfLine
+    return len(FirstLine), EndOfLine
+
+def FinalRecord(Tail, RecLen, EndOfLine, DataFile, RecIndex):
+
+    """
+        Returns the characters after the last complete record of DataFile (Tail)
+        as a complete record. A file may end without the end of line characters,
+        so a Tail one end of line short of a record is the last record (record
+        RecIndex, starting at 0). Returns None if Tail is empty. Raises a
+        ValueError if Tail is any other length.
+    """
+    if len(Tail) == 0:
+        return None
+    if len(Tail) != RecLen - len(EndOfLine):
+        raise ValueError('{} ends with a partial record of {} characters (record {}).'.format(DataFile,len(Tail),
+                                                                                            RecIndex + 1))
+    return bytes(Tail) + EndOfLine
+
+def CheckRecords(DataMatrix, Start, DataFile):
+
+    """
+        Checks that every record in DataMatrix (the records of DataFile from
+        record Start, starting at 0) ends with the end of line. A line that is
+        shorter or longer than the first line shifts every record after it, so
+        a ValueError is raised with the number of the first record that does
+        not end in place.
+    """
+    import numpy as np
+
+    Misaligned = np.flatnonzero(DataMatrix[:,-1] != ord('\n'))
+    if len(Misaligned) > 0:
+        raise ValueError('Record {} of {} is not {} characters long (including the end of line).'.format(
+                         Start + Misaligned[0] + 1,DataFile,DataMatrix.shape[1]))
+
+def RecordBlock(DataBytes, Start, RecLen, EndOfLine, DataFile):
+
+    """
+        Returns the bytes of a block of records of DataFile, starting at record
+        Start, as a matrix with one row per record and one column per character
+        (including the end of line characters). DataBytes is the bytes of the
+        block, either a slice of the memory-mapped file (see MapDataFile), which
+        is viewed without a copy, or the bytes read from a zip archive. The
+        block ends with a partial record only at the end of a file that does
+        not end with an end of line (see FinalRecord). The records are checked
+        (see CheckRecords).
+    """
+    import numpy as np
+
+    if not isinstance(DataBytes,np.ndarray):
+        DataBytes = np.frombuffer(DataBytes,dtype=np.uint8)
+    NumRec, TailLen = divmod(len(DataBytes),RecLen)
+    DataMatrix = DataBytes[:NumRec*RecLen].reshape(NumRec,RecLen)
+    if TailLen > 0:
+        LastRecord = FinalRecord(DataBytes[NumRec*RecLen:],RecLen,EndOfLine,DataFile,Start + NumRec)
+        DataMatrix = np.concatenate([DataMatrix,np.frombuffer(LastRecord,dtype=np.uint8).reshape(1,RecLen)])
+    CheckRecords(DataMatrix,Start,DataFile)
+    return DataMatrix
+
+def MapDataFile(DataFile):
+
+    """
+        Memory-maps the survey records in DataFile. Each record is a fixed-width
+        line of ASCII characters, so a block of records can be viewed as a
+        matrix of bytes (see RecordBlock). The length of a record is taken from
+        the first line (see RecordLength). Returns the read-only bytes of the
+        file, the length of a record and the end of line characters (None for
+        an empty file).
+    """
     import os.path
+    import numpy as np
+
+    # Length of one record including the end of line characters.
+    with open(DataFile,'rb') as Dfile_in:
+        FirstLine = Dfile_in.readline()
+    if len(FirstLine) == 0:
+        return np.zeros(0,dtype=np.uint8), None, None
+    RecLen, EndOfLine = RecordLength(FirstLine)
+    return np.memmap(DataFile,dtype=np.uint8,mode='r',shape=(os.path.getsize(DataFile),)), RecLen, EndOfLine
+
+def ExtractColumns(DataMatrix, VarLoc):
+
+    """
+        Extracts the data fields listed in VarLoc from every record in DataMatrix
+        in one vectorized operation. VarLoc is a list of the first and last column
+        of each field (starting at 1). Each field is converted from its ASCII 
+        digits to an integer code. Fields that are blank or contain any character
+        other than a digit are given the code -1. The fields used are one or two
+        characters wide so the codes are returned as an int8 array with one row
+        per record and one column per field.
+    """
+    import numpy as np
+
+    # Columns of the byte matrix to be gathered, the column in the gathered
+    # matrix where each field starts and the place value of each digit.
+    ByteCols = []
+    FieldStart = []
+    PlaceValue = []
+    for Loc in VarLoc:
+        FieldStart.append(len(ByteCols))
+        ByteCols.extend(range(Loc[0]-1,Loc[1]))
+        PlaceValue.extend(10**(Loc[1]-Col) for Col in range(Loc[0],Loc[1]+1))
+
+    # Gather the characters of all the fields and convert them to digits. The
+    # subtraction wraps around for characters before '0' (such as ' ') so any
+    # value above 9 is not a digit.
+    Digits = DataMatrix[:,ByteCols] - np.uint8(ord('0'))
+    IsDigit = Digits < 10
+    Values = np.add.reduceat(Digits.astype(np.int16)*np.array(PlaceValue,dtype=np.int16),FieldStart,axis=1)
+    Valid = np.logical_and.reduceat(IsDigit,FieldStart,axis=1)
+    return np.where(Valid,Values,-1).astype(np.int8)
+
+def ExtractWeights(DataMatrix, WeightLoc):
+
+    """
+        Extracts the survey weight from every record in DataMatrix. WeightLoc is
+        the first and last column of the field. The weight is written as a
+        decimal number so the characters of the field are converted as text.
+        Blank or unreadable weights are returned as NaN. Returns a float64 array.
+    """
+    import numpy as np
+    import pandas as pd
+
+    Width = WeightLoc[1] - WeightLoc[0] + 1
+    WeightText = np.ascontiguousarray(DataMatrix[:,WeightLoc[0]-1:WeightLoc[1]]).view('S{}'.format(Width)).ravel()
+    return pd.to_numeric(np.char.strip(WeightText).astype(str),errors='coerce').astype(np.float64)
+
+def ZipDataMember(ZipArchive):
+
+    """
+        Returns the information for the survey data file (the first member with
+        a name ending in .ASC) in an open zip archive of the data file.
+    """
+    for Member in ZipArchive.infolist():
+        if Member.filename.strip().upper().endswith('.ASC'):
+            return Member
+    raise ValueError('No .ASC data file found in {}.'.format(ZipArchive.filename))
+
+def DataFileSize(DataFile):
+
+    """
+        Returns the size in bytes of the survey records in DataFile. For a zip
+        archive this is the size of the data file once decompressed, so the
+        byte offsets in Table ingestcheckpoint mean the same for both.
+    """
+    import os
+    import zipfile
+
+    if DataFile.lower().endswith('.zip'):
+        with zipfile.ZipFile(DataFile) as ZipArchive:
+            return ZipDataMember(ZipArchive).file_size
+    return os.path.getsize(DataFile)
+
+def DataFileRecords(DataFile):
+
+    """
+        Returns the number of records in DataFile (an .ASC file or a zip archive
+        of it), from the length of its first line (see RecordLength).
+    """
+    import zipfile
+
+    if DataFile.lower().endswith('.zip'):
+        with zipfile.ZipFile(DataFile) as ZipArchive:
+            with ZipArchive.open(ZipDataMember(ZipArchive)) as DataStream:
+                FirstLine = DataStream.readline()
+    else:
+        with open(DataFile,'rb') as Dfile_in:
+            FirstLine = Dfile_in.readline()
+    if len(FirstLine) == 0:
+        return 0
+    RecLen, EndOfLine = RecordLength(FirstLine)
+    # The last record may not end with an end of line.
+    return -(-DataFileSize(DataFile) // RecLen)
+
+def MapRecordBlocks(DataFile, BlockSize, StartOffset=0):
+
+    """
+        Generator that yields the records of DataFile BlockSize at a time as
+        slices of the memory-mapped file (see MapDataFile), starting from the
+        record at StartOffset. Each block is the next BlockSize*(record length)
+        bytes of the file, the same as ZipRecordBlocks, so the blocks and their
+        offsets are the same for an .ASC file and a zip archive of it. Yields
+        the index of the first record in the block and the (records x record
+        length) matrix of bytes (see RecordBlock). Raises a ValueError if a line
+        is not one record long (see CheckRecords).
+    """
+    DataBytes, RecLen, EndOfLine = MapDataFile(DataFile)
+    if RecLen is None:
+        return
+
+    # StartOffset is the end of a block yielded earlier, so it is always at the
+    # start of a record.
+    for Start in range(StartOffset // RecLen,-(-len(DataBytes) // RecLen),BlockSize):
+        yield Start, RecordBlock(DataBytes[Start*RecLen:(Start + BlockSize)*RecLen],Start,RecLen,EndOfLine,DataFile)
+
+def ZipRecordBlocks(DataFile, BlockSize, StartOffset=0, QueueSize=4):
+
+    """
+        Generator that streams the records of the data file out of the zip
+        archive DataFile without extracting it to disk. A reader thread 
+        decompresses BlockSize records at a time into a queue holding at most
+        QueueSize blocks, so the next block is decompressed while the current
+        one is parsed (zlib releases the GIL). The records before StartOffset
+        are decompressed and skipped. Yields the index of the first record in 
+        the block and the (records x record length) matrix of bytes (see
+        RecordBlock), the same blocks as MapRecordBlocks.
+    """
+    import queue
+    import zipfile
+    import threading
+
+    # Length of one record including the end of line characters.
+    with zipfile.ZipFile(DataFile) as ZipArchive:
+        DataMember = ZipDataMember(ZipArchive)
+        with ZipArchive.open(DataMember) as DataStream:
+            FirstLine = DataStream.readline()
+    if len(FirstLine) == 0:
+        return
+    RecLen, EndOfLine = RecordLength(FirstLine)
+    StartRec = StartOffset // RecLen
+
+    BlockQueue = queue.Queue(maxsize=QueueSize)
+    StopReading = threading.Event()
+
+    def PutBlock(DataBlock):
+        # Wait for space on the queue unless the generator has been closed.
+        while not StopReading.is_set():
+            try:
+                BlockQueue.put(DataBlock,timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def ReadBlocks():
+        try:
+            with zipfile.ZipFile(DataFile) as ZipArchive:
+                with ZipArchive.open(DataMember) as DataStream:
+                    SkipBytes = StartRec*RecLen
+                    while SkipBytes > 0 and not StopReading.is_set():
+                        SkipBlock = DataStream.read(min(SkipBytes,BlockSize*RecLen))
+                        if len(SkipBlock) == 0: break
+                        SkipBytes -= len(SkipBlock)
+                    while not StopReading.is_set():
+                        DataBlock = DataStream.read(BlockSize*RecLen)
+                        if len(DataBlock) == 0: break
+                        PutBlock(DataBlock)
+        except Exception as e1:
+            PutBlock(e1)
+        finally:
+            PutBlock(None)
+
+    Reader = threading.Thread(target=ReadBlocks,daemon=True)
+    Reader.start()
+    try:
+        Start = StartRec
+        while True:
+            DataBlock = BlockQueue.get()
+            if DataBlock is None: break
+            if isinstance(DataBlock,Exception): raise DataBlock
+            DataMatrix = RecordBlock(DataBlock,Start,RecLen,EndOfLine,DataFile)
+            yield Start, DataMatrix
+            Start += len(DataMatrix)
+    finally:
+        StopReading.set()
+        Reader.join()
+
+def ReadDataBlocks(DataFile, VarList, VarLoc, BlockSize, StartOffset=0, WeightLoc=None):
+
+    """
+        Generator that reads the survey records in DataFile in blocks. The file
+        is read once from StartOffset (in bytes, 0 for the start of the file) to
+        the end. An .ASC file is memory-mapped (see MapRecordBlocks) and a zip
+        archive of it is decompressed as it is read (see ZipRecordBlocks). For
+        each block of BlockSize records, the fields listed in VarList are
+        extracted in one vectorized operation (see ExtractColumns). It yields
+        the byte offset of the end of the block and the integer codes as a data
+        frame. The last block holds the remaining records and will typically be
+        smaller than BlockSize. The index of the data frame is the line number
+        of the record in the file. If WeightLoc is given, the survey weight is
+        added as column LLCPWT (see ExtractWeights).
+    """
+    import pandas as pd
+
+    if DataFile.lower().endswith('.zip'):
+        RecordBlocks = ZipRecordBlocks(DataFile,BlockSize,StartOffset)
+    else:
+        RecordBlocks = MapRecordBlocks(DataFile,BlockSize,StartOffset)
+
+    for Start, DataMatrix in RecordBlocks:
+        Stop = Start + len(DataMatrix)
+        DataCodes = ExtractColumns(DataMatrix,VarLoc)
+        HealthDataframe = pd.DataFrame(DataCodes,columns=VarList,index=pd.RangeIndex(Start+1,Stop+1))
+        if WeightLoc is not None:
+            HealthDataframe['LLCPWT'] = ExtractWeights(DataMatrix,WeightLoc)
+        yield Stop*DataMatrix.shape[1], HealthDataframe
+
+def CleanData(HealthDataframe, HealthList, FactorList, Report=None):
+
+    """
+        Removes the surveys in a block of data that cannot be used by the health
+        data models: respondents outside the 50 states, respondents without a
+        recorded sex or age group and respondents with missing answers for the
+        medical conditions (HealthList) or lifestyle factors (FactorList).
+        Each condition is a range of valid codes, so all the conditions are
+        checked together and combined into one mask. Returns the cleaned data
+        frame with the fields stored as int8 codes. Other columns, such as the
+        survey weight, are kept as they are.
+        If Report is a dictionary, the number of surveys checked ('Records') and
+        the number removed at each step are added to it. A survey is counted
+        at the first step it fails, in the order the steps are listed below.
+    """
+    import numpy as np
+
+    # Clean data. The data fields are integer codes (see ExtractColumns) where
+    # -1 marks a blank or otherwise missing field. CleanRange holds the lowest
+    # and highest valid code for each field checked.
+    # 1. Remove US territories and surveys without a state code
+    CleanRange = [['STATE',1,56]]
+
+    # 2. Keep only surveys which identify respondent as Male or Female and remove
+    #    any others.
+    #  1 - Male
+    #  2 - Female
+    CleanRange.append(['SEX',1,2])
+
+    # 3. Keep only surveys where age group is identified and remove any where the
+    #    age group is not included.
+    #  1 - 18 - 24
+    #  2 - 25 - 30
+    #  13 - 80 and up
+    CleanRange.append(['AGEG5YR',1,13])
+
+    # 4. Keep only surveys where response include one of the first four numbers (1,2,3,4).
+    #    Remove surveys where the data is missing for any reason. Values such as 7, 8, 9, 
+    #    and ' ' are to be removed.  
+    # 'CVDINFR', 'CVDCRHD', 'CVDSTRK', 'CHCCOPD'
+    #   '1' : Yes
+    #   '2' : No
+    # 'DIABETE'
+    #   '1' : Yes
+    #   '2' : Yes only during pregnancy
+    #   '3' : No
+    #   '4' : No borderline
+    # 'RFHYPE', 'RFCHOL'
+    #   '1' : No
+    #   '2' : Yes (Cholesterol or BP checked and medical provider reported it was high) 
+    # 'ASTHMS'
+    #   '1' : Current
+    #   '2' : Former
+    #   '3' : Never
+    for Var in HealthList:
+        CleanRange.append([Var,1,4])
+
+    # 5. Keep only surveys where response include one of the first four numbers (1,2,3,4).
+    #    Remove surveys where the data is missing for any reason. Values such as 7, 8, 9, 
+    #    and ' ' are to be removed.  
+    #'BMI5CAT'
+    #   '1' : Underweight
+    #   '2' : Normal weight
+    #   '3' : Overweight
+    #   '4' : Obese
+    #'SMOKER'
+    #   '1' : Current daily smoker
+    #   '2' : Current occasional smoker
+    #   '3' : Former Smoker
+    #   '4' : Never Smoked
+    #'RFDRHV' 
+    #   '1' : No
+    #   '2' : Yes
+    #'PACAT'
+    #   '1' : Highly active
+    #   '2' : active
+    #   '3' : Insufficiently active
+    #   '4' : Inactive
+    for Var in FactorList:
+        CleanRange.append([Var,1,4])
+
+    # Check every field against its range in one pass. ValidCodes has one row per
+    # survey and one column per step. A survey is kept if it passes every step.
+    CleanVars = [Step[0] for Step in CleanRange]
+    CleanLow = np.array([Step[1] for Step in CleanRange],dtype=np.int8)
+    CleanHigh = np.array([Step[2] for Step in CleanRange],dtype=np.int8)
+    DataCodes = HealthDataframe[CleanVars].to_numpy(dtype=np.int8)
+    ValidCodes = (DataCodes >= CleanLow) & (DataCodes <= CleanHigh)
+    KeepMask = ValidCodes.all(axis=1)
+
+    # Optional report of the surveys removed at each step.
+    if Report is not None:
+        Remaining = np.logical_and.accumulate(ValidCodes,axis=1).sum(axis=0)
+        Dropped = np.diff(np.concatenate(([len(DataCodes)],Remaining)))*(-1)
+        Report['Records'] = Report.get('Records',0) + len(DataCodes)
+        for Var, Count in zip(CleanVars,Dropped.tolist()):
+            Report[Var] = Report.get(Var,0) + Count
+
+    CodeTypes = {Column: np.int8 for Column, DataType in HealthDataframe.dtypes.items() if DataType.kind in 'iu'}
+    return HealthDataframe.loc[KeepMask].astype(CodeTypes)
+
+def InsertData(DataUser, HealthDataList, HealthDataColumns, LoadMethod='executemany', BatchSize=None,
+               Checkpoint=None, CubeList=None, TableName='brfssdata', CubeTableName='brfsscube', Variables=None):
+
+    """
+        Inserts a block of cleaned survey records into Table TableName (brfssdata
+        or a staging table, see CreateStage) and returns the number of records
+        inserted, or None if the insert failed.
+        The block is inserted in one transaction. If Checkpoint is given as
+        [DataFile, YEAR, ByteOffset, RowsWritten], Table ingestcheckpoint is
+        updated in the same transaction so the checkpoint always matches the
+        records committed. If CubeList is given (see CubeRows), the counts are
+        added to Table CubeTableName in the same transaction. LoadMethod
+        selects how the records are sent to the server:
+            'executemany' - a parameterized INSERT executed for BatchSize
+                            records at a time (by default, sized to the
+                            server's packet size; see DatabaseTools.InsertRows).
+            'infile'      - the records are written to a temporary tab separated
+                            file which is loaded with LOAD DATA LOCAL INFILE.
+        Variables holds the server variables read by ExtractData (see
+        DatabaseTools.ServerVariables) so they are not read for every block.
+        If the insert fails, the transaction is rolled back so none of the
+        records, the checkpoint or the counts are kept. The connection is
+        always closed.
+    """
+    import os
+    import tempfile
     import mariadb
+    import DatabaseTools
+
+    # Strings for querying database. 
+    #   1. Select database with the data table
+    #   2. Insert the data into the table
+    HealthDataStringA = 'USE healthdata;'
+    DataColumnsString = ', '.join(HealthDataColumns)
+    TempFileName = None
+    Connection = None
+
+    try:
+        # Connect to database. The username and password are contained in DataUser and
+        # used to establish a connection. In other scripts, the connection closed 
+        # prematurely so open and close the connection only when executing a set of queries.
+        Connection = DataUser.OpenConnection(LocalInfile=(LoadMethod == 'infile'))
+        cur = Connection.cursor()
+        cur.execute(HealthDataStringA)
+        if LoadMethod == 'executemany':
+            # The transaction is committed below with the checkpoint and the counts.
+            DatabaseTools.InsertRows(Connection,TableName,HealthDataColumns,HealthDataList,ChunkSize=BatchSize,
+                                     Commit=False,Variables=Variables)
+        elif LoadMethod == 'infile':
+            # The temporary file is closed before it is loaded so that it can be
+            # opened again by the client library on every platform.
+            # Missing values (None) are written as \N which is loaded as NULL.
+            with tempfile.NamedTemporaryFile('w',suffix='.tsv',delete=False,newline='\n') as TempFile:
+                TempFileName = TempFile.name
+                for DataRow in HealthDataList:
+                    TempFile.write('\t'.join('\\N' if Data is None else str(Data) for Data in DataRow) + '\n')
+            HealthDataStringB = """LOAD DATA LOCAL INFILE '{}' INTO TABLE {}
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                    ({});""".format(TempFileName.replace('\\','/'),TableName,DataColumnsString)
+            cur.execute(HealthDataStringB)
+        else:
+            raise ValueError('Load method {} not recognized.'.format(LoadMethod))
+        if Checkpoint is not None:
+            SaveCheckpoint(cur,Checkpoint)
+        if CubeList is not None:
+            CubeColumns = CubeKeys + CubeTotals
+            CubeString = """INSERT INTO {} ({}) VALUES ({})
+                    ON DUPLICATE KEY UPDATE {};""".format(CubeTableName,', '.join(CubeColumns),
+                    ', '.join(['?']*len(CubeColumns)),
+                    ', '.join(['{0} = {0} + VALUES({0})'.format(Total) for Total in CubeTotals]))
+            cur.executemany(CubeString,CubeList)
+        Connection.commit()
+        cur.close()
+    except mariadb.Error as e2:
+        print('Error inserting Data into Table {table}: {error}'.format(table=TableName,error=e2))
+        # The records, the checkpoint and the counts of the block are discarded together.
+        try:
+            Connection.rollback()
+        except mariadb.Error as e3:
+            print('Error rolling back the insert into Table {table}: {error}'.format(table=TableName,error=e3))
+        return None
+    finally:
+        if Connection is not None: DataUser.CloseConnection(Connection)
+        if TempFileName is not None: os.remove(TempFileName)
+    return len(HealthDataList)
+
+def PrintLoadRate(LoadMethod, InsertCount, InsertTime, TableName='brfssdata'):
+
+    """
+        Prints the number of records inserted into Table TableName (brfssdata
+        or a staging table, see CreateStage), the time spent inserting them
+        and the rate in records per second.
+    """
+    InsertRate = InsertCount/InsertTime if InsertTime > 0 else 0.
+    print('Inserted {} records into {} in {:.1f} s ({:.0f} records/s) using {}.'.format(
+          InsertCount,TableName,InsertTime,InsertRate,LoadMethod))
+
+def ExtractBlocks(DataFile, VarList, VarLoc, DataYear, BlockSize, HealthList, FactorList, CacheFile=None,
+                  StartOffset=0, WeightLoc=None, Report=None):
+
+    """
+        Generator that reads, cleans and formats the survey records for one year.
+        For each block read from DataFile (see ReadDataBlocks), it yields the byte
+        offset of the end of the block, the list of cleaned records ready to be
+        inserted into Table brfssdata and the block's counts for Table brfsscube
+        (see CubeRows). Blocks where every record is removed during
+        cleaning are skipped. Only blocks after StartOffset are yielded. Report is
+        passed to CleanData to collect the number of records removed at each step.
+        WeightLoc is the location of the survey weight (see ReadDataBlocks).
+        If CacheFile is given, the cleaned records are also written to it as a
+        Parquet file (see ReadCache in HealthModelData). The file is written
+        under a temporary name and only renamed to CacheFile once the whole year
+        has been read, so an interrupted run never leaves a partial cache. In this
+        case the whole file is read (and cached) even if StartOffset is not 0.
+    """
+    import os
+    import numpy as np
+
+    CacheWriter = None
+    if CacheFile is not None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # Files starting with _ are skipped when the cache directory is read.
+        CacheTemp = os.path.join(os.path.dirname(CacheFile),'_' + os.path.basename(CacheFile))
+
+    try:
+        # Loop over each block in the file. The blocks are read one after another
+        # in a single pass through the file.
+        ReadOffset = StartOffset if CacheFile is None else 0
+        DataBlocks = ReadDataBlocks(DataFile,VarList,VarLoc,BlockSize,ReadOffset,WeightLoc)
+        for k, (EndOffset, HealthDataframe) in enumerate(DataBlocks):
+
+            print('{} Run {}'.format(DataYear,k+1))
+            HealthDataframeClean = CleanData(HealthDataframe,HealthList,FactorList,Report)
+
+            # Add YEAR column to dataframe so data can be filtered by year in future
+            HealthDataframeClean['YEAR'] = np.int16(DataYear)
+
+            # Write the cleaned codes to the local cache.
+            if CacheFile is not None:
+                CacheTable = pa.Table.from_pandas(HealthDataframeClean,preserve_index=False)
+                if CacheWriter is None:
+                    CacheWriter = pq.ParquetWriter(CacheTemp,CacheTable.schema)
+                CacheWriter.write_table(CacheTable)
+
+            # Transform dataframe to list to be added to database. The survey fields
+            # are stored as integer codes in Table brfssdata. Missing fields (-1) and
+            # missing weights (NaN) are stored as NULL.
+            HealthDataList = HealthDataframeClean.astype(object).where(HealthDataframeClean >= 0,None).values.tolist()
+
+            # If there are no new fields to be added, continue to the next block. The
+            # last block will typically have fewer records and may have them all
+            # removed during the data cleaning process.
+            if len(HealthDataList) == 0: continue
+
+            # Blocks up to StartOffset have already been inserted.
+            if EndOffset <= StartOffset: continue
+
+            yield EndOffset, HealthDataList, CubeRows(HealthDataframeClean)
+
+        # The year is complete: replace the previous cache for the year.
+        if CacheWriter is not None:
+            CacheWriter.close()
+            CacheWriter = None
+            os.replace(CacheTemp,CacheFile)
+    finally:
+        if CacheWriter is not None:
+            CacheWriter.close()
+            os.remove(CacheTemp)
+
+def ExtractWorker(BlockQueue, DataFile, VarList, VarLoc, DataYear, BlockSize, HealthList, FactorList,
+                  CacheFile=None, StartOffset=0, WeightLoc=None):
+
+    """
+        Worker process used by ExtractData to read and clean one year of survey
+        data. Each cleaned block is put on BlockQueue as (DataFile, DataYear, 
+        EndOffset, HealthDataList, CubeList). When the year is finished (or 
+        fails), (DataFile, DataYear, None, None, None) is put on the queue so the process 
+        writing to the database knows the worker is done.
+        Returns the cleaning report for the year (see CleanData).
+    """
+    Report = {}
+    try:
+        for EndOffset, HealthDataList, CubeList in ExtractBlocks(DataFile,VarList,VarLoc,DataYear,BlockSize,
+                                                                 HealthList,FactorList,CacheFile,StartOffset,
+                                                                 WeightLoc,Report):
+            BlockQueue.put((DataFile,DataYear,EndOffset,HealthDataList,CubeList))
+    finally:
+        BlockQueue.put((DataFile,DataYear,None,None,None))
+    return Report
+
+def SerialBlocks(YearTasks, Report=None, FailedFiles=None):
+
+    """
+        Generator used by ExtractData to read and clean each year in turn in
+        this process. It yields the blocks in the same form as the worker
+        processes put them on the queue (see ExtractWorker). If a year cannot
+        be read, the error is printed, its file is added to FailedFiles and
+        the next year is read, the same as when a worker process fails.
+    """
+    for YearTask in YearTasks:
+        YearReport = {}
+        try:
+            for EndOffset, HealthDataList, CubeList in ExtractBlocks(*YearTask,Report=YearReport):
+                yield YearTask[0], YearTask[3], EndOffset, HealthDataList, CubeList
+        except Exception as e3:
+            print('Error extracting data from {file}: {error}'.format(file=YearTask[0],error=e3))
+            if FailedFiles is not None: FailedFiles.add(YearTask[0])
+            continue
+        if Report is not None: Report[YearTask[3]] = YearReport
+
+def QueueBlocks(BlockQueue, NumTasks):
+
+    """
+        Generator used by ExtractData to take the blocks off BlockQueue until
+        NumTasks worker processes have reported that they are done.
+    """
+    TasksDone = 0
+    while TasksDone < NumTasks:
+        DataFile, DataYear, EndOffset, HealthDataList, CubeList = BlockQueue.get()
+        if HealthDataList is None:
+            TasksDone += 1
+            continue
+        yield DataFile, DataYear, EndOffset, HealthDataList, CubeList
+
+def CreateCheckpointTable(cur):
+
+    """
+        Creates Table ingestcheckpoint if it does not exist. The table has one
+        row for each data file loaded by ExtractData with the byte offset in the
+        file up to which the records have been committed to brfssdata and the
+        number of records written.
+    """
+    cur.execute("""CREATE TABLE IF NOT EXISTS ingestcheckpoint(
+            DataFile    VARCHAR(64) NOT NULL PRIMARY KEY,
+            YEAR        CHAR(4),
+            ByteOffset  BIGINT UNSIGNED NOT NULL,
+            RowsWritten BIGINT UNSIGNED NOT NULL,
+            Updated     TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP);""")
+
+def SaveCheckpoint(cur, Checkpoint):
+
+    """
+        Saves Checkpoint, [DataFile, YEAR, ByteOffset, RowsWritten], in Table
+        ingestcheckpoint. The change is committed with the caller's transaction.
+    """
+    cur.execute("""INSERT INTO ingestcheckpoint (DataFile, YEAR, ByteOffset, RowsWritten)
+            VALUES (?, ?, ?, ?)
+            ON DUPLICATE KEY UPDATE YEAR = VALUES(YEAR), ByteOffset = VALUES(ByteOffset),
+                RowsWritten = VALUES(RowsWritten);""",tuple(Checkpoint))
+
+def ReadCheckpoints(DataUser):
+
+    """
+        Returns a dictionary with the committed [ByteOffset, RowsWritten] for 
+        each data file in Table ingestcheckpoint.
+    """
+    import mariadb
+
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE healthdata;')
+        CreateCheckpointTable(cur)
+        cur.execute('SELECT DataFile, ByteOffset, RowsWritten FROM ingestcheckpoint')
+        Checkpoints = {Row[0]: [Row[1],Row[2]] for Row in cur.fetchall()}
+        Connection.commit()
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e4:
+        print('Error reading Table ingestcheckpoint: {error}'.format(error=e4))
+        Checkpoints = {}
+    return Checkpoints
+
+def CreateCubeTable(cur):
+
+    """
+        Creates Table brfsscube if it does not exist. The table has one row for
+        each combination of CubeKeys found in brfssdata with the number of
+        respondents and the number of positive cases for each outcome in
+        CubeOutcomes. Most of the health data models only need these counts so
+        they can be answered from a few thousand rows rather than every record.
+    """
+    KeyList = ['{:<12}{} UNSIGNED NOT NULL'.format(Key,'SMALLINT' if Key == 'YEAR' else 'TINYINT') for Key in CubeKeys]
+    TotalList = ['{:<12}INT UNSIGNED NOT NULL DEFAULT 0'.format(Total) for Total in CubeTotals]
+    cur.execute("""CREATE TABLE IF NOT EXISTS brfsscube(
+            {},
+            PRIMARY KEY ({}));""".format(',\n            '.join(KeyList + TotalList),', '.join(CubeKeys)))
+
+def CubeRows(HealthDataframe):
+
+    """
+        Returns the counts for Table brfsscube for a block of cleaned records as
+        a list of rows: the values of CubeKeys followed by the number of
+        respondents and the number of positive cases for each outcome.
+    """
+    import pandas as pd
+
+    CubeDataframe = pd.DataFrame({Key: HealthDataframe[Key] for Key in CubeKeys})
+    CubeDataframe['Respondents'] = 1
+    for Outcome, Code in CubeOutcomes:
+        CubeDataframe[Outcome] = (HealthDataframe[Outcome] == Code).astype(int)
+    return CubeDataframe.groupby(CubeKeys).sum().reset_index().astype(int).values.tolist()
+
+def BuildCube(DataUser, Years=None):
+
+    """
+        Rebuilds the rows of Table brfsscube from the records in brfssdata.
+        If Years is given, only the rows for those years are replaced.
+    """
+    import mariadb
+
+    SelectList = CubeKeys + ['COUNT(*)'] + ['SUM({} = {})'.format(Outcome,Code) for Outcome, Code in CubeOutcomes]
+    WhereString = '' if Years is None else ' WHERE YEAR IN ({})'.format(', '.join(str(int(Year)) for Year in Years))
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE healthdata;')
+        CreateCubeTable(cur)
+        cur.execute('DELETE FROM brfsscube{};'.format(WhereString))
+        cur.execute("""INSERT INTO brfsscube ({})
+                SELECT {} FROM brfssdata{}
+                GROUP BY {};""".format(', '.join(CubeKeys + CubeTotals),', '.join(SelectList),WhereString,
+                                      ', '.join(CubeKeys)))
+        Connection.commit()
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e5:
+        print('Error building Table brfsscube: {error}'.format(error=e5))
+
+def PrepareCube(DataUser):
+
+    """
+        Creates Table brfsscube if it does not exist. If the cube is empty but
+        brfssdata already holds records (a database created before the cube
+        was added), the cube is built from brfssdata so that the counts added
+        for each new block start from the right totals.
+    """
+    import mariadb
+
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE healthdata;')
+        CreateCubeTable(cur)
+        cur.execute('SELECT EXISTS (SELECT 1 FROM brfsscube), EXISTS (SELECT 1 FROM brfssdata)')
+        CubeExists, DataExists = cur.fetchone()
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e6:
+        print('Error creating Table brfsscube: {error}'.format(error=e6))
+        return
+    if not CubeExists and DataExists:
+        print('Building Table brfsscube from brfssdata.')
+        BuildCube(DataUser)
+
+def CreateStage(DataUser, DataFile, DataYear, Reset=True):
+
+    """
+        Creates the staging tables that one year of survey data is loaded into
+        before it replaces that year's partition of brfssdata (see SwapStage):
+        brfssstage{Year}, with the columns of brfssdata but no partitions, and
+        brfsscubestage{Year} for its summary counts. Each staging table has its
+        own range of participant IDs, kept in the table's comment. The range
+        starts above every ID in brfssdata and in the ranges of the other
+        staging tables, and holds twice the number of records in DataFile (see
+        DataFileRecords) to leave room for the IDs of blocks that are rolled
+        back. So the new records can always be told apart from the records
+        they replace, and the IDs stay unique when several years are staged
+        before they are swapped in. If Reset is False and both tables exist,
+        they are kept so an interrupted load can be resumed. When new tables
+        are created, the checkpoint of DataFile is set back to the start of the
+        file. Returns True if existing tables were kept, False if empty tables
+        were created and None if the tables could not be created.
+    """
+    import mariadb
+
+    StageTable = 'brfssstage{}'.format(DataYear)
+    CubeStage = 'brfsscubestage{}'.format(DataYear)
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE healthdata;')
+        cur.execute("""SELECT COUNT(*) FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME IN (?, ?)""",(StageTable,CubeStage))
+        StageKept = not Reset and cur.fetchone()[0] == 2
+        if not StageKept:
+            # The last ID used in brfssdata or reserved by another staging table.
+            # Staging tables without a range in their comment reserve the IDs
+            # up to their AUTO_INCREMENT.
+            cur.execute('SELECT COALESCE(MAX(PrtcpntID), 0) FROM brfssdata')
+            LastID = cur.fetchone()[0]
+            cur.execute("""SELECT TABLE_COMMENT, AUTO_INCREMENT FROM information_schema.TABLES
+                    WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME LIKE 'brfssstage%' AND TABLE_NAME <> ?""",
+                        (StageTable,))
+            for StageComment, StageNext in cur.fetchall():
+                if StageNext is not None:
+                    LastID = max(LastID,StageNext - 1)
+                if (StageComment or '').startswith('PrtcpntID '):
+                    LastID = max(LastID,int(StageComment.split('-')[-1]))
+            FirstID = LastID + 1
+            StageRange = 'PrtcpntID {}-{}'.format(FirstID,FirstID + 2*max(DataFileRecords(DataFile),1) - 1)
+            cur.execute('DROP TABLE IF EXISTS {}, {};'.format(StageTable,CubeStage))
+            cur.execute('CREATE TABLE {} LIKE brfssdata;'.format(StageTable))
+            cur.execute('ALTER TABLE {} REMOVE PARTITIONING;'.format(StageTable))
+            cur.execute("ALTER TABLE {} AUTO_INCREMENT = {}, COMMENT = '{}';".format(StageTable,int(FirstID),
+                                                                                   StageRange))
+            cur.execute('CREATE TABLE {} LIKE brfsscube;'.format(CubeStage))
+            SaveCheckpoint(cur,[DataFile,DataYear,0,0])
+            Connection.commit()
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e7:
+        print('Error creating the staging tables for {year}: {error}'.format(year=DataYear,error=e7))
+        return None
+    return StageKept
+
+def ReadStages(DataUser):
+
+    """
+        Returns the set of years that have a staging table (see CreateStage).
+    """
+    import mariadb
+
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute("""SELECT TABLE_NAME FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME LIKE 'brfssstage%'""")
+        StageYears = {Row[0][len('brfssstage'):] for Row in cur.fetchall()}
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e9:
+        print('Error reading the staging tables: {error}'.format(error=e9))
+        StageYears = set()
+    return StageYears
+
+def SwapStage(DataUser, DataFile, DataYear, RowsWritten):
+
+    """
+        Replaces partition p{Year} of brfssdata with the records loaded into
+        brfssstage{Year} and the year's rows of brfsscube with the counts in
+        brfsscubestage{Year}. ALTER TABLE ... EXCHANGE PARTITION swaps the data
+        in one step, so the year is never seen half loaded and the other years
+        are not touched. The checkpoint of DataFile is then marked complete and
+        the staging tables, which now hold the previous records, are dropped.
+        If a run stopped after the exchange, the staging table holds the older
+        participant IDs (see CreateStage) and the exchange is not repeated.
+        ExtractData finishes the swap for any staging tables left by a run that
+        stopped after the last block of a file was committed (see ReadStages).
+        Returns True if the year was swapped.
+    """
+    import mariadb
+
+    StageTable = 'brfssstage{}'.format(DataYear)
+    CubeStage = 'brfsscubestage{}'.format(DataYear)
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE healthdata;')
+
+        # 1. Add the partition for the year if brfssdata does not have it yet
+        cur.execute("""SELECT COUNT(*) FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = 'healthdata' AND TABLE_NAME = 'brfssdata' AND PARTITION_NAME = ?""",
+                    ('p{}'.format(DataYear),))
+        if cur.fetchone()[0] == 0:
+            cur.execute('ALTER TABLE brfssdata ADD PARTITION (PARTITION p{0} VALUES IN ({0}));'.format(DataYear))
+
+        # 2. Swap the staging table with the partition unless this was done by
+        #    an earlier run: the new records have the higher participant IDs. If
+        #    no records were loaded, the staging table is only empty before the
+        #    swap.
+        cur.execute('SELECT MIN(PrtcpntID) FROM {}'.format(StageTable))
+        StageFirst = cur.fetchone()[0]
+        cur.execute('SELECT MAX(PrtcpntID) FROM brfssdata PARTITION (p{})'.format(DataYear))
+        PartitionLast = cur.fetchone()[0]
+        if RowsWritten == 0:
+            Exchange = StageFirst is None
+        else:
+            Exchange = StageFirst is not None and (PartitionLast is None or StageFirst > PartitionLast)
+        if Exchange:
+            cur.execute('ALTER TABLE brfssdata EXCHANGE PARTITION p{} WITH TABLE {};'.format(DataYear,StageTable))
+
+        # 3. Replace the summary counts for the year and mark the file complete
+        cur.execute('DELETE FROM brfsscube WHERE YEAR = ?',(int(DataYear),))
+        cur.execute('INSERT INTO brfsscube SELECT * FROM {}'.format(CubeStage))
+        SaveCheckpoint(cur,[DataFile,DataYear,DataFileSize(DataFile),RowsWritten])
+        Connection.commit()
+
+        # 4. Remove the staging tables
+        cur.execute('DROP TABLE IF EXISTS {}, {};'.format(StageTable,CubeStage))
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e8:
+        print('Error replacing the data for {year}: {error}'.format(year=DataYear,error=e8))
+        return False
+    print('Replaced the data for {} ({} records).'.format(DataYear,RowsWritten))
+    return True
+
+def ExtractData(DataUser, BlockSize=5000, Workers=1, QueueSize=8, Report=None,
+                LoadMethod='executemany', BatchSize=None, Cache=True, Resume=True, Years=None):
+
+    """
+        Reads the BRFSS survey files, cleans the records and inserts them into
+        Table brfssdata. If a year's .ASC file has not been extracted, the zip
+        archive from the CDC (LLCP{Year}ASC.zip) is read directly. With Workers
+        greater than 1, each year's file is read and cleaned in a separate
+        worker process (up to Workers at a time). The cleaned blocks are sent
+        back through a queue holding at most QueueSize blocks and inserted into
+        the database by this process.
+        If Report is a dictionary, the cleaning report for each year (see
+        CleanData) is stored in it with the year as the key.
+        LoadMethod and BatchSize select how the blocks are inserted (see
+        InsertData). The number of records inserted per second into each
+        staging table is printed when the data has been loaded so the methods
+        can be compared.
+        If Cache is True, the cleaned records for each year are also written
+        to a Parquet file in CacheDir so the health data models can be run
+        without querying the database (see HealthModelData.ReadCache).
+        Each year is loaded into its own staging table (see CreateStage) and
+        replaces that year's partition of brfssdata once the whole file has
+        been read (see SwapStage), so loading a year again replaces its records
+        rather than adding duplicates. The summary counts for Table brfsscube
+        are staged with each block in the same transaction as the records (see
+        CubeRows) and replace the year's counts with the partition.
+        After each block is committed, the byte offset in the file and the
+        number of records written are saved in Table ingestcheckpoint. If 
+        Resume is True, a year that was interrupted is read from its last 
+        checkpoint and a year that is complete is skipped. If Resume is False,
+        every year is loaded again. Years is a list of the years to load
+        (default all).
+    """
+    import os
+    import time
+    import mariadb
+    import contextlib
+    import multiprocessing
+    import DatabaseTools
 
     # Descriptions to be used to generate file names for the data sources
     DataFileBase = 'LLCP'
@@ -102,222 +1148,188 @@ def ExtractData(DataUser):
     # Blocking variables. The files contain between 400,000 and 500,000 lines.
     # Each line is a record for a survey conducted. Rather than read in all the
     # data at once, the data will be processed in blocks where the number of 
-    # records included is BlockSize. max is the maximum number of times the
-    # file will be read.
-    max = 150
-    BlockSize = 5000
+    # records included is BlockSize. Each file is read once from start to end
+    # and the blocks are cleaned and inserted as they are read.
+
+    # Set of lists that contain information about the data columns accessed in the
+    # data file: name and location. Name are similar to the names listed in the 
+    # documentation provided which explains the files contents. In this case,
+    # leading underscores (_) and trailing numbers have been removed to provide
+    # consistent names. The exact name of the variables varies year to year.
+    # The data files used store the data as ASCII characters with each row holding
+    # the record of each survey. The answers to questions and other computed values
+    # are stored at specific positions in the row. The structure varies from year
+    # to year. The location of data fields is provided in the survey data's 
+    # documentation. VarLoc is a list of the first and last column of the data field
+    # being extracted. Most of the data fields are one character so the first and
+    # last columns are the same. 
+    VarList = ['STATE','CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','SEX','RFHYPE','RFCHOL','ASTHMS',
+               'RACE','AGEG5YR','BMI5CAT','INCOMG','SMOKER','RFDRHV','PACAT']
+    VarLoc = [[[1,2],[98,98],[99,99],[100,100],[105,105],[109,109],[178,178],[2103,2103],
+               [2105,2105],[2108,2108],[2173,2173],[2177,2178],[2196,2196],[2200,2200],
+               [2201,2201],[2216,2216],[2348,2348]],
+              [[1,2],[106,106],[107,107],[108,108],[113,113],[117,117],[120,120],[1896,1896],
+               [1898,1898],[1902,1902],[1967,1967],[1971,1972],[1992,1992],[1996,1996],
+               [1997,1997],[2009,2009],[2139,2139]],
+              [[1,2],[106,106],[107,107],[108,108],[113,113],[117,117],[125,125],[1950,1950],
+               [1952,1952],[1956,1956],[2024,2024],[2028,2029],[2049,2049],[2053,2053],
+               [2054,2054],[2068,2068],[2196,2196]],
+              [[1,2],[117,117],[118,118],[119,119],[124,124],[127,127],[91,91],[1903,1903],
+               [1905,1905],[1909,1909],[1976,1976],[1981,1982],[2002,2002],[2006,2006],
+               [2007,2007],[2019,2019],[2101,2101]]]
+
+    # Location of the final survey weight (_LLCPWT) for each year. The weight
+    # is needed to compute estimates for the population rather than the sample.
+    WeightLoc = [[2091,2100],[1884,1893],[1936,1945],[1888,1897]]
+
+    # List of three different groups that will be used to clean data after it is loaded.
+    # HealthList includes eight medical conditions that are of interest. FactorList
+    # includes four lifestyle factors that may be connected to the medical conditions.
+    # The purpose of this model is to determine if lifestyle choices such as smoking,
+    # heavy drinking, and a lack of physical exercise have any impact on the risk of
+    # devloping heart disease, diabetes and respiratory problems. If the connection 
+    # exists, can a lifestyle intervention reduce the cost.
+    # DemogrList includes respondents location, birthsex, racial, age grouping and income
+    # group. These variables can be used account for difference between the sample
+    # and population.
+    FactorList = ['BMI5CAT','SMOKER','RFDRHV','PACAT']
+    HealthList = ['CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','RFHYPE','RFCHOL','ASTHMS']
+    DemogrList = ['STATE','SEX','RACE','AGEG5YR','INCOMG']
+
+    # HealthDataColumns is a list of data fields in the database.
+    HealthDataColumns = ['STATE','CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','SEX','RFHYPE','RFCHOL','ASTHMS',
+               'RACE','AGEG5YR','BMI5CAT','INCOMG','SMOKER','RFDRHV','PACAT','LLCPWT','YEAR']
+
+    # The local cache requires pyarrow. If it is not installed, the data is only
+    # inserted into the database.
+    if Cache:
+        try:
+            import pyarrow.parquet
+            os.makedirs(CacheDir,exist_ok=True)
+        except ImportError:
+            print('pyarrow is not installed. The local cache of the survey data will not be written.')
+            Cache = False
+
+    # Committed checkpoints from earlier runs. A year that was interrupted is
+    # resumed from the end of the last block committed to its staging table.
+    Checkpoints = ReadCheckpoints(DataUser)
+    StageYears = ReadStages(DataUser)
+    if not Resume: Checkpoints = {}
+
+    # The summary cube for the staged years replaces the counts in brfsscube.
+    PrepareCube(DataUser)
 
     # Loop over the files to be processed. The data is processed for every other
     # year due to the variations in the yearly survey. One factor of interest is
     # the classification of the respondents physical activity. This data is collected
-    # in odd years.
+    # in odd years. The arguments for reading each file that exists are collected
+    # in YearTasks. StageFiles holds the files (and years) being loaded into
+    # staging tables.
+    YearTasks = []
+    RowsWritten = {}
+    StageFiles = {}
     for Year in range(len(DataFilesYearB)):
 
-        # Create the file name and check to see if it exists
+        # Create the file name and check to see if it exists. The CDC distributes
+        # each year as a zip archive of the data file, which is read directly
+        # when the data file has not been extracted.
         DataFile = DataFileBase + DataFilesYearB[Year] + DataFileRoot
+        for ZipName in [DataFileBase + DataFilesYearB[Year] + 'ASC.zip',DataFileBase + DataFilesYearB[Year] + '.zip']:
+            if not os.path.exists(DataFile) and os.path.exists(ZipName):
+                DataFile = ZipName
+        if Years is not None and DataFilesYearB[Year] not in [str(LoadYear) for LoadYear in Years]: continue
         if (os.path.exists(DataFile)):
-            print('Opening file {}'.format(DataFile))
-
-            # Set of lists that contain information about the data columns accessed in the
-            # data file: name and location. Name are similar to the names listed in the 
-            # documentation provided which explains the files contents. In this case,
-            # leading underscores (_) and trailing numbers have been removed to provide
-            # consistent names. The exact name of the variables varies year to year.
-            # The data files used store the data as ASCII characters with each row holding
-            # the record of each survey. The answers to questions and other computed values
-            # are stored at specific positions in the row. The structure varies from year
-            # to year. The location of data fields is provided in the survey data's 
-            # documentation. VarLoc is a list of the first and last column of the data field
-            # being extracted. Most of the data fields are one character so the first and
-            # last columns are the same. 
-            VarList = ['STATE','CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','SEX','RFHYPE','RFCHOL','ASTHMS',
-                       'RACE','AGEG5YR','BMI5CAT','INCOMG','SMOKER','RFDRHV','PACAT']
-            VarLoc = [[[1,2],[98,98],[99,99],[100,100],[105,105],[109,109],[178,178],[2103,2103],
-                       [2105,2105],[2108,2108],[2173,2173],[2177,2178],[2196,2196],[2200,2200],
-                       [2201,2201],[2216,2216],[2348,2348]],
-                      [[1,2],[106,106],[107,107],[108,108],[113,113],[117,117],[120,120],[1896,1896],
-                       [1898,1898],[1902,1902],[1967,1967],[1971,1972],[1992,1992],[1996,1996],
-                       [1997,1997],[2009,2009],[2139,2139]],
-                      [[1,2],[106,106],[107,107],[108,108],[113,113],[117,117],[125,125],[1950,1950],
-                       [1952,1952],[1956,1956],[2024,2024],[2028,2029],[2049,2049],[2053,2053],
-                       [2054,2054],[2068,2068],[2196,2196]],
-                      [[1,2],[117,117],[118,118],[119,119],[124,124],[127,127],[91,91],[1903,1903],
-                       [1905,1905],[1909,1909],[1976,1976],[1981,1982],[2002,2002],[2006,2006],
-                       [2007,2007],[2019,2019],[2101,2101]]]
-
-            # List of three different groups that will be used to clean data after it is loaded.
-            # HealthList includes eight medical conditions that are of interest. FactorList
-            # includes four lifestyle factors that may be connected to the medical conditions.
-            # The purpose of this model is to determine if lifestyle choices such as smoking,
-            # heavy drinking, and a lack of physical exercise have any impact on the risk of
-            # devloping heart disease, diabetes and respiratory problems. If the connection 
-            # exists, can a lifestyle intervention reduce the cost.
-            # DemogrList includes respondents location, birthsex, racial, age grouping and income
-            # group. These variables can be used account for difference between the sample
-            # and population.
-            FactorList = ['BMI5CAT','SMOKER','RFDRHV','PACAT']
-            HealthList = ['CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','RFHYPE','RFCHOL','ASTHMS']
-            DemogrList = ['STATE','SEX','RACE','AGEG5YR','INCOMG']
-
-            # Loop over each block in the file
-            for k in range(max):
-
-                # Counter used to determine which block the file line belongs to.
-                # Counter acts as a line number
-                j = 0
-                print('Run {}'.format(k+1))
-
-                # Open data file
-                Dfile_in = open(DataFile,"r")
-
-                # Lists to be used to collect data from the file
-                DataList = []
-                IndexList = []
-
-                # Loop over each line of the file
-                for line in Dfile_in:
-
-                    # Increment counter
-                    j += 1
-
-                    # Check if the line is within the current block (k).
-                    # If the line is after the current block, exit the
-                    # loop over lines in the file. If it is before the
-                    # current block, continue to the next line.
-                    if j // BlockSize > k: break
-                    if j // BlockSize < k: continue
-
-                    # Initialize list for data from each row
-                    RowList = []
-
-                    # Loop over the variables in the VariableList.
-                    # The location of the first and last character of the 
-                    # variable is: 
-                    # Varloc[Year index][Variable index][0] and 
-                    # Varloc[Year index][Variable index][1].
-                    # Append all the characters between the first and last
-                    # character inclusive to RowList.
-                    for i in range(len(VarList)):
-                        RowList.append(line[VarLoc[Year][i][0]-1:VarLoc[Year][i][1]])
-                    # Append the RowList to the DataList
-                    DataList.append(RowList)
-                    # Append the line number (Counter j) to the IndexList
-                    IndexList.append(j)
-
-                # Check if there is any data in DataList. If there are not
-                # anymore lines in the data file, then exit loop over data blocks.
-                if len(DataList) == 0: break
-
-                # Once the DataList and IndexList have been formed and they are not empty. 
-                # Create a data frame to hold the information
-                HealthDataframe = pd.DataFrame(DataList,columns=VarList,index = IndexList)
-                print(HealthDataframe.shape)
-
-                # Clean data
-                # 1. Remove US territories
-                HealthDataframe['STATE'] = pd.to_numeric(HealthDataframe['STATE'])
-                HealthDataframeClean = HealthDataframe.loc[HealthDataframe['STATE'] < 57]
-                print('STATE',HealthDataframeClean.shape)
-
-                # 2. Keep only surveys which identify respondent as Male or Female and remove
-                #    any others.
-                #  '1' - Male
-                #  '2' - Female
-                SexValues = ['1','2']
-                HealthDataframeClean = HealthDataframeClean.loc[HealthDataframe['SEX'].isin(SexValues)]
-                print('SEX',HealthDataframeClean.shape)
-
-                # 3. Keep only surveys where age group is identified and remove any where the
-                #    age group is not included. Note the leading 0 character in the data string.
-                #  '01' - 18 - 24
-                #  '02' - 25 - 30
-                #  '13' - 80 and up
-                AgeValues = ['01','02','03','04','05','06','07','08','09','10','11','12','13']
-                HealthDataframeClean = HealthDataframeClean.loc[HealthDataframe['AGEG5YR'].isin(AgeValues)]
-                print('AGEG5YR',HealthDataframeClean.shape)
-
-                # 4. Keep only surveys where response include one of the first four numbers (1,2,3,4).
-                #    Remove surveys where the data is missing for any reason. Values such as 7, 8, 9, 
-                #    and ' ' are to be removed.  
-                # 'CVDINFR', 'CVDCRHD', 'CVDSTRK', 'CHCCOPD'
-                #   '1' : Yes
-                #   '2' : No
-                # 'DIABETE'
-                #   '1' : Yes
-                #   '2' : Yes only during pregnancy
-                #   '3' : No
-                #   '4' : No borderline
-                # 'RFHYPE', 'RFCHOL'
-                #   '1' : No
-                #   '2' : Yes (Cholesterol or BP checked and medical provider reported it was high) 
-                # 'ASTHMS'
-                #   '1' : Current
-                #   '2' : Former
-                #   '3' : Never
-                HealthValues = ['1','2','3','4']
-                for Var in HealthList:
-                    HealthDataframeClean = HealthDataframeClean.loc[HealthDataframeClean[Var].isin(HealthValues)]
-                    print(Var,HealthDataframeClean.shape)
-
-                # 5. Keep only surveys where response include one of the first four numbers (1,2,3,4).
-                #    Remove surveys where the data is missing for any reason. Values such as 7, 8, 9, 
-                #    and ' ' are to be removed.  
-                #'BMI5CAT'
-                #   '1' : Underweight
-                #   '2' : Normal weight
-                #   '3' : Overweight
-                #   '4' : Obese
-                #'SMOKER'
-                #   '1' : Current daily smoker
-                #   '2' : Current occasional smoker
-                #   '3' : Former Smoker
-                #   '4' : Never Smoked
-                #'RFDRHV' 
-                #   '1' : No
-                #   '2' : Yes
-                #'PACAT'
-                #   '1' : Highly active
-                #   '2' : active
-                #   '3' : Insufficiently active
-                #   '4' : Inactive
-                FactorValues = ['1','2','3','4']
-                for Var in FactorList:
-                    HealthDataframeClean = HealthDataframeClean.loc[HealthDataframeClean[Var].isin(FactorValues)]
-                    print(Var,HealthDataframeClean.shape)
-
-                # Add YEAR column to dataframe so data can be filtered by year in future
-                HealthDataframeClean['Year'] = DataFilesYearB[Year]
-
-                # Transform dataframe to list to be added to database
-                # HealthDataColumns is a list of data fields in the database.
-                HealthDataColumns = ['STATE','CVDINFR','CVDCRHD','CVDSTRK','CHCCOPD','DIABETE','SEX','RFHYPE','RFCHOL','ASTHMS',
-                       'RACE','AGEG5YR','BMI5CAT','INCOMG','SMOKER','RFDRHV','PACAT','YEAR']
-                HealthDataList = HealthDataframeClean.values.tolist()
-
-                # If there are no new fields to be added exit loop over blocks. Here the assumption
-                # is that there will be at least one record in each block of data. The only exception
-                # is the last block which will typically have fewer records and may have them all removed
-                # during the data cleaning process.
-                if len(HealthDataList) == 0: break
-
-                # Strings for querying database. 
-                #   1. Select database with the data table
-                #   2. Insert the data into the table
-                HealthDataStringA = 'USE healthdata;'
-                HealthDataStringB = UpdateDatabaseQuery(HealthDataList,HealthDataColumns,'brfssdata')
+            CacheFile = os.path.join(CacheDir,'brfss{}.parquet'.format(DataFilesYearB[Year])) if Cache else None
+            StartOffset, RowsWritten[DataFile] = Checkpoints.get(DataFile,[0,0])
+            if StartOffset >= DataFileSize(DataFile):
+                # The last block was committed but the year was not swapped in.
+                if DataFilesYearB[Year] in StageYears:
+                    print('Finishing file {}'.format(DataFile))
+                    StageFiles[DataFile] = DataFilesYearB[Year]
+                if CacheFile is None or os.path.exists(CacheFile):
+                    print('File {} has already been loaded ({} records).'.format(DataFile,RowsWritten[DataFile]))
+                    continue
+                # Only the local cache is written for this year.
+                print('Writing the cache for file {}'.format(DataFile))
+            else:
+                StageKept = CreateStage(DataUser,DataFile,DataFilesYearB[Year],Reset=(StartOffset == 0))
+                if StageKept is None:
+                    continue
+                elif StageKept:
+                    print('Resuming file {} at byte {} ({} records written).'.format(DataFile,StartOffset,
+                                                                                      RowsWritten[DataFile]))
+                else:
+                    print('Opening file {}'.format(DataFile))
+                    StartOffset, RowsWritten[DataFile] = 0, 0
+                StageFiles[DataFile] = DataFilesYearB[Year]
+            YearTasks.append((DataFile,VarList,VarLoc[Year],DataFilesYearB[Year],BlockSize,HealthList,FactorList,
+                              CacheFile,StartOffset,WeightLoc[Year]))
+
+    # Number of records inserted into each staging table and the time spent
+    # inserting them.
+    LoadCounts = {}
+
+    # The server variables are read once for all the blocks (see InsertData).
+    Variables = None
+    if LoadMethod == 'executemany' and len(YearTasks) > 0:
+        try:
+            Connection = DataUser.OpenConnection()
+            Variables = DatabaseTools.ServerVariables(Connection)
+            DataUser.CloseConnection(Connection)
+        except mariadb.Error as e3:
+            print('Error reading the server variables: {error}'.format(error=e3))
 
+    # Serial mode: read, clean and insert each year in turn.
+    # Parallel mode: each year is read and cleaned by a worker process. The 
+    # blocks are inserted as they arrive on the queue. The queue is bounded so
+    # the workers wait when the database falls behind rather than holding the
+    # years in memory.
+    FailedFiles = set()
+    with contextlib.ExitStack() as WorkerStack:
+        if Workers <= 1 or len(YearTasks) <= 1:
+            BlockStream = SerialBlocks(YearTasks,Report,FailedFiles)
+        else:
+            QueueManager = WorkerStack.enter_context(multiprocessing.Manager())
+            BlockQueue = QueueManager.Queue(maxsize=QueueSize)
+            WorkerPool = WorkerStack.enter_context(multiprocessing.Pool(processes=min(Workers,len(YearTasks))))
+            Results = [WorkerPool.apply_async(ExtractWorker,(BlockQueue,)+YearTask) for YearTask in YearTasks]
+            BlockStream = QueueBlocks(BlockQueue,len(YearTasks))
+
+        # Insert each block together with its checkpoint. If a block cannot be
+        # inserted, the rest of that file is skipped; the next run resumes from
+        # the last block committed.
+        for DataFile, DataYear, EndOffset, HealthDataList, CubeList in BlockStream:
+            if DataFile in FailedFiles: continue
+            Checkpoint = [DataFile,DataYear,EndOffset,RowsWritten[DataFile] + len(HealthDataList)]
+            StageTable = 'brfssstage{}'.format(DataYear)
+            InsertStart = time.perf_counter()
+            Inserted = InsertData(DataUser,HealthDataList,HealthDataColumns,LoadMethod,BatchSize,Checkpoint,CubeList,
+                                  StageTable,'brfsscubestage{}'.format(DataYear),Variables)
+            LoadCount = LoadCounts.setdefault(StageTable,[0,0.])
+            LoadCount[1] += time.perf_counter() - InsertStart
+            if Inserted is None:
+                print('Stopped loading {} after {} records. Run again to resume.'.format(DataFile,RowsWritten[DataFile]))
+                FailedFiles.add(DataFile)
+                continue
+            LoadCount[0] += Inserted
+            RowsWritten[DataFile] += Inserted
+
+        # Report any year where the worker failed.
+        if Workers > 1 and len(YearTasks) > 1:
+            for YearTask, Result in zip(YearTasks,Results):
                 try:
-                    # Connect to database. The username and password are contained in DataUser and
-                    # used to establish a connection. In other scripts, the connection closed 
-                    # prematurely so open and close the connection only when executing a set of queries.
-                    DataUser.NewConnect()
-                    cur = DataUser.Connection.cursor()
-                    cur.execute(HealthDataStringA)
-                    cur.execute(HealthDataStringB)
-                    cur.close()
-                    DataUser.CloseConnect()
-                except mariadb.Error as e2:
-                    print('Error inserting Data into Table brfssdata: {error}'.format(error=e2))
+                    YearReport = Result.get()
+                    if Report is not None: Report[YearTask[3]] = YearReport
+                except Exception as e3:
+                    print('Error extracting data from {file}: {error}'.format(file=YearTask[0],error=e3))
+                    FailedFiles.add(YearTask[0])
+
+    # Replace the partition of each year that was loaded completely.
+    for DataFile, DataYear in StageFiles.items():
+        if DataFile not in FailedFiles:
+            SwapStage(DataUser,DataFile,DataYear,RowsWritten[DataFile])
+    for StageTable, (InsertCount, InsertTime) in LoadCounts.items():
+        PrintLoadRate(LoadMethod,InsertCount,InsertTime,StageTable)
 
 
 def UpdateMenu(DataUser):
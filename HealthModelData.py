@@ -1,10 +1,130 @@
-def RiskTable1(DataUser):
+def ReadCache(Columns=None, Filters=None):
 
+    """
+        Reads the cleaned survey data from the local Parquet cache written by
+        HealthDatabase.ExtractData. Only the data fields in Columns are read.
+        Filters is a list of conditions such as [('SEX','=',1),('BMI5CAT','!=',1)]
+        that are applied while the files are read, so row groups that cannot
+        match are skipped. The survey fields are int8 codes and YEAR is a number.
+        Returns a data frame.
+    """
+    import pyarrow.parquet as pq
+    import HealthDatabase
+
+    CacheTable = pq.read_table(HealthDatabase.CacheDir,columns=Columns,filters=Filters)
+    return CacheTable.to_pandas()
+
+def CubeQuery(DataUser, GroupBy, Where=None):
+
+    """
+        Reads the summary counts from Table brfsscube grouped by the columns in
+        GroupBy (any of HealthDatabase.CubeKeys). Where is a dictionary that
+        selects the rows counted, for example {'SEX': 1, 'YEAR': [2017, 2019]}.
+        Returns a data frame indexed by GroupBy with the number of respondents
+        and the number of positive cases for each outcome in 
+        HealthDatabase.CubeOutcomes.
+    """
     import pandas as pd
-    import mariadb
+    import HealthDatabase
+
+    # The column names are written into the query so only the cube keys are accepted.
+    WhereDict = {} if Where is None else Where
+    for Key in list(GroupBy) + list(WhereDict):
+        if Key not in HealthDatabase.CubeKeys:
+            raise ValueError('{} is not a column of Table brfsscube.'.format(Key))
+
+    WhereList = []
+    WhereValues = []
+    for Key, Value in WhereDict.items():
+        Values = list(Value) if isinstance(Value,(list,tuple,set)) else [Value]
+        WhereList.append('{} IN ({})'.format(Key,', '.join(['?']*len(Values))))
+        WhereValues += [int(Value) for Value in Values]
+    WhereString = ' WHERE ' + ' AND '.join(WhereList) if len(WhereList) > 0 else ''
 
     Connect = DataUser.OpenConnection()
     cur = Connect.cursor()
+    cur.execute('USE healthdata')
+    cur.execute("""SELECT {0}, {1} FROM brfsscube{2} GROUP BY {0}""".format(', '.join(GroupBy),
+                ', '.join(['SUM({})'.format(Total) for Total in HealthDatabase.CubeTotals]),WhereString),
+                tuple(WhereValues))
+    CubeDF = pd.DataFrame(cur.fetchall(),columns=list(GroupBy)+HealthDatabase.CubeTotals)
+    cur.close()
+    DataUser.CloseConnection(Connect)
+    return CubeDF.set_index(list(GroupBy)).astype(int).sort_index()
+
+def CubeRates(DataUser, GroupBy, Where=None):
+
+    """
+        Returns the fraction of respondents with each outcome, grouped by the
+        columns in GroupBy and selected by Where (see CubeQuery). 
+    """
+    import HealthDatabase
+
+    CubeDF = CubeQuery(DataUser,GroupBy,Where)
+    return CubeDF[HealthDatabase.CubeTotals[1:]].div(CubeDF['Respondents'],axis=0)
+
+def RiskTable(DataUser, Source='database', Weighted=False):
+
+    """
+        Counts the respondents in every BMI category for each combination of
+        sex, risk factor (physical activity and smoking, 'PACAT-SMOKER') and age
+        group in a single pass over the survey data. The counts for the normal
+        weight (2), overweight (3) and obese (4) categories and the reference
+        group (every category except underweight) are computed together with
+        conditional aggregation, then divided by the reference to give rates.
+        Returns a data frame indexed by (SEX, RISK_FACT, AGEGRP) with columns
+        ('Count', Category) and ('Rate', Category). For example, the rates of
+        obesity for men by risk factor and age group are
+            RiskTable(DataUser).loc[1,('Rate','Obese')].unstack('AGEGRP')
+        Source selects where the survey data is read from: 'database' queries
+        Table brfssdata, 'cube' queries the summary counts in Table brfsscube
+        and 'cache' reads the local copy written by HealthDatabase.ExtractData.
+        If Weighted is True, each respondent counts with their survey weight
+        (LLCPWT) so the counts and rates are estimates for the population. 
+        Table brfsscube holds unweighted counts only.
+    """
+    import pandas as pd
+
+    RiskIndex = ['SEX','RISK_FACT','AGEGRP']
+    CountColumns = ['Normal','Overweight','Obese','Reference']
+
+    if Weighted and Source == 'cube':
+        raise ValueError('Weighted rates cannot be computed from Table brfsscube.')
+
+    if Source == 'cache':
+        # The same aggregation over the codes read from the local cache.
+        RiskDataframe = ReadCache(['SEX','PACAT','SMOKER','AGEG5YR','BMI5CAT'] + (['LLCPWT'] if Weighted else []))
+        RiskWeight = RiskDataframe['LLCPWT'].fillna(0) if Weighted else 1
+        CountDF = pd.DataFrame({'SEX': RiskDataframe['SEX'].astype(int),
+                                'RISK_FACT': RiskDataframe['PACAT'].astype(str) + '-' + RiskDataframe['SMOKER'].astype(str),
+                                'AGEGRP': RiskDataframe['AGEG5YR'].astype(int),
+                                'Normal': (RiskDataframe['BMI5CAT'] == 2)*RiskWeight,
+                                'Overweight': (RiskDataframe['BMI5CAT'] == 3)*RiskWeight,
+                                'Obese': (RiskDataframe['BMI5CAT'] == 4)*RiskWeight,
+                                'Reference': (RiskDataframe['BMI5CAT'] != 1)*RiskWeight})
+        CountDF = CountDF.groupby(RiskIndex)[CountColumns].sum()
+    else:
+        # Each row of brfssdata is one respondent; each row of brfsscube holds
+        # the number of respondents with those values.
+        TableName, CountString = ('brfsscube',' * Respondents') if Source == 'cube' else ('brfssdata','')
+        if Weighted: CountString = ' * COALESCE(LLCPWT, 0)'
+        Connect = DataUser.OpenConnection()
+        cur = Connect.cursor()
+        cur.execute('USE healthdata')
+        cur.execute("""SELECT SEX, CONCAT(PACAT, '-', SMOKER) AS RISK_FACT, AGEG5YR,
+                            SUM((BMI5CAT = 2){1}), SUM((BMI5CAT = 3){1}), SUM((BMI5CAT = 4){1}),
+                            SUM((BMI5CAT <> 1){1})
+                            FROM {0}
+                            GROUP BY SEX, PACAT, SMOKER, AGEG5YR""".format(TableName,CountString))
+        CountDF = pd.DataFrame(cur.fetchall(),columns=RiskIndex+CountColumns).set_index(RiskIndex)
+        cur.close()
+        DataUser.CloseConnection(Connect)
+
+    CountDF = CountDF.astype(float if Weighted else int)
+    RateDF = CountDF[CountColumns[:3]].div(CountDF['Reference'],axis=0)
+    return pd.concat({'Count': CountDF,'Rate': RateDF},axis=1).sort_index()
+
+def RiskTable1(DataUser, Source='database'):
 
     # General notes about the data.
     #   1. There are just to enough under weight people for statistical analysis (less
@@ -22,78 +142,422 @@ def RiskTable1(DataUser):
     # BMI, the data only allows for forward propogation. I can determine the risk of a
     # normal person becoming overweight, but not the chance that an overweight person
     # acheives a normal body weight.
+    #
+    # The counts for both sexes and every BMI category are computed together (see
+    # RiskTable) and the tables are sliced from the result.
+    RiskDF = RiskTable(DataUser,Source)
 
     # 1. Male table
-    #   A. Normal weight
-    cur.execute('USE healthdata')
-    cur.execute("""SELECT CONCAT(PACAT, '-', SMOKER) AS RISK_FACT, 
-                        AGEG5YR, COUNT(*) 
-                        FROM brfssdata
-                        WHERE BMI5CAT = '2' AND SEX = '1'
-                        GROUP BY PACAT, SMOKER, AGEG5YR""")
-    CountList = cur.fetchall()
-    CountColumns = ['RISK_FACT','AGEGRP','Count']
-    CountDF = pd.DataFrame(CountList,columns=CountColumns)
-    
-    CountPTA = pd.pivot(CountDF,index='RISK_FACT',columns='AGEGRP')
-    CountPTA.fillna(0,inplace=True)
-    CountPTA = CountPTA.astype(int)
-
-    #   B. Over weight
-    cur.execute("""SELECT CONCAT(PACAT, '-', SMOKER) AS RISK_FACT, 
-                        AGEG5YR, COUNT(*) 
-                        FROM brfssdata
-                        WHERE BMI5CAT = '3' AND SEX = '1'
-                        GROUP BY PACAT, SMOKER, AGEG5YR""")
-    CountList = cur.fetchall()
-    CountColumns = ['RISK_FACT','AGEGRP','Count']
-    CountDF = pd.DataFrame(CountList,columns=CountColumns)
-    
-    CountPTB = pd.pivot(CountDF,index='RISK_FACT',columns='AGEGRP')
-    CountPTB.fillna(0,inplace=True)
-    CountPTB = CountPTB.astype(int)
-
-    #   C. Obese
-    cur.execute("""SELECT CONCAT(PACAT, '-', SMOKER) AS RISK_FACT, 
-                        AGEG5YR, COUNT(*) 
-                        FROM brfssdata
-                        WHERE BMI5CAT = '4' AND SEX = '1'
-                        GROUP BY PACAT, SMOKER, AGEG5YR""")
-    CountList = cur.fetchall()
-    CountColumns = ['RISK_FACT','AGEGRP','Count']
-    CountDF = pd.DataFrame(CountList,columns=CountColumns)
-    
-    CountPTC = pd.pivot(CountDF,index='RISK_FACT',columns='AGEGRP')
-    CountPTC.fillna(0,inplace=True)
-    CountPTC = CountPTC.astype(int)
-
-    #   D. Reference (exclude underweight)
-    cur.execute("""SELECT CONCAT(PACAT, '-', SMOKER) AS RISK_FACT, 
-                        AGEG5YR, COUNT(*) 
-                        FROM brfssdata
-                        WHERE BMI5CAT <> '1' AND SEX = '1'
-                        GROUP BY PACAT, SMOKER, AGEG5YR""")
-    CountList = cur.fetchall()
-    CountColumns = ['RISK_FACT','AGEGRP','Count']
-    CountDF = pd.DataFrame(CountList,columns=CountColumns)
-    
-    CountPTR = pd.pivot(CountDF,index='RISK_FACT',columns='AGEGRP')
-    CountPTR.fillna(0,inplace=True)
-    CountPTR = CountPTR.astype(int)
-
-    RatePTA = CountPTA.div(CountPTR)
-    RatePTB = CountPTB.div(CountPTR)
-    RatePTC = CountPTC.div(CountPTR)
+    #   A. Normal weight, B. Over weight and C. Obese as a fraction of the
+    #   reference (exclude underweight)
+    RatePTA = RiskDF.loc[1,('Rate','Normal')].unstack('AGEGRP')
+    RatePTB = RiskDF.loc[1,('Rate','Overweight')].unstack('AGEGRP')
+    RatePTC = RiskDF.loc[1,('Rate','Obese')].unstack('AGEGRP')
 
     print(RatePTA)
     print(RatePTB)
     print(RatePTC)
-    cur.close()
-    DataUser.CloseConnection(Connect)
+
+def CodeArray(Values, Column):
+
+    """
+        Converts the values of one survey field to the array type used by the
+        in-memory models: int8 codes, or float64 for the survey weight (LLCPWT)
+        with missing weights set to 0 so they do not count in weighted estimates.
+        Missing fields (NULL in Table brfssdata, read as NaN) are given the
+        code -1, the same as in the local cache.
+    """
+    import numpy as np
+
+    if Column == 'LLCPWT':
+        return np.nan_to_num(np.asarray(Values,dtype=np.float64))
+    Values = np.asarray(Values)
+    if Values.dtype.kind == 'f':
+        Values = np.nan_to_num(Values,nan=-1)
+    return Values.astype(np.int8)
+
+def CodeBlocks(DataUser, Columns, Source='cache', BlockSize=100000, RandomGen=None):
+
+    """
+        Generator that reads the survey fields in Columns BlockSize records at
+        a time so the data never has to be held in memory at once. Each block 
+        is a dictionary of arrays, one for each column (see CodeArray). Source
+        is 'cache' for the local copy written by HealthDatabase.ExtractData, 
+        which is read one file and row group at a time, or 'database' for 
+        Table brfssdata, which is streamed from the server with an unbuffered
+        cursor.
+        The records are stored year by year. If RandomGen (a NumPy random
+        generator) is given, the blocks are read in a random order instead:
+        each block of the cache is made of row groups (one for each block
+        written by ExtractData) drawn from every year, and the records of
+        brfssdata are read in ranges of BlockSize participant IDs taken in a
+        random order.
+    """
+    import os
+    import glob
+    import numpy as np
+
+    if Source == 'cache':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import HealthDatabase
+
+        CacheFiles = sorted(glob.glob(os.path.join(HealthDatabase.CacheDir,'brfss*.parquet')))
+        if RandomGen is None:
+            for CacheFile in CacheFiles:
+                for CacheBatch in pq.ParquetFile(CacheFile).iter_batches(batch_size=BlockSize,columns=list(Columns)):
+                    yield {Column: CodeArray(CacheBatch.column(Column).to_numpy(zero_copy_only=False),Column)
+                           for Column in Columns}
+            return
+
+        # Row groups are added to the block until it holds BlockSize records.
+        CacheParquet = [pq.ParquetFile(CacheFile) for CacheFile in CacheFiles]
+        RowGroups = [[Parquet,Group] for Parquet in CacheParquet for Group in range(Parquet.num_row_groups)]
+        BlockTables = []
+        BlockRec = 0
+        for k in RandomGen.permutation(len(RowGroups)):
+            Parquet, Group = RowGroups[k]
+            BlockTables.append(Parquet.read_row_group(Group,columns=list(Columns)))
+            BlockRec += BlockTables[-1].num_rows
+            if BlockRec >= BlockSize:
+                CacheTable = pa.concat_tables(BlockTables)
+                yield {Column: CodeArray(CacheTable.column(Column).to_numpy(),Column) for Column in Columns}
+                BlockTables = []
+                BlockRec = 0
+        if len(BlockTables) > 0:
+            CacheTable = pa.concat_tables(BlockTables)
+            yield {Column: CodeArray(CacheTable.column(Column).to_numpy(),Column) for Column in Columns}
+        return
+
+    Connect = DataUser.OpenConnection()
+    try:
+        cur = Connect.cursor(buffered=False)
+        cur.execute('USE healthdata')
+        if RandomGen is not None:
+            cur.execute('SELECT MIN(PrtcpntID), MAX(PrtcpntID) FROM brfssdata')
+            FirstID, LastID = cur.fetchone()
+            if FirstID is None:
+                cur.close()
+                return
+            for Range in RandomGen.permutation(-(-(LastID - FirstID + 1) // BlockSize)):
+                Start = FirstID + int(Range)*BlockSize
+                cur.execute('SELECT {} FROM brfssdata WHERE PrtcpntID BETWEEN ? AND ?'.format(', '.join(Columns)),
+                            (Start,Start + BlockSize - 1))
+                DataBlock = cur.fetchall()
+                if len(DataBlock) > 0:
+                    BlockArray = np.array(DataBlock,dtype=np.float64).reshape(-1,len(Columns))
+                    yield {Column: CodeArray(BlockArray[:,k],Column) for k, Column in enumerate(Columns)}
+            cur.close()
+            return
+        cur.execute('SELECT {} FROM brfssdata'.format(', '.join(Columns)))
+        DataBlock = cur.fetchmany(BlockSize)
+        while len(DataBlock) > 0:
+            BlockArray = np.array(DataBlock,dtype=np.float64).reshape(-1,len(Columns))
+            yield {Column: CodeArray(BlockArray[:,k],Column) for k, Column in enumerate(Columns)}
+            DataBlock = cur.fetchmany(BlockSize)
+        cur.close()
+    finally:
+        DataUser.CloseConnection(Connect)
+
+def LoadCodes(DataUser, Columns, Source='cache', FetchSize=100000):
+
+    """
+        Loads the survey fields in Columns once so that many tables can be
+        computed in memory. Returns a dictionary of arrays, one for each column
+        (see CodeArray). Source is 'cache' for the local copy written by
+        HealthDatabase.ExtractData or 'database' for Table brfssdata, which is
+        read FetchSize records at a time (see CodeBlocks).
+    """
+    import numpy as np
+
+    if Source == 'cache':
+        CodeDF = ReadCache(list(Columns))
+        return {Column: CodeArray(CodeDF[Column].to_numpy(),Column) for Column in Columns}
+
+    BlockList = list(CodeBlocks(DataUser,Columns,Source,FetchSize))
+    if len(BlockList) == 0:
+        return {Column: CodeArray(np.zeros(0),Column) for Column in Columns}
+    return {Column: np.concatenate([Block[Column] for Block in BlockList]) for Column in Columns}
+
+def ContingencyCube(Codes, Factors, Outcomes, ChunkSize=100000, Weights=None):
+
+    """
+        Counts the respondents in every cell of SEX (1-2) x AGEG5YR (1-13) x
+        factor level (1-4) x outcome code (1-4) for every pair of a factor in
+        Factors and an outcome in Outcomes. Codes is a dictionary of int8 arrays
+        (see LoadCodes). Each cell of every table is given a position in one
+        combined index so all of the tables are counted with a single
+        np.bincount. The records are counted ChunkSize at a time to limit the
+        size of the index. Returns an array of counts with the shape
+        (factor, outcome, SEX, AGEG5YR, level, code).
+        If Weights is given (an array with one weight for each record), the sum
+        of the weights and the sum of the squared weights in each cell are 
+        counted from the same index and returned with the counts as
+        (Counts, WeightSum, WeightSqSum).
+    """
+    import numpy as np
+
+    CubeShape = (len(Factors),len(Outcomes),2,13,4,4)
+    NumBins = int(np.prod(CubeShape))
+    CountArray = np.zeros(NumBins,dtype=np.int64)
+    if Weights is not None:
+        WeightSum = np.zeros(NumBins)
+        WeightSqSum = np.zeros(NumBins)
+
+    # Offset of the first cell of each (factor, outcome) table in the combined index
+    PairBase = (np.arange(len(Factors))[:,None]*len(Outcomes) + np.arange(len(Outcomes))[None,:])[:,:,None]*(2*13)
+
+    NumRec = len(Codes['SEX'])
+    for Start in range(0,NumRec,ChunkSize):
+        Stop = min(Start + ChunkSize,NumRec)
+        GroupIdx = (Codes['SEX'][Start:Stop].astype(np.intp) - 1)*13 + Codes['AGEG5YR'][Start:Stop] - 1
+        FactorIdx = np.stack([Codes[Factor][Start:Stop] for Factor in Factors]).astype(np.intp) - 1
+        OutcomeIdx = np.stack([Codes[Outcome][Start:Stop] for Outcome in Outcomes]).astype(np.intp) - 1
+        CellIdx = ((PairBase + GroupIdx[None,None,:])*4 + FactorIdx[:,None,:])*4 + OutcomeIdx[None,:,:]
+        CellIdx = CellIdx.ravel()
+        CountArray += np.bincount(CellIdx,minlength=NumBins)
+        if Weights is not None:
+            # The index repeats the records once for each (factor, outcome) pair.
+            ChunkWeight = np.tile(Weights[Start:Stop],len(Factors)*len(Outcomes))
+            WeightSum += np.bincount(CellIdx,weights=ChunkWeight,minlength=NumBins)
+            WeightSqSum += np.bincount(CellIdx,weights=ChunkWeight**2,minlength=NumBins)
+    if Weights is not None:
+        return CountArray.reshape(CubeShape), WeightSum.reshape(CubeShape), WeightSqSum.reshape(CubeShape)
+    return CountArray.reshape(CubeShape)
+
+def CohortTable(DataUser, Source='cache', Factors=None, Outcomes=None, Codes=None):
+
+    """
+        Cross tabulates every factor in Factors (default the lifestyle factors
+        BMI5CAT, SMOKER, RFDRHV and PACAT) against every outcome in Outcomes 
+        (default the health conditions in HealthDatabase.CubeOutcomes), split 
+        by sex and age group (see ContingencyCube). Codes loaded earlier with
+        LoadCodes can be passed to avoid reading the data again.
+        Returns a data frame indexed by (FACTOR, OUTCOME, SEX, AGEGRP, LEVEL)
+        with the number of respondents, the number of positive cases, the rate
+        and the relative risk: the rate divided by the rate at the reference
+        level of the factor for the same outcome, sex and age group. The 
+        reference levels are normal weight, never smoked, not a heavy drinker 
+        and highly active.
+    """
+    import numpy as np
+    import pandas as pd
+    import HealthDatabase
+
+    ReferenceLevel = {'BMI5CAT': 2,'SMOKER': 4,'RFDRHV': 1,'PACAT': 1}
+    PositiveCode = dict(HealthDatabase.CubeOutcomes)
+    if Factors is None: Factors = list(ReferenceLevel)
+    if Outcomes is None: Outcomes = list(PositiveCode)
+    if Codes is None: Codes = LoadCodes(DataUser,['SEX','AGEG5YR'] + Factors + Outcomes,Source)
+
+    # 1. Counts for every cell, then the respondents and positive cases for each
+    #    factor level. Shape (factor, outcome, SEX, AGEG5YR, level).
+    CountArray = ContingencyCube(Codes,Factors,Outcomes)
+    Respondents = CountArray.sum(axis=5)
+    Cases = np.stack([CountArray[:,k,...,PositiveCode[Outcome]-1] for k, Outcome in enumerate(Outcomes)],axis=1)
+
+    # 2. Rates and relative risk against the reference level of each factor
+    with np.errstate(divide='ignore',invalid='ignore'):
+        Rate = Cases/Respondents
+        RefRate = np.stack([Rate[k,...,ReferenceLevel[Factor]-1] for k, Factor in enumerate(Factors)])
+        RelativeRisk = Rate/RefRate[...,None]
+
+    CohortIndex = pd.MultiIndex.from_product([Factors,Outcomes,[1,2],range(1,14),range(1,5)],
+                                             names=['FACTOR','OUTCOME','SEX','AGEGRP','LEVEL'])
+    return pd.DataFrame({'Respondents': Respondents.ravel(),'Cases': Cases.ravel(),'Rate': Rate.ravel(),
+                         'RelativeRisk': RelativeRisk.ravel()},index=CohortIndex)
+
+def WeightedCohortTable(DataUser, Source='cache', Factors=None, Outcomes=None, Codes=None):
+
+    """
+        Survey weighted version of CohortTable. Each respondent counts with
+        their final survey weight (LLCPWT), so the rates are estimates for the
+        population rather than the sample. The weighted counts and their 
+        variance are computed for every cell in the same pass over the data
+        (see ContingencyCube). Returns a data frame indexed by (FACTOR, OUTCOME,
+        SEX, AGEGRP, LEVEL) with the number of respondents, the weighted 
+        population and cases, the weighted rate, its standard error and the
+        relative risk against the reference level of each factor.
+        The variance of each rate R = sum(w*y)/sum(w) is the Taylor series
+        (linearization) estimate for a with-replacement sample where each
+        respondent is a primary sampling unit:
+            Var(R) = n/(n-1) * sum(w**2 * (y - R)**2) / sum(w)**2
+        The strata and PSU of the survey design are not stored, so the standard
+        errors do not include the design effect of the clustering.
+    """
+    import numpy as np
+    import pandas as pd
+    import HealthDatabase
+
+    ReferenceLevel = {'BMI5CAT': 2,'SMOKER': 4,'RFDRHV': 1,'PACAT': 1}
+    PositiveCode = dict(HealthDatabase.CubeOutcomes)
+    if Factors is None: Factors = list(ReferenceLevel)
+    if Outcomes is None: Outcomes = list(PositiveCode)
+    if Codes is None: Codes = LoadCodes(DataUser,['SEX','AGEG5YR','LLCPWT'] + Factors + Outcomes,Source)
+
+    # 1. Counts, weights and squared weights for every cell. Sum over the
+    #    outcome codes for each factor level and take the positive code for the
+    #    cases. Shape (factor, outcome, SEX, AGEG5YR, level).
+    CountArray, WeightSum, WeightSqSum = ContingencyCube(Codes,Factors,Outcomes,Weights=Codes['LLCPWT'])
+    Respondents = CountArray.sum(axis=5)
+    Population = WeightSum.sum(axis=5)
+    PopulationSq = WeightSqSum.sum(axis=5)
+    Cases = np.stack([WeightSum[:,k,...,PositiveCode[Outcome]-1] for k, Outcome in enumerate(Outcomes)],axis=1)
+    CasesSq = np.stack([WeightSqSum[:,k,...,PositiveCode[Outcome]-1] for k, Outcome in enumerate(Outcomes)],axis=1)
+
+    # 2. Weighted rates and their variance. y is 0 or 1, so
+    #    sum(w**2 * (y - R)**2) = sum(w**2 * y)*(1 - 2R) + R**2 * sum(w**2)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        Rate = Cases/Population
+        Variance = Respondents/(Respondents - 1)*(CasesSq*(1 - 2*Rate) + Rate**2*PopulationSq)/Population**2
+        Variance[Respondents < 2] = np.nan
+        RefRate = np.stack([Rate[k,...,ReferenceLevel[Factor]-1] for k, Factor in enumerate(Factors)])
+        RelativeRisk = Rate/RefRate[...,None]
+
+    CohortIndex = pd.MultiIndex.from_product([Factors,Outcomes,[1,2],range(1,14),range(1,5)],
+                                             names=['FACTOR','OUTCOME','SEX','AGEGRP','LEVEL'])
+    return pd.DataFrame({'Respondents': Respondents.ravel(),'Population': Population.ravel(),
+                         'Cases': Cases.ravel(),'Rate': Rate.ravel(),'StdErr': np.sqrt(np.maximum(Variance,0)).ravel(),
+                         'RelativeRisk': RelativeRisk.ravel()},index=CohortIndex)
+
+def DesignMatrix(Codes, Variables):
+
+    """
+        Builds the sparse one-hot design matrix for a block of survey codes.
+        Variables is a list of [field, number of levels]. The first column is
+        the intercept followed by one column for each level of each field, so
+        every record has exactly one non-zero entry per field and the matrix
+        is built directly in CSR form from the codes. Returns the matrix and
+        the list of column names ('Intercept', 'SEX=1', 'SEX=2', ...).
+    """
+    import numpy as np
+    import scipy.sparse as sp
+
+    NumRec = len(Codes[Variables[0][0]])
+    ColumnNames = ['Intercept']
+    ColList = [np.zeros(NumRec,dtype=np.intp)]
+    for Variable, Levels in Variables:
+        ColList.append(len(ColumnNames) - 1 + Codes[Variable].astype(np.intp))
+        ColumnNames += ['{}={}'.format(Variable,Level) for Level in range(1,Levels+1)]
+
+    # The entries of each record are stored together, one row after another.
+    Indices = np.stack(ColList,axis=1).ravel()
+    IndPtr = np.arange(0,len(Indices) + 1,len(ColList))
+    Design = sp.csr_matrix((np.ones(len(Indices)),Indices,IndPtr),shape=(NumRec,len(ColumnNames)))
+    return Design, ColumnNames
+
+def RiskModel(DataUser, Outcome='CVDINFR', Source='cache', Factors=None, Epochs=5, BatchSize=1000,
+              BlockSize=100000, LearningRate=1.0, L2=1e-6, Seed=0):
+
+    """
+        Fits a logistic regression model of the risk of Outcome given the
+        lifestyle factors in Factors (default BMI5CAT, SMOKER, RFDRHV and PACAT),
+        sex and age group. The model is trained with minibatch stochastic
+        gradient descent while the data is streamed BlockSize records at a time
+        (see CodeBlocks), so the memory used does not depend on the number of
+        years loaded. The blocks are read in a new random order each epoch, so
+        the last steps are not all taken on the last years loaded (see
+        CodeBlocks). Each block is converted to a sparse one-hot design matrix
+        (see DesignMatrix) and split into shuffled minibatches of BatchSize
+        records. The step size is LearningRate/sqrt(epoch) and L2 is the
+        strength of the ridge penalty.
+        Every level of each field has a coefficient while training, which keeps
+        the gradient steps well conditioned. The coefficients reported are the
+        differences from the reference level of each field, so they are log
+        odds ratios against male, 18 - 24, normal weight, never smoked, not a
+        heavy drinker and highly active; the intercept is the log odds for 
+        that reference respondent.
+        Prints the average log loss of each epoch and returns a data frame with
+        the number of records, coefficient and odds ratio for each level.
+    """
+    import numpy as np
+    import pandas as pd
+    import HealthDatabase
+
+    # Number of valid codes for each field (see HealthDatabase.CleanData) and
+    # the reference level that the odds ratios are measured against.
+    ReferenceLevel = {'SEX': 1,'AGEG5YR': 1,'BMI5CAT': 2,'SMOKER': 4,'RFDRHV': 1,'PACAT': 1}
+    FieldLevels = {'SEX': 2,'AGEG5YR': 13,'BMI5CAT': 4,'SMOKER': 4,'RFDRHV': 4,'PACAT': 4}
+    if Factors is None: Factors = ['BMI5CAT','SMOKER','RFDRHV','PACAT']
+    Variables = [[Field,FieldLevels[Field]] for Field in ['SEX','AGEG5YR'] + Factors]
+    PositiveCode = dict(HealthDatabase.CubeOutcomes)[Outcome]
+
+    RandomGen = np.random.default_rng(Seed)
+    Coef = None
+    for Epoch in range(Epochs):
+        StepSize = LearningRate/np.sqrt(1 + Epoch)
+        EpochLoss = 0.
+        EpochRec = 0
+        for Codes in CodeBlocks(DataUser,[Field for Field, Levels in Variables] + [Outcome],Source,BlockSize,
+                                RandomGen):
+            Design, ColumnNames = DesignMatrix(Codes,Variables)
+            Target = (Codes[Outcome] == PositiveCode).astype(np.float64)
+            if Coef is None:
+                Coef = np.zeros(len(ColumnNames))
+                LevelCount = np.zeros(len(ColumnNames),dtype=np.int64)
+            if Epoch == 0: LevelCount += np.asarray(Design.sum(axis=0),dtype=np.int64).ravel()
+
+            # Shuffle the records in the block and take one step per minibatch.
+            Order = RandomGen.permutation(len(Target))
+            for Start in range(0,len(Order),BatchSize):
+                Batch = Order[Start:Start+BatchSize]
+                BatchDesign = Design[Batch]
+                Prob = 1./(1. + np.exp(-(BatchDesign @ Coef)))
+                ProbClip = np.clip(Prob,1e-12,1 - 1e-12)
+                EpochLoss -= np.sum(Target[Batch]*np.log(ProbClip) + (1 - Target[Batch])*np.log(1 - ProbClip))
+                EpochRec += len(Batch)
+                Gradient = BatchDesign.T @ (Prob - Target[Batch])/len(Batch) + L2*Coef
+                Coef -= StepSize*Gradient
+        if EpochRec == 0:
+            print('No survey data found for the risk model.')
+            return None
+        print('Epoch {} log loss {:.5f}'.format(Epoch+1,EpochLoss/EpochRec))
+
+    # Express the coefficients against the reference level of each field. Levels
+    # without any records are left out.
+    ColumnIdx = {Name: k for k, Name in enumerate(ColumnNames)}
+    RefIdx = [ColumnIdx['{}={}'.format(Field,ReferenceLevel[Field])] for Field, Levels in Variables]
+    ModelRows = [['Intercept',LevelCount[0],Coef[0] + Coef[RefIdx].sum()]]
+    for (Field, Levels), Ref in zip(Variables,RefIdx):
+        for Level in range(1,Levels+1):
+            k = ColumnIdx['{}={}'.format(Field,Level)]
+            if k != Ref and LevelCount[k] > 0:
+                ModelRows.append([ColumnNames[k],LevelCount[k],Coef[k] - Coef[Ref]])
+    ModelDF = pd.DataFrame(ModelRows,columns=['Level','Records','Coefficient']).set_index('Level')
+    ModelDF['OddsRatio'] = np.exp(ModelDF['Coefficient'])
+    return ModelDF
 
 def ModelData(DataUser):
 
+    import os
+    import glob
     import pandas as pd
     import mariadb
+    import HealthDatabase
+
+    # Use the local cache of the survey data when it has been written. Otherwise
+    # the summary counts in Table brfsscube are used.
+    if len(glob.glob(os.path.join(HealthDatabase.CacheDir,'brfss*.parquet'))) > 0:
+        RiskTable1(DataUser,Source='cache')
+    else:
+        RiskTable1(DataUser,Source='cube')
+
+def RiskModelData(DataUser):
+
+    """
+        Prints the logistic regression model of the risk of a heart attack
+        given the lifestyle factors, sex and age group (see RiskModel). The
+        model is trained on every survey record, read from the local cache when
+        it has been written and otherwise streamed from Table brfssdata once per
+        epoch, so it takes much longer than the tables of ModelData.
+    """
+    import os
+    import glob
+    import HealthDatabase
 
-    RiskTable1(DataUser)
\ No newline at end of file
+    if len(glob.glob(os.path.join(HealthDatabase.CacheDir,'brfss*.parquet'))) > 0:
+        Source = 'cache'
+    else:
+        print('No local cache of the survey data. The records are read from the database for each epoch.')
+        Source = 'database'
+    print(RiskModel(DataUser,'CVDINFR',Source))
@@ -1,7 +1,84 @@
+# Root of the CFOUR output tree read by UpdateDatabase. The program assumes a
+# directory structure as follows:
+#   molecules/{Compound Label}/{Calculation Label}/{Basis set Label}
+MoleculeDir = 'molecules\\'
+# Archives of finished CFOUR runs, one per molecule ({Compound Label}.tar.gz,
+# ...), can be placed in MoleculeDir instead of the unpacked directory.
+ArchiveTypes = ['.tar','.tar.gz','.tgz','.tar.bz2','.tar.xz','.zip']
+
+# Types of calculations and basis sets in the directory structure.
+# General note: ccsdt is a convient short hand for CCSD(T). It is NOT CCSDT.
+CalcTypes = ['scf','mp2','ccsd','ccsdt']
+BasisSets = ['pvdz','pvtz','pvqz','pcvdz','pcvtz','pcvqz']
+
+# Row of a CoordAccumulator: integer keys of the atom and its coordinates.
+CoordType = [('MoleIndex','<i4'),('CalcIndex','i1'),('BasisIndex','i1'),('AtomMolNum','<i4'),('AtomicNum','u1'),
+             ('XCoord','<f8'),('YCoord','<f8'),('ZCoord','<f8')]
+
+# Unique keys on the natural key of each table: {table: [key name, columns, primary key]}.
+# Rows whose natural key is already in the database are skipped by the server
+# (INSERT IGNORE), so only the new data is inserted by an update (see MigrateDatabase).
+UniqueKeys = {'molecules': ['uk_mole_label',['MoleLabel'],'MoleID'],
+              'calculations': ['uk_calc_mole',['MoleID','CalcType','BasisSet'],'CalcID'],
+              'atomsinmolecules': ['uk_atom_mole',['MoleID','AtomMolNum'],'AtomID'],
+              'cartcoords': ['uk_coord_calc',['CalcID','AtomID'],'CoordID']}
+
+# Local SQLite file with the manifest of the CFOUR output files already parsed
+# and loaded by UpdateDatabase and the cache of their parsed contents (see
+# OpenManifest).
+ManifestFile = 'cfourmanifest.sqlite'
+
+# Keywords read from the CFOUR prp.dat files (see ScanFile). For each field:
+# [keyword, line offset, parser]. The value is parsed from the line that
+# contains the keyword (offset 0) or from the line after it (offset 1). A field
+# found more than once is read from its last occurence, except the fields in
+# FirstFields.
+CalcKeywords = {
+    # The molecule's point group. This can be important for molecules with only
+    # a few atoms, but will be less important for larger ones.
+    'MolePntGrp': ['The full molecular point group is',0,lambda line: line[-6:-3]],
+    'CompPntGrp': ['The computational point group is',0,lambda line: line[-6:-3]],
+    # Multiplicity (atoms)
+    'Multiplicity': ['IMULTP',0,lambda line: int(line[48:52])],
+    # The number of basis functions.
+    'NumBasFunc': ['basis functions',0,lambda line: int(line[12:17])],
+    # The SCF energy. This value is computed for each type of calculation.
+    'SCFEnergy': ['E(SCF)=',0,lambda line: float(line.split()[1])],
+    # MP2 energy. This value is computed during MP2, CCSD, and CCSD(T) calculations.
+    'MP2Energy': ['Total MP2 energy',0,lambda line: float(line.split()[4])],
+    # CCSD energy. This value is computed during CCSD and CCSD(T) calculations.
+    # It is found in two different forms.
+    'CCSDEnergy': ['CCSD energy  ',0,lambda line: float(line.split()[4] if 'Total' in line else line.split()[2])],
+    # CCSD(T) energy.
+    'CCSDTEnergy': ['CCSD(T) energy  ',0,lambda line: float(line.split()[2])],
+    # Rotational constants. The key word is MHz and the constants are on the next
+    # line. Constants appear twice in the output file; only the first occurence
+    # is read (see FirstFields). Linear molecules such as H2, CO2, and C2H2 have
+    # two constants.
+    'RotConsts': ['MHz',1,lambda line: [float(Const) for Const in line.split()]],
+    # The time required for the calculation. This time will be used to group
+    # molecules.
+    'CalcTime': ['This computation required',0,lambda line: float(line.split()[3])]}
+# Fields read from their first occurence in the file.
+FirstFields = ['RotConsts']
+# Field on the last line of the output. Reading stops once it has been read.
+EndField = 'CalcTime'
+
+# Fields read from the prp.dat files of molecules and atoms. Energies not
+# computed by the method of the calculation default to 0.
+MoleculeFields = ['MolePntGrp','CompPntGrp','NumBasFunc','SCFEnergy','MP2Energy','CCSDEnergy','CCSDTEnergy',
+                  'RotConsts','CalcTime']
+AtomFields = ['Multiplicity','NumBasFunc','SCFEnergy','MP2Energy','CCSDEnergy','CCSDTEnergy','CalcTime']
+# Compiled keyword scanners for each list of fields (see KeywordScanner).
+KeywordScanners = {}
+# Archive kept open by OpenArchive in this process.
+OpenArchives = {}
+
 def UpdateAtomData(DataUser,AtomData):
 
     import mariadb
     import pandas as pd
+    import DatabaseTools
     
     # Insert new calculation information into calculation table
     #print ('Updating molecular data into TABLE calculations')
@@ -31,19 +108,17 @@ def UpdateAtomData(DataUser,AtomData):
     # 5. Clean data: remove current molecules currently in the database from data frame.
     #    Drop label and compound columns from dataframe.
     NewAtomDataframe = AtomDataframe[~AtomDataframe['Atom'].isin(CurLabel)]
-    AtomList = NewAtomDataframe[AtomDataColumns[2:]].values.tolist()
     # 6. If new data exists:
-    if len(AtomList) > 0:
-        # A. Create string to add data
-        DatabaseAtomString = UpdateDatabaseQuery(AtomList,AtomDataColumns[2:],'atomenergy')
-        # B. SQL query
+    NewAtomCount = 0
+    if len(NewAtomDataframe) > 0:
+        # Insert the columns of the data frame (see DatabaseTools.BulkInsert)
         try:
-            cur.execute(DatabaseAtomString)
+            NewAtomCount = DatabaseTools.BulkInsert(Connection,'atomenergy',NewAtomDataframe,AtomDataColumns[2:])[0]
         except mariadb.Error as e4:
             print('Error testing MariaDB Database Table element: {error}'.format(error=e4))
     cur.close()
     DataUser.CloseConnection(Connection)
-    return len(AtomList)
+    return NewAtomCount
 
 def ExtractCalcAtom():
 
@@ -52,77 +127,33 @@ def ExtractCalcAtom():
     # dihedral angles that differ based on the calculation method. All the data of interest
     # is included in the CCSD(T) output.
 
-    import os.path
+    import pandas as pd
 
-    # Lists of types of calculations and basis sets
+    # Lists of types of calculations
     # General note: ccsdt is a convient short hand for CCSD(T). It is NOT CCSDT.
     CalcList = ['ccsdt']
-    BasisList = ['pvdz','pvtz','pvqz','pcvdz','pcvtz','pcvqz']
-    #NanoBasis = ['pvqz','pcvdz','pcvtz','pcvqz']
     DataList = []
-    # The goal of these tools is to be able to run them in multiple different places.
-    # For the moment, the program will assume a directory structure as follows:
-    #   molecules/{Compound Label}/{Calculation Label}/{Basis set Label}
-    CompDir = 'molecules\\'
-    # CompList is list of compounds. Extract data for each compound.  
-    #CompList = MoleculeDataframe['MoleLabel'].values.tolist()
+    # CompList is list of compounds. Extract data for each compound. Atoms are
+    # read for every basis set, as for the molecules of the 'nano' group, from
+    # their directory or archive in MoleculeDir (see WalkCalculations).
     CompList = ['h','b','c','n','o','f','al','si','p','s','cl']
-    #CompGroup = MoleculeDataframe['MoleGroup'].values.tolist()
+    AtomDataframe = pd.DataFrame({'MoleLabel': CompList, 'MoleGroup': 'nano'})
     Count = 0
-    for i in range(len(CompList)):
-        # Compound subdirectory if it exists
-        CompPath = CompDir + CompList[i] + '\\'
-        if not(os.path.isdir(CompPath)): continue
-        for calc in CalcList:
-            # Calculation subdirectory if it exists
-            CalcPath = CompPath + calc + '\\'
-            if not(os.path.isdir(CalcPath)): continue
-            for basis in BasisList:
-                # Basis set subdirectory if it exists
-                BasisPath = CalcPath + basis + '\\'
-                if not(os.path.isdir(BasisPath)): continue
-                # Data file if it exists
-                DataFileName = BasisPath + 'prp.dat'
-                if os.path.exists(DataFileName):
-                    # Open data file for reading
-                    DataFile = open(DataFileName,'r')
-                    # Initialize values for energy.
-                    Count += 1
-                    if (Count % 20) == 0: print('*',end='') 
-                    # Read each line of the data file
-                    for line in DataFile:
-                        # Extract multiplicity
-                        if 'IMULTP' in line:
-                            Multiplicity = int(line[48:52])
-                        # Extract the number of basis functions.
-                        if 'basis functions' in line:
-                            NumBasFunc = int(line[12:17])
-                        # Extract the SCF energy. This value is computed for each type of 
-                        # calculation.
-                        if 'E(SCF)=' in line:
-                            SCFEnergy = float(line.split()[1])
-                        # Extract MP2 energy. This value is computed during MP2, CCSD, and 
-                        # CCSD(T) calculations.
-                        if 'Total MP2 energy' in line:
-                            MP2Energy = float(line.split()[4])
-                        # Extract CCSD energy. This value is computed during CCSD and CCSD(T)
-                        # calculations. It is found in two different forms.
-                        if 'CCSD energy  ' in line:
-                            if 'Total' in line:
-                                CCSDEnergy = float(line.split()[4])
-                            else:
-                                CCSDEnergy = float(line.split()[2])
-                        # Extract CCSD(T) energy.
-                        if 'CCSD(T) energy  ' in line:
-                            CCSDTEnergy = float(line.split()[2])
-                        if 'This computation required' in line:
-                            CalcTime = float(line.split()[3])
-                    # Create a unique label for each calculation
-                    label = '{COMP}:{CALC}/{BAS}'.format(COMP=CompList[i],CALC=calc,BAS=basis)
-                    # Combine the values and append them to DataList 
-                    CalcData = [label,CompList[i],basis,Multiplicity,SCFEnergy,
-                                MP2Energy,CCSDEnergy,CCSDTEnergy,CalcTime]
-                    DataList.append(CalcData)
+    for Comp, calc, basis, Files in WalkCalculations(AtomDataframe,CalcList):
+        # Data file if it exists
+        CalcEntry = Files.get('prp.dat')
+        if CalcEntry is None: continue
+        Count += 1
+        if (Count % 20) == 0: print('*',end='') 
+        Values = ScanFile(EntrySource(CalcEntry),AtomFields)
+        # Create a unique label for each calculation
+        label = '{COMP}:{CALC}/{BAS}'.format(COMP=Comp,CALC=calc,BAS=basis)
+        # Combine the values and append them to DataList 
+        CalcData = [label,Comp,basis,Values['Multiplicity'],Values['SCFEnergy'],
+                    Values.get('MP2Energy',0.),Values.get('CCSDEnergy',0.),Values.get('CCSDTEnergy',0.),
+                    Values['CalcTime']]
+        DataList.append(CalcData)
+    CloseArchives()
     #print(DataList)
     #print('Data extracted from {} files'.format(len(DataList)))
     return DataList
@@ -286,7 +317,8 @@ def CreateDatabase(DataUser):
             AcuteToxicity CHAR,
             Corrosive CHAR,
             Irritant CHAR,
-            Cyclic CHAR);"""
+            Cyclic CHAR,
+            CONSTRAINT `uk_mole_label` UNIQUE KEY (MoleLabel));"""
     try:
         cur.execute(DatabaseMolStringA)
         cur.execute(DatabaseMolStringB)
@@ -338,6 +370,7 @@ def CreateDatabase(DataUser):
             RotConstZ   REAL,
             CalcTime    REAL NOT NULL,
             MoleID      INT UNSIGNED NOT NULL,
+            CONSTRAINT `uk_calc_mole` UNIQUE KEY (MoleID, CalcType, BasisSet),
             CONSTRAINT `fk_mole_cals`
             FOREIGN KEY (MoleID) REFERENCES molecules (MoleID)
                 ON DELETE CASCADE
@@ -367,6 +400,7 @@ def CreateDatabase(DataUser):
             AtomicNum   INT NOT NULL,
             AtomMolNum  INT NOT NULL,
             MoleID      INT UNSIGNED NOT NULL,
+            CONSTRAINT `uk_atom_mole` UNIQUE KEY (MoleID, AtomMolNum),
             CONSTRAINT `fk_elem_atom`
                 FOREIGN KEY (AtomicNum) REFERENCES elements (AtomicNumber)
                 ON DELETE CASCADE
@@ -402,6 +436,7 @@ def CreateDatabase(DataUser):
             ZCoord      REAL NOT NULL,
             AtomID      INT UNSIGNED NOT NULL,
             CalcID      INT UNSIGNED NOT NULL,
+            CONSTRAINT `uk_coord_calc` UNIQUE KEY (CalcID, AtomID),
             CONSTRAINT `fk_calc_atom`
                 FOREIGN KEY (CalcID) REFERENCES calculations (CalcID)
                 ON DELETE CASCADE
@@ -486,354 +521,597 @@ def CreateDatabase(DataUser):
     cur.close()
     DataUser.CloseConnection(CreateConnection)
 
-def UpdateDatabaseQuery(DataTable, DataColumns, DataTableName):
+    # The calculations recorded in the local manifest of CFOUR files no longer
+    # exist, so every file is extracted again (from the parse cache) by the next
+    # update.
+    ClearManifest()
 
-    import math
+def MigrateDatabase(DataUser):
+
+    """
+        Adds the unique keys in UniqueKeys to the tables of a database created
+        before they were part of the schema. Duplicate rows are removed first,
+        keeping the row with the lowest primary key; the rows that depend on a
+        removed row are removed with it (ON DELETE CASCADE). If rows were
+        removed, the manifest is cleared so the next update inserts any missing
+        data again. Tables that already have their key are not changed.
+    """
+    import mariadb
+
+    KeyQuery = """SELECT COUNT(*) FROM information_schema.STATISTICS
+                WHERE TABLE_SCHEMA = 'moleculardata' AND TABLE_NAME = ? AND INDEX_NAME = ?"""
+    RemovedCount = 0
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE moleculardata')
+        # Parent tables come first, so their duplicates are removed with their
+        # dependent rows before the dependent tables are checked.
+        for TableName, [KeyName, KeyColumns, PrimaryKey] in UniqueKeys.items():
+            # 1. Check for the unique key
+            cur.execute(KeyQuery,(TableName,KeyName))
+            if cur.fetchone()[0] > 0:
+                continue
+            # 2. Remove the duplicates of the natural key
+            JoinString = ' AND '.join(['t.{0} = k.{0}'.format(Column) for Column in KeyColumns])
+            cur.execute('DELETE t FROM {0} AS t JOIN {0} AS k ON {1} AND t.{2} > k.{2}'.format(
+                TableName,JoinString,PrimaryKey))
+            print('Removed {} duplicate rows from Table {}.'.format(cur.rowcount,TableName))
+            RemovedCount += cur.rowcount
+            # 3. Add the unique key
+            cur.execute('ALTER TABLE {} ADD CONSTRAINT `{}` UNIQUE KEY ({})'.format(
+                TableName,KeyName,', '.join(KeyColumns)))
+            Connection.commit()
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e1:
+        print('Error adding unique keys: {error}'.format(error=e1))
+        return
 
-    DataString = ''
-    for DataRow in DataTable:
-        RowString = '('
-        for DataElement in DataRow:
-            if isinstance(DataElement,(float, int)):
-                if math.isnan(DataElement):
-                    RowString += "' ', "
-                else:
-                    RowString += str(DataElement) + ", "
-            elif isinstance(DataElement,str):
-                RowString += "'{}', ".format(DataElement)
-        DataString += RowString[:-2] + '),\n'
-
-    DataColumnsString = str(tuple(DataColumns)).replace("'","")
-    DatabaseString = 'INSERT INTO {} {} VALUES\n'.format(DataTableName,DataColumnsString)
-    DatabaseString += DataString[:-2] + ';'
-    return DatabaseString
-
-def UpdateCalcData(DataUser,MoleculeDataframe,CalcData):
+    if RemovedCount > 0:
+        ClearManifest()
+
+def UpdateCalcData(DataUser,MoleculeDataframe,CalcData,Report=None):
 
     import mariadb
     import pandas as pd
+    import DatabaseTools
     
     # Insert new calculation information into calculation table
     #print ('Updating molecular data into TABLE calculations')
-    # 1. Query calculations to get current calculations. Each combination of label, method
-    #    and basis is unique.
     Connection = DataUser.OpenConnection()
     cur = Connection.cursor()
     cur.execute('USE moleculardata')
-    cur.execute("""SELECT m.MoleLabel, c.CalcType, c.BasisSet
-                FROM calculations AS c 
-                JOIN molecules AS m
-                    ON m.MoleID = c.MoleID""")
-    CurrentCalcQuery = cur.fetchall()
-    # 2. Convert query to list of current Labels
-    CurLabel = list(map(lambda i: '{}:{}/{}'.format(CurrentCalcQuery[i][0],CurrentCalcQuery[i][1],CurrentCalcQuery[i][2]),range(len(CurrentCalcQuery))))
-    # 3. Transform calculation data into dataframe 
+    # 1. Transform calculation data into dataframe 
     CalcDataColumns = ['Label','Comp','CalcType','BasisSet','MolePntGrp','CompPntGrp',
                            'NumBasFunc','SCFEnergy','MP2Energy','CCSDEnergy','CCSDTEnergy',
                            'RotConstX','RotConstY','RotConstZ','CalcTime']
     CalcDataframe = pd.DataFrame(CalcData,columns=CalcDataColumns)
-    # 4. Add Secondary Key MoleID.
+    # 2. Add Secondary Key MoleID.
     cur.execute("SELECT MoleLabel, MoleID FROM molecules")
     MoleIDdict = dict(cur.fetchall())
     MoleIDList = list(map(lambda i: MoleIDdict[CalcData[i][1]],range(len(CalcData))))
     CalcDataframe['MoleID'] = MoleIDList
     CalcDataColumns.append('MoleID')
-    # 5. Clean data: remove current molecules currently in the database from data frame.
-    #    Drop label and compound columns from dataframe.
-    NewCalcDataframe = CalcDataframe[~CalcDataframe['Label'].isin(CurLabel)]
-    CalcList = NewCalcDataframe[CalcDataColumns[2:]].values.tolist()
-    # 6. If new data exists:
-    if len(CalcList) > 0:
-        # A. Create string to add data
-        DatabaseCalcString = UpdateDatabaseQuery(CalcList,CalcDataColumns[2:],'calculations')
-        # B. SQL query
+    # 3. If data exists:
+    NewCalcCount = 0
+    if len(CalcDataframe) > 0:
         try:
-            cur.execute(DatabaseCalcString)
+            # A. Calculations already in the database were parsed again because their
+            #    files were modified. They are updated with the new values, matched by
+            #    the unique key of the table (see UniqueKeys).
+            BatchLabels = sorted(set(CalcDataframe['Comp']))
+            cur.execute("""SELECT CONCAT(m.MoleLabel,':',c.CalcType,'/',c.BasisSet) AS Label
+                FROM calculations AS c 
+                JOIN molecules AS m
+                    ON m.MoleID = c.MoleID
+                WHERE m.MoleLabel IN ({})""".format(', '.join(['?']*len(BatchLabels))),tuple(BatchLabels))
+            CurrentCalcs = CalcDataframe['Label'].isin([Row[0] for Row in cur.fetchall()])
+            # B. Insert the columns of the data frame, without the label and compound
+            #    columns (see DatabaseTools.BulkInsert). Each combination of molecule,
+            #    method and basis is unique (uk_calc_mole), so calculations inserted
+            #    since the query above are skipped by the server.
+            Variables = DatabaseTools.ServerVariables(Connection)
+            NewCalcCount = DatabaseTools.BulkInsert(Connection,'calculations',CalcDataframe[~CurrentCalcs],
+                                                    CalcDataColumns[2:],Ignore=True,Report=Report,
+                                                    Variables=Variables)[0]
+            if CurrentCalcs.any():
+                DatabaseTools.BulkUpdate(Connection,'calculations',CalcDataframe[CurrentCalcs],
+                                         UniqueKeys['calculations'][1],CalcDataColumns[2:],Report=Report,
+                                         Variables=Variables)
         except mariadb.Error as e4:
             print('Error testing MariaDB Database Table atomenergy: {error}'.format(error=e4))
     cur.close()
     DataUser.CloseConnection(Connection)
-    return len(CalcList)
+    return NewCalcCount
     
-def UpdateCoordData(DataUser,MoleculeDataframe,AtomList,CoordList):
+def UpdateCoordData(DataUser,MoleculeDataframe,AtomList,CoordList,Report=None):
 
     import mariadb
+    import numpy as np
     import pandas as pd
+    import DatabaseTools
 
     Connection = DataUser.OpenConnection()
     cur = Connection.cursor()
+    Variables = None
     try:
         cur.execute('USE moleculardata')
         cur.execute("SELECT MoleLabel, MoleID FROM molecules")
         MoleIDdict = dict(cur.fetchall())
+        # The server variables used for both tables (see DatabaseTools.ServerVariables).
+        Variables = DatabaseTools.ServerVariables(Connection)
     except mariadb.Error as e:
         print('Error selecting data from Table molecules: {error}'.format(error=e))
 
     # Insert new calculation information into atomsInMolecules table
-    # 1. Query atomsInMolecule to get current calculations. Each combination of label and 
-    #    atom number in molecule (AtomMolNum) is unique.
     #print ('Updating molecular data into TABLE atomsinmolecules.')
-    try:
-        cur.execute("""SELECT m.MoleLabel, a.AtomMolNum
-                FROM atomsinmolecules AS a 
-                JOIN molecules AS m
-                    ON m.MoleID = a.MoleID""")
-        CurrentAIMQuery = cur.fetchall()
-    except mariadb.Error as e:
-        print('Error joining data from Tables atomsinmolecules and molecules: {error}'.format(error=e))
-    # 2. Convert query to list of current Labels in atomsInMolecules
-    CurAIMLabel = list(map(lambda i: '{}_{}'.format(CurrentAIMQuery[i][0],CurrentAIMQuery[i][1]),range(len(CurrentAIMQuery))))
-    #print(CurAIMLabel)
-    # 3. Transform data 
+    # 1. Transform data 
     AIMDataColumns = ['Label', 'Comp', 'AtomicNum', 'AtomMolNum']
     AIMDataframe = pd.DataFrame(AtomList,columns=AIMDataColumns)
     #print(AIMDataframe)
-    # 4. Add Secondary Key MoleID.
+    # 2. Add Secondary Key MoleID.
     AIMMoleIDList = list(map(lambda i: MoleIDdict[AtomList[i][1]],range(len(AtomList))))
     AIMDataframe['MoleID'] = AIMMoleIDList
     AIMDataColumns.append('MoleID')
     #print(AIMDataframe)
-    # 5. Clean data: remove current molecules currently in the database from data frame.
-    #    Drop label and compound columns from dataframe.
-    NewAIMDataframe = AIMDataframe[~AIMDataframe['Label'].isin(CurAIMLabel)]
-    #print(NewAIMDataframe)
-    AIMList = NewAIMDataframe[AIMDataColumns[2:]].values.tolist()
-    # 6. If new data exists:
-    if len(AIMList) > 0:
-        # A. Create string to add data
-        DatabaseAIMString = UpdateDatabaseQuery(AIMList,AIMDataColumns[2:],'atomsinmolecules')
-        # B. SQL query
+    # 3. If data exists:
+    NewAIMCount = 0
+    if len(AIMDataframe) > 0:
         try:
-            cur.execute(DatabaseAIMString)
+            # A. Atoms already in the database come from a modified geometry. They are
+            #    updated with the new values, matched by the unique key of the table.
+            AIMLabels = sorted(set(AIMDataframe['Comp']))
+            cur.execute("""SELECT CONCAT(m.MoleLabel, '_', a.AtomMolNum) AS Label
+                FROM atomsinmolecules AS a 
+                JOIN molecules AS m
+                    ON m.MoleID = a.MoleID
+                WHERE m.MoleLabel IN ({})""".format(', '.join(['?']*len(AIMLabels))),tuple(AIMLabels))
+            CurrentAIM = AIMDataframe['Label'].isin([Row[0] for Row in cur.fetchall()])
+            # B. Insert the columns of the data frame, without the label and compound
+            #    columns (see DatabaseTools.BulkInsert). Each combination of molecule and
+            #    atom number in molecule (AtomMolNum) is unique (uk_atom_mole), so atoms
+            #    inserted since the query above are skipped by the server.
+            NewAIMCount = DatabaseTools.BulkInsert(Connection,'atomsinmolecules',AIMDataframe[~CurrentAIM],
+                                                   AIMDataColumns[2:],Ignore=True,Report=Report,
+                                                   Variables=Variables)[0]
+            if CurrentAIM.any():
+                DatabaseTools.BulkUpdate(Connection,'atomsinmolecules',AIMDataframe[CurrentAIM],
+                                         UniqueKeys['atomsinmolecules'][1],AIMDataColumns[2:],Report=Report,
+                                         Variables=Variables)
         except mariadb.Error as e4:
             print('Error inserting into Table atomsinmolecules: {error}'.format(error=e4))
     
     # Insert new calculation information into cartCoord table
     #print ('Updating molecule data into TABLE cartCoord')
-    # 1. Query cartCoord to get current calculations. Each combination of compound, calc,basis, 
-    #    and atom number in molecule (AtomMolNum) is unique.
-    #    Current Coordinate Label: Compound:Calc/basis_atomMolNum
-    try:
-        cur.execute("""SELECT CONCAT(m.MoleLabel, ':',c.CalcType,'/',c.BasisSet,'_',a.AtomMolNum) AS CurCartLabel
-                FROM cartcoords as x
-                JOIN atomsinmolecules AS a
-                    ON x.AtomID = a.AtomID
-                JOIN calculations AS c
-                    ON x.CalcID = c.CalcID
-                JOIN molecules AS m
-                    ON m.MoleID = a.MoleID""")
-        CurrentCoordQuery = cur.fetchall()
-    except mariadb.Error as e4:
-        print('Error joining into Tables: {error}'.format(error=e4))
+    # 1. CoordList is a CoordAccumulator with integer keys for each atom. Only the
+    #    molecules in AtomList and CoordList are looked up in the database.
+    Coords = CoordList.Data
+    BatchLabels = sorted(set([Atom[1] for Atom in AtomList]) |
+                         set([CoordList.MoleLabels[i] for i in np.unique(Coords['MoleIndex']).tolist()]))
+    BatchString = ', '.join(['?']*len(BatchLabels))
 
-    CurCoordLabel = [j for sub in CurrentCoordQuery for j in sub]
-    #print(len(CurCoordLabel))
     # 2. Create dictionaries to connect labels used to the numeric database keys.
     # Dictionaries for connecting Coordinates to secondary keys (CalcID and AtomID)
     #    A. CalcID dictionary: Desired format of query output: 'compound:calc/basis', CalcID
+    DictCalcQuery = {}
+    DictAIMQuery = {}
     try:
-        cur.execute("""SELECT CONCAT(m.MoleLabel,':',c.CalcType,'/',c.BasisSet) AS Label, c.CalcID
+        if len(BatchLabels) > 0:
+            cur.execute("""SELECT CONCAT(m.MoleLabel,':',c.CalcType,'/',c.BasisSet) AS Label, c.CalcID
                 FROM calculations AS c 
                 JOIN molecules AS m
-                    ON m.MoleID = c.MoleID""")
-        DictCalcQuery = dict(cur.fetchall())
+                    ON m.MoleID = c.MoleID
+                WHERE m.MoleLabel IN ({})""".format(BatchString),tuple(BatchLabels))
+            DictCalcQuery = dict(cur.fetchall())
     except mariadb.Error as e4:
         print('Error joining into Table for Calc Dictionary: {error}'.format(error=e4))
 
     #    B. AtomID dictionary: Desired format of query output: 'compound_AtomMolNum', AtomID
     try:
-        cur.execute("""SELECT CONCAT(m.MoleLabel, '_', a.AtomMolNum) AS Label, a.AtomID
+        if len(BatchLabels) > 0:
+            cur.execute("""SELECT CONCAT(m.MoleLabel, '_', a.AtomMolNum) AS Label, a.AtomID
                 FROM atomsinmolecules AS a 
                 JOIN molecules AS m
-                    ON m.MoleID = a.MoleID""")
-        DictAIMQuery = dict(cur.fetchall())
+                    ON m.MoleID = a.MoleID
+                WHERE m.MoleLabel IN ({})""".format(BatchString),tuple(BatchLabels))
+            DictAIMQuery = dict(cur.fetchall())
     except mariadb.Error as e4:
         print('Error joining into Table for AIM Dictionary: {error}'.format(error=e4))
 
-    # 4. DataList has three labels: 
+    # 3. The labels are only formed for each distinct calculation and atom in molecule:
     #       CalcLabel which will be used to match to CalcID in Table calculations
     #       AIMLabel which will be used to match to AtomMolNum key is Table atomsinmolecules
-    #       CoordLabel which will be used to remove any data element already in Table CartCoord
-    # Form dataframe from CoordList
-    CoordColumns = ['CalcLabel','AIMLabel','CoordLabel','AtomicNum','XCoord','YCoord','ZCoord']
-    CoordDataframe = pd.DataFrame(CoordList,columns=CoordColumns)
-    #print(len(CoordDataframe))
-    # 5. Clean and transform data in CoordDataframe
-    #    A. Change type for Atomic Number (int) minor
-    CoordTypeDic = {'AtomicNum': int}
-    CoordDataframe = CoordDataframe.astype(CoordTypeDic)
-    #    B. Insert CalcID -> DictCalcQuery[CalcLabel] into dataframe
-    #       Note: for data consistency, remove any data set that does not have
-    #       a key in the dictionary.
-    DictCalcKey = list(DictCalcQuery.keys())
-    #print(CoordDataframe[~CoordDataframe['CalcLabel'].isin(DictCalcKey)])
-    CoordDataframe = CoordDataframe[CoordDataframe['CalcLabel'].isin(DictCalcKey)]
-    #print(len(CoordDataframe))
-    CalcLabelList = CoordDataframe['CalcLabel'].values.tolist()
-    CoordDataframe['CalcID'] = [DictCalcQuery[CalcLabelList[i]] for i in range(len(CoordDataframe))]
-    #    C. Insert AtomID -> DictAIMQuery[AIMLabel] into dataframe
-    #       Note: for data consistency, remove any data set that does not have
-    #       a key in the dictionary.
-    DictAIMKey = list(DictAIMQuery.keys())
-    CoordDataframe = CoordDataframe[CoordDataframe['AIMLabel'].isin(DictAIMKey)]
-    #print(len(CoordDataframe))
-    AIMLabelList = CoordDataframe['AIMLabel'].values.tolist()
-    CoordDataframe['AtomID'] = [DictAIMQuery[AIMLabelList[i]] for i in range(len(CoordDataframe))]
-    #    E. Drop all atoms currently in the database
-    NewCartDataframe = CoordDataframe[~CoordDataframe['CoordLabel'].isin(CurCoordLabel)]
-    #print(len(NewCartDataframe))
-    #    F. Transform to data format for database query
-    CartDataColumns = ['XCoord','YCoord','ZCoord','CalcID','AtomID']
-    CartList = NewCartDataframe[CartDataColumns].values.tolist()
-    # 7. If new data exists:
-    if len(CartList) > 0:
-        # A. Create string to add data
-        DatabaseCartString = UpdateDatabaseQuery(CartList,CartDataColumns,'cartcoords')
-        # B. SQL query
+    #    A. Insert CalcID -> DictCalcQuery[CalcLabel]. -1 marks a calculation that
+    #       is not in the database.
+    CalcKeys, CalcRows = np.unique(Coords[['MoleIndex','CalcIndex','BasisIndex']],return_inverse=True)
+    CalcIDs = np.array([DictCalcQuery.get(CoordList.CalcLabel(*Key),-1) for Key in CalcKeys.tolist()],
+                       dtype=np.int64)[CalcRows.ravel()]
+    #    B. Insert AtomID -> DictAIMQuery[AIMLabel]. -1 marks an atom that is not in
+    #       the database.
+    AIMKeys, AIMRows = np.unique(Coords[['MoleIndex','AtomMolNum']],return_inverse=True)
+    AtomIDs = np.array([DictAIMQuery.get(CoordList.AIMLabel(*Key),-1) for Key in AIMKeys.tolist()],
+                       dtype=np.int64)[AIMRows.ravel()]
+    # 4. Clean data
+    #    A. For data consistency, remove any data set that does not have a key in
+    #       the dictionaries.
+    NewCoords = (CalcIDs >= 0) & (AtomIDs >= 0)
+    #    B. Coordinates already in the database come from a modified geometry. They
+    #       are updated with the new values instead of being inserted. The key of
+    #       each coordinate is CalcID * 2**32 + AtomID.
+    CurrentCoords = np.zeros(len(NewCoords),dtype=bool)
+    try:
+        BatchCalcIDs = np.unique(CalcIDs[NewCoords]).tolist()
+        if len(BatchCalcIDs) > 0:
+            cur.execute('SELECT CalcID, AtomID FROM cartcoords WHERE CalcID IN ({})'.format(
+                ', '.join(['?']*len(BatchCalcIDs))),tuple(BatchCalcIDs))
+            CurrentKeys = np.array(cur.fetchall(),dtype=np.int64).reshape(-1,2)
+            CurrentCoords = NewCoords & np.isin(CalcIDs*2**32 + AtomIDs,CurrentKeys[:,0]*2**32 + CurrentKeys[:,1])
+    except mariadb.Error as e4:
+        print('Error selecting data from Table cartcoords: {error}'.format(error=e4))
+    #    C. Columns of the database table
+    CartColumns = ['XCoord','YCoord','ZCoord','CalcID','AtomID']
+    InsertCoords = NewCoords & ~CurrentCoords
+    CartData = {'XCoord': Coords['XCoord'][InsertCoords], 'YCoord': Coords['YCoord'][InsertCoords],
+                'ZCoord': Coords['ZCoord'][InsertCoords], 'CalcID': CalcIDs[InsertCoords],
+                'AtomID': AtomIDs[InsertCoords]}
+    # 5. If data exists:
+    NewCartCount = 0
+    if NewCoords.any():
+        # Insert the columns (see DatabaseTools.BulkInsert). Each combination of
+        # calculation (CalcID) and atom in molecule (AtomID) is unique (uk_coord_calc),
+        # so coordinates inserted since the query above are skipped by the server.
         try:
-            cur.execute(DatabaseCartString)
+            NewCartCount = DatabaseTools.BulkInsert(Connection,'cartcoords',CartData,CartColumns,Ignore=True,
+                                                    Report=Report,Variables=Variables)[0]
+            if CurrentCoords.any():
+                CartData = {'XCoord': Coords['XCoord'][CurrentCoords], 'YCoord': Coords['YCoord'][CurrentCoords],
+                            'ZCoord': Coords['ZCoord'][CurrentCoords], 'CalcID': CalcIDs[CurrentCoords],
+                            'AtomID': AtomIDs[CurrentCoords]}
+                DatabaseTools.BulkUpdate(Connection,'cartcoords',CartData,UniqueKeys['cartcoords'][1],CartColumns,
+                                         Report=Report,Variables=Variables)
         except mariadb.Error as e4:
             print('Error inserting data into Table cartcoords: {error}'.format(error=e4))
     cur.close()
     DataUser.CloseConnection(Connection)
-    return len(AIMList),len(CartList)
+    return NewAIMCount,NewCartCount
 
-def ExtractCalcData(MoleculeDataframe):
+def ScanDirectory(DirPath):
+
+    """
+        Lists DirPath once with os.scandir. Returns two dictionaries of the
+        entries, one for subdirectories and one for files, keyed by the entry
+        name (normalised with os.path.normcase so the lookup follows the case
+        rules of the file system, as os.path.isdir does). Returns empty
+        dictionaries if DirPath does not exist.
+    """
+    import os
+
+    SubDirs = {}
+    Files = {}
+    try:
+        with os.scandir(DirPath) as Entries:
+            for Entry in Entries:
+                if Entry.is_dir():
+                    SubDirs[os.path.normcase(Entry.name)] = Entry
+                elif Entry.is_file():
+                    Files[os.path.normcase(Entry.name)] = Entry
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return SubDirs, Files
+
+class ArchiveMember:
+
+    """
+        A file inside a tar or zip archive of CFOUR outputs. It has the
+        attributes of os.DirEntry used by the extractors: path (the archive path
+        joined with the member name, which is its name in the manifest) and
+        stat(), which returns the member itself with st_size and st_mtime_ns.
+        Source is [archive path, member name] (see OpenSource).
+    """
+
+    def __init__(self, ArchivePath, MemberName, Size, MTime):
 
-    import os.path
+        import os
+
+        self.path = os.path.join(ArchivePath,MemberName)
+        self.Source = [ArchivePath,MemberName]
+        self.st_size = Size
+        self.st_mtime_ns = MTime
+
+    def stat(self):
+        return self
+
+def EntrySource(Entry):
+
+    """
+        Returns the source of a file found by WalkCalculations as accepted by
+        OpenSource: the path of a file, or [archive path, member name] for an
+        ArchiveMember.
+    """
+    return Entry.Source if isinstance(Entry,ArchiveMember) else Entry.path
+
+def OpenArchive(ArchivePath):
+
+    """
+        Returns an open tarfile.TarFile or zipfile.ZipFile for ArchivePath.
+        The calculations of an archive are read one after the other, so the
+        last archive opened by this process is kept open in OpenArchives and
+        any other archive is closed (see CloseArchives).
+    """
+    import tarfile
+    import zipfile
+
+    if ArchivePath not in OpenArchives:
+        CloseArchives()
+        if ArchivePath.lower().endswith('.zip'):
+            OpenArchives[ArchivePath] = zipfile.ZipFile(ArchivePath)
+        else:
+            OpenArchives[ArchivePath] = tarfile.open(ArchivePath)
+    return OpenArchives[ArchivePath]
+
+def CloseArchives():
+
+    """
+        Closes the archives kept open by OpenArchive.
+    """
+    for Archive in OpenArchives.values():
+        Archive.close()
+    OpenArchives.clear()
+
+def OpenSource(Source, Mode='r'):
+
+    """
+        Opens a CFOUR output file for reading. Source is the path of the file,
+        [archive path, member name] for a file inside an archive, which is read
+        directly from the archive without unpacking it, or the contents of the
+        file (bytes) already read from an archive (see ReadArchiveMembers).
+        Mode is 'r' (text) or 'rb' (bytes).
+    """
+    import io
+    import zipfile
+
+    if isinstance(Source,str):
+        return open(Source,Mode)
+    if isinstance(Source,bytes):
+        return io.BytesIO(Source) if 'b' in Mode else io.TextIOWrapper(io.BytesIO(Source))
+    ArchivePath, MemberName = Source
+    Archive = OpenArchive(ArchivePath)
+    if isinstance(Archive,zipfile.ZipFile):
+        MemberFile = Archive.open(MemberName)
+    else:
+        MemberFile = Archive.extractfile(MemberName)
+    return MemberFile if 'b' in Mode else io.TextIOWrapper(MemberFile)
+
+def DirectoryCalculations(CompPath, CalcList, BasisList):
+
+    """
+        Generator over the calculations in the directory of one compound,
+        CompPath/{Calculation Label}/{Basis set Label}. Each directory is listed
+        once with os.scandir. Yields the calculation, basis set and a dictionary
+        of the files in the basis set directory (name: os.DirEntry).
+    """
+    CalcDirs, CalcFiles = ScanDirectory(CompPath)
+    for calc in CalcList:
+        # Calculation subdirectory if it exists
+        CalcEntry = CalcDirs.get(calc)
+        if CalcEntry is None: continue
+        BasisDirs, BasisFiles = ScanDirectory(CalcEntry.path)
+        for basis in BasisList:
+            # Basis set subdirectory if it exists
+            BasisEntry = BasisDirs.get(basis)
+            if BasisEntry is None: continue
+            SubDirs, Files = ScanDirectory(BasisEntry.path)
+            yield calc, basis, Files
+
+def ArchiveCalculations(ArchivePath, Comp, CalcList, BasisList):
+
+    """
+        Generator over the calculations in the archive of one compound. Members
+        are named {Calculation Label}/{Basis set Label}/{file}, optionally
+        inside a {Compound Label} directory. Only the list of members is read
+        here, from a tar archive in one pass with a streaming handle of its own
+        (the members are read later by ReadArchiveMembers). Yields the
+        calculation, basis set and a dictionary of the files of the calculation
+        (name: ArchiveMember), in the order of CalcList and BasisList.
+    """
+    import os
+    import time
+    import tarfile
+    import zipfile
+
+    # 1. List the files in the archive: [name, size, modification time (ns)]
+    if ArchivePath.lower().endswith('.zip'):
+        with zipfile.ZipFile(ArchivePath) as Archive:
+            Members = [[Info.filename,Info.file_size,int(time.mktime(Info.date_time + (0,0,-1)))*10**9]
+                       for Info in Archive.infolist() if not Info.is_dir()]
+    else:
+        with tarfile.open(ArchivePath,'r|*') as Archive:
+            Members = [[Info.name,Info.size,int(Info.mtime)*10**9] for Info in Archive if Info.isfile()]
+    # 2. Sort the files by calculation and basis set.
+    CalcTree = {}
+    for MemberName, Size, MTime in Members:
+        Parts = [os.path.normcase(Part) for Part in MemberName.replace('\\','/').split('/') if Part not in ['','.']]
+        if len(Parts) == 4 and Parts[0] == os.path.normcase(Comp): Parts = Parts[1:]
+        if len(Parts) != 3: continue
+        calc, basis, FileName = Parts
+        CalcTree.setdefault(calc,{}).setdefault(basis,{})[FileName] = ArchiveMember(ArchivePath,MemberName,Size,MTime)
+    for calc in CalcList:
+        for basis in BasisList:
+            Files = CalcTree.get(calc,{}).get(basis)
+            if Files is not None:
+                yield calc, basis, Files
+
+def ReadArchiveMembers(ArchivePath, MemberNames):
+
+    """
+        Reads the members MemberNames of an archive in the order they are
+        stored. A tar archive is read from a new streaming handle in a single
+        pass that never seeks backwards (a backward seek in a compressed tar
+        archive restarts its decompression) and stops after the last member
+        needed. The members of a zip archive are compressed one by one and are
+        read with the handle of OpenArchive. Returns a dictionary with the
+        contents (bytes) of each member.
+    """
+    import tarfile
+
+    Missing = set(MemberNames)
+    MemberData = {}
+    if ArchivePath.lower().endswith('.zip'):
+        Archive = OpenArchive(ArchivePath)
+        for Info in Archive.infolist():
+            if Info.filename in Missing:
+                MemberData[Info.filename] = Archive.read(Info)
+    else:
+        with tarfile.open(ArchivePath,'r|*') as Archive:
+            for Info in Archive:
+                if Info.name not in Missing: continue
+                MemberData[Info.name] = Archive.extractfile(Info).read()
+                Missing.discard(Info.name)
+                if not Missing: break
+    return MemberData
+
+def WalkCalculations(MoleculeDataframe, CalcList=None):
+
+    """
+        Generator that visits every calculation directory of the molecules in
+        MoleculeDataframe once. The directory structure is
+            molecules/{Compound Label}/{Calculation Label}/{Basis set Label}
+        and each directory is listed a single time with os.scandir instead of
+        testing every possible path with os.path.isdir and os.path.exists.
+        If a compound has no directory, its calculations are read from an
+        archive {Compound Label}{ArchiveType} in MoleculeDir instead.
+        Yields the compound label, calculation, basis set and a dictionary of the
+        files of the calculation (name: os.DirEntry or ArchiveMember).
+        Calculations are yielded in the order of MoleculeDataframe, CalcList
+        and BasisList. Basis sets in NanoBasis are only read for the 'nano'
+        group.
+    """
+    import os
 
     # Lists of types of calculations and basis sets
-    # General note: ccsdt is a convient short hand for CCSD(T). It is NOT CCSDT.
-    CalcList = ['scf','mp2','ccsd','ccsdt']
-    BasisList = ['pvdz','pvtz','pvqz','pcvdz','pcvtz','pcvqz']
+    if CalcList is None: CalcList = CalcTypes
+    BasisList = BasisSets
     NanoBasis = ['pvqz','pcvdz','pcvtz','pcvqz']
-    DataList = []
-    # The goal of these tools is to be able to run them in multiple different places.
-    # For the moment, the program will assume a directory structure as follows:
-    #   molecules/{Compound Label}/{Calculation Label}/{Basis set Label}
-    CompDir = 'molecules\\'
-    # CompList is list of compounds. Extract data for each compound.  
+    # CompList is list of compounds. Extract data for each compound.
     CompList = MoleculeDataframe['MoleLabel'].values.tolist()
     CompGroup = MoleculeDataframe['MoleGroup'].values.tolist()
-    Count = 0
-    for i in range(len(MoleculeDataframe)):
-        # Compound subdirectory if it exists
-        CompPath = CompDir + CompList[i] + '\\'
-        if not(os.path.isdir(CompPath)): continue
-        for calc in CalcList:
-            # Calculation subdirectory if it exists
-            CalcPath = CompPath + calc + '\\'
-            if not(os.path.isdir(CalcPath)): continue
-            for basis in BasisList:
-                if (basis in NanoBasis) and not (CompGroup[i] == 'nano'): continue
-                # Basis set subdirectory if it exists
-                BasisPath = CalcPath + basis + '\\'
-                if not(os.path.isdir(BasisPath)): continue
-                # Data file if it exists
-                DataFileName = BasisPath + 'prp.dat'
-                if os.path.exists(DataFileName):
-                    # Open data file for reading
-                    DataFile = open(DataFileName,'r')
-                    # Initialize values for energy. MP2, CCSD, and CCSD(T) energies
-                    # are not computed in every calculation.
-                    Count += 1
-                    if (Count % 20) == 0: print('*',end='') 
-                    MP2Energy = 0.
-                    CCSDEnergy = 0.
-                    CCSDTEnergy = 0.
-                    # Boolean variables to control when to read Rotational constants.
-                    # The rotational constants are included twice in the data file.
-                    # The key word is MHz. Constants are on the next line.
-                    # The first time MHz is encountered, RotConst is set to true.
-                    # Then, the rotational constants are extracted from the next line,
-                    # and FirstRot is set to False.
-                    RotConst = False
-                    FirstRot = True
-                    # Read each line of the data file
-                    for line in DataFile:
-                        # Extract the molecule's point group. This can be important
-                        # for molecules with only a few atoms, but will be less 
-                        # important for larger ones.
-                        if 'The full molecular point group is' in line:
-                            MolePntGrp = line[-6:-3]
-                        if 'The computational point group is' in line:
-                            CompPntGrp = line[-6:-3]
-                        # Extract the number of basis functions.
-                        if 'basis functions' in line:
-                            NumBasFunc = int(line[12:17])
-                        # Extract the SCF energy. This value is computed for each type of 
-                        # calculation.
-                        if 'E(SCF)=' in line:
-                            SCFEnergy = float(line.split()[1])
-                        # Extract MP2 energy. This value is computed during MP2, CCSD, and 
-                        # CCSD(T) calculations.
-                        if 'Total MP2 energy' in line:
-                            MP2Energy = float(line.split()[4])
-                        # Extract CCSD energy. This value is computed during CCSD and CCSD(T)
-                        # calculations. It is found in two different forms.
-                        if 'CCSD energy  ' in line:
-                            if 'Total' in line:
-                                CCSDEnergy = float(line.split()[4])
-                            else:
-                                CCSDEnergy = float(line.split()[2])
-                        # Extract CCSD(T) energy.
-                        if 'CCSD(T) energy  ' in line:
-                            CCSDTEnergy = float(line.split()[2])
-                        # Extract Rotational Constants
-                        if RotConst:
-                            # As noted above, the values of interest are in the
-                            # line after MHz. Split the line string and transform
-                            # the string to floating point variables.
-                            RotConst = False
-                            LineList = line.split()
-                            RotConsts = [float(Const) for Const in LineList]
-                            # There are either two or three rotational constants.
-                            # Linear molecules such as H2, CO2, and C2H2 have two
-                            # constants. For linear molecules, set RotConstZ to 0.
-                            # All other molecules have three.
-                            RotConstX = RotConsts[0]
-                            RotConstY = RotConsts[1]
-                            if len(RotConsts) > 2:
-                                RotConstZ = RotConsts[2]
-                            else:
-                                RotConstZ = 0
-                        # Flag line for Rotationl constants if MHz is in line
-                        # The rotational constants are on the next line.
-                        # Constants appear twice in output file only read first
-                        # occurence.
-                        if 'MHz' in line and FirstRot:
-                            RotConst = True
-                            FirstRot = False
-                        # Extract the time required for the calculation. This
-                        # time will be used to group molecules
-                        if 'This computation required' in line:
-                            CalcTime = float(line.split()[3])
-                    # Create a unique label for each calculation
-                    label = '{COMP}:{CALC}/{BAS}'.format(COMP=CompList[i],CALC=calc,BAS=basis)
-                    # Combine the values and append them to DataList 
-                    CalcData = [label,CompList[i],calc,basis,MolePntGrp,CompPntGrp,NumBasFunc,SCFEnergy,
-                                MP2Energy,CCSDEnergy,CCSDTEnergy,RotConstX,RotConstY,RotConstZ,
-                                CalcTime]
-                    DataList.append(CalcData)
-    #print(DataList)
-    #print('Data extracted from {} files'.format(len(DataList)))
-    return DataList
+    CompDirs, CompFiles = ScanDirectory(MoleculeDir)
+    for i in range(len(CompList)):
+        CompBasis = [basis for basis in BasisList if (basis not in NanoBasis) or (CompGroup[i] == 'nano')]
+        # Compound subdirectory if it exists, otherwise its archive if it exists
+        CompEntry = CompDirs.get(os.path.normcase(CompList[i]))
+        if CompEntry is not None:
+            Calculations = DirectoryCalculations(CompEntry.path,CalcList,CompBasis)
+        else:
+            ArchiveEntries = [CompFiles[os.path.normcase(CompList[i] + ArchiveType)] for ArchiveType in ArchiveTypes
+                              if os.path.normcase(CompList[i] + ArchiveType) in CompFiles]
+            if len(ArchiveEntries) == 0: continue
+            Calculations = ArchiveCalculations(ArchiveEntries[0].path,CompList[i],CalcList,CompBasis)
+        for calc, basis, Files in Calculations:
+            yield CompList[i], calc, basis, Files
 
-def ExtractCartCoordData(DataUser,MoleculeDataframe):
+def KeywordScanner(Fields):
+
+    """
+        Returns one compiled regular expression that finds the keyword of any
+        of Fields (see CalcKeywords) in a line, and a dictionary from each
+        keyword to its field. The pattern is a plain alternation of the
+        keywords (no named groups) so re can skip ahead to the possible first
+        characters of a keyword. Scanners are compiled once and kept in
+        KeywordScanners.
+    """
+    import re
+
+    Fields = tuple(Fields)
+    if Fields not in KeywordScanners:
+        KeywordFields = {CalcKeywords[Field][0]: Field for Field in Fields}
+        Scanner = re.compile('|'.join(re.escape(Keyword) for Keyword in KeywordFields))
+        KeywordScanners[Fields] = [Scanner,KeywordFields]
+    return KeywordScanners[Fields]
+
+def ScanFile(DataSource, Fields):
+
+    """
+        Reads the values of Fields (see CalcKeywords) from a CFOUR output file
+        (DataSource, see OpenSource) in a single forward pass. Each line is
+        matched once against all the keywords (see KeywordScanner) and only the
+        parser of the field found is called. A field found more than once keeps
+        its last value, except the fields in FirstFields. Reading stops at the
+        line of EndField, the last line of the output.
+        Returns a dictionary with the fields found.
+    """
+    Scanner, KeywordFields = KeywordScanner(Fields)
+    Values = {}
+    NextField = None
+    with OpenSource(DataSource) as DataFile:
+        for line in DataFile:
+            # The value of the field found on the previous line is on this line.
+            if NextField is not None:
+                Values[NextField] = CalcKeywords[NextField][2](line)
+                NextField = None
+            Match = Scanner.search(line)
+            if Match is None: continue
+            Field = KeywordFields[Match.group()]
+            if Field in FirstFields and Field in Values: continue
+            Keyword, Offset, Parser = CalcKeywords[Field]
+            if Offset > 0:
+                NextField = Field
+                continue
+            Values[Field] = Parser(line)
+            if Field == EndField: break
+    return Values
+
+def ParseCalcFile(DataSource):
+
+    """
+        Reads the CFOUR summary file prp.dat of one calculation. Returns the
+        molecular and computational point groups, number of basis functions,
+        SCF, MP2, CCSD and CCSD(T) energies, the three rotational constants and
+        the computation time. Energies not computed by the method of the
+        calculation are 0.
+    """
+    Values = ScanFile(DataSource,MoleculeFields)
+    # There are either two or three rotational constants. For linear molecules,
+    # set RotConstZ to 0.
+    RotConsts = Values['RotConsts']
+    RotConstZ = RotConsts[2] if len(RotConsts) > 2 else 0
+    return [Values['MolePntGrp'],Values['CompPntGrp'],Values['NumBasFunc'],Values['SCFEnergy'],
+            Values.get('MP2Energy',0.),Values.get('CCSDEnergy',0.),Values.get('CCSDTEnergy',0.),
+            RotConsts[0],RotConsts[1],RotConstZ,Values['CalcTime']]
+
+def ParseCoordFile(DataSource, AtomDict):
 
-    import os.path
+    """
+        Reads the Cartesian coordinates of the optimized geometry from the CFOUR
+        file JMOLplot. AtomDict maps the upper case atomic symbol to the atomic
+        number. Returns a list of [atomic number, X, Y, Z] for each atom in the
+        order of the file (dummy atoms X are skipped).
+    """
+    CoordData = []
+    with OpenSource(DataSource) as DataFile:
+        for line in DataFile:
+            # Each line has one of three types of data:
+            #       1. Count of the number of atoms (line 1)
+            #       2. Blank (line 2)
+            #       3. Coordinate Data: Atomic Symbol, X, Y, Z Coord.
+            # To identify the coordinate data, divide line into parts
+            # and remove 'white space'. The length of the list with
+            # data will be for. Convert character string data to
+            # numeric data and add it to list.
+            lineList = line.split()
+            if (len(lineList) == 4) and (lineList[0] != 'X'):
+                CoordData.append([AtomDict[lineList[0]],float(lineList[1]),float(lineList[2]),float(lineList[3])])
+    return CoordData
+
+def ReadAtomDict(DataUser):
+
+    """
+        Pulls data from the elements table into a dictionary to map the atomic
+        symbols in the coordinate files (upper case) to the atomic number.
+    """
     import mariadb
 
-    #print('Extracting Cartesian coordinate data')
-    # Lists of types of calculations and basis sets
-    # General note: ccsdt is a convient short hand for CCSD(T). It is NOT CCSDT.
-    CalcList = ['scf','mp2','ccsd','ccsdt']
-    BasisList = ['pvdz','pvtz','pvqz','pcvdz','pcvtz','pcvqz']
-    NanoBasis = ['pvqz','pcvdz','pcvtz','pcvqz']
-    AtomList = []
-    CartList = []
-    # Pull data from elements table into dictionary to map Atomic Symbols in coordinate
-    # file to Atomic Number
     try:
         Connection = DataUser.OpenConnection()
         cur = Connection.cursor()
@@ -845,69 +1123,658 @@ def ExtractCartCoordData(DataUser,MoleculeDataframe):
     except mariadb.Error as e:
         print('Error selecting data from Table element: {error}'.format(error=e))
         AtomDict = {}
+    return AtomDict
 
-    # The goal of these tools is to be able to run them in multiple different places.
-    # For the moment, the program will assume a directory structure as follows:
-    #   molecules/{Compound Label}/{Calculation Label}/{Basis set Label}
-    CompDir = 'molecules\\'
-    # CompList is list of compounds. Extract data for each compound.  
-    CompList = MoleculeDataframe['MoleLabel'].values.tolist()
-    CompGroup = MoleculeDataframe['MoleGroup'].values.tolist()
-    Count = 0
-    for j in range(len(MoleculeDataframe)):
-        # Compound subdirectory if it exists
-        CompPath = CompDir + CompList[j] + '\\'
-        if not(os.path.isdir(CompPath)): continue
-        for calc in CalcList:
-            # Calculation subdirectory if it exists
-            CalcPath = CompPath + calc + '\\'
-            if not(os.path.isdir(CalcPath)): continue
-            for basis in BasisList:
-                if (basis in NanoBasis) and not (CompGroup[j] == 'nano'): continue
-                # Basis set subdirectory if it exists
-                BasisPath = CalcPath + basis + '\\'
-                if not(os.path.isdir(BasisPath)): continue
-                # Data files if it exists. Data will be pulled from JMOLplot.
-                # ZMATnew is to check if the geometry optimizition is complete.
-                DataFileName1 = BasisPath + 'prp.dat'
-                DataFileName2 = BasisPath + 'JMOLplot'
-                if (os.path.exists(DataFileName1) and os.path.exists(DataFileName2)):
-                    labelC = '{COMP}:{CALC}/{BAS}'.format(COMP=CompList[j],CALC=calc,BAS=basis)
-                    i = 0
-                    DataFile = open(DataFileName2,'r')
-                    Count += 1
-                    if (Count % 20) == 0: print('*',end='') 
-                    for line in DataFile:
-                        # Each line has one of three types of data:
-                        #       1. Count of the number of atoms (line 1)
-                        #       2. Blank (line 2)
-                        #       3. Coordinate Data: Atomic Symbol, X, Y, Z Coord.
-                        # To identify the coordinate data, divide line into parts
-                        # and remove 'white space'. The length of the list with
-                        # data will be for. Convert character string data to
-                        # numeric data and add it to list.
-                        lineList = line.split()
-                        if (len(lineList) == 4) and (lineList[0] != 'X'):
-                            i += 1
-                            labelA = '{}_{}'.format(CompList[j],i)
-                            if (calc == 'scf') and (basis == 'pvdz'):
-                                AtomList.append([labelA,CompList[j],AtomDict[lineList[0]],i])
-                            labelCC = labelC + '_{}'.format(i)
-                            CartList.append([labelC,labelA,labelCC,AtomDict[lineList[0]],
-                                             float(lineList[1]),float(lineList[2]),float(lineList[3])])
-                    DataFile.close()
-
-    #print(AtomList)
-    #print('Data extracted for {} atoms and {} coordinates'.format(len(AtomList),len(CartList)))
-
-    return AtomList, CartList
-
-def UpdateDatabase(DataUser):
+def ParseCalculation(Task, AtomDict):
+
+    """
+        Parses the files of one calculation. Task is [compound, calculation,
+        basis set, prp.dat, JMOLplot or None] where the files are given as
+        sources for OpenSource. Returns the values read from prp.dat (see
+        ParseCalcFile) and the coordinates read from JMOLplot (see
+        ParseCoordFile), or None if there is no JMOLplot. This is the unit of
+        work sent to the worker processes by ExtractMoleculeData, so it is kept
+        at module level.
+    """
+    Comp, calc, basis, CalcSource, CoordSource = Task
+    CalcValues = ParseCalcFile(CalcSource)
+    CoordData = ParseCoordFile(CoordSource,AtomDict) if CoordSource is not None else None
+    return CalcValues, CoordData
+
+def TaskArchive(Task):
+
+    """
+        Returns the path of the archive that the files of Task (see
+        ParseCalculation) are read from, or None if none of them is in an
+        archive.
+    """
+    Archives = [Source[0] for Source in Task[3:] if isinstance(Source,list)]
+    return Archives[0] if len(Archives) > 0 else None
+
+def ParseCalculations(Tasks, AtomDict):
+
+    """
+        Parses the files of a group of calculations (see ParseCalculation) and
+        returns the list of their results. The files of the tasks that are in
+        archives are read first, in one pass over each archive (see
+        ReadArchiveMembers), and parsed from memory. ExtractMoleculeBlocks
+        sends the calculations read from one archive to the worker processes
+        as one group, so no other process opens the archive.
+    """
+    ArchiveFiles = {}
+    for Task in Tasks:
+        for Source in Task[3:]:
+            if isinstance(Source,list):
+                ArchiveFiles.setdefault(Source[0],set()).add(Source[1])
+    MemberData = {}
+    for ArchivePath, MemberNames in ArchiveFiles.items():
+        for MemberName, Data in ReadArchiveMembers(ArchivePath,MemberNames).items():
+            MemberData[ArchivePath,MemberName] = Data
+    Results = []
+    for Task in Tasks:
+        Sources = [MemberData[tuple(Source)] if isinstance(Source,list) else Source for Source in Task[3:]]
+        Results.append(ParseCalculation(Task[:3] + Sources,AtomDict))
+    return Results
+
+def OpenManifest(ManifestName=None):
+
+    """
+        Opens the local manifest of CFOUR output files (ManifestFile by default)
+        and creates Table cfourfiles if it does not exist. The table has one row
+        for each prp.dat or JMOLplot file parsed by ExtractMoleculeData with its
+        size, modification time (ns), SHA-256 hash, the label of the calculation
+        and the CalcID it produced in Table calculations. CalcID is NULL until
+        the calculation has been found in the database (see LinkManifest).
+        Table cfourparse caches the parsed contents of each file by its hash and
+        parser (see ReadParseCache). It is kept when the database is recreated.
+        Returns the sqlite3 connection.
+    """
+    import sqlite3
+
+    Manifest = sqlite3.connect(ManifestFile if ManifestName is None else ManifestName)
+    Manifest.execute("""CREATE TABLE IF NOT EXISTS cfourfiles(
+            FilePath  TEXT NOT NULL PRIMARY KEY,
+            FileSize  INTEGER NOT NULL,
+            FileMTime INTEGER NOT NULL,
+            FileHash  TEXT NOT NULL,
+            CalcLabel TEXT NOT NULL,
+            CalcID    INTEGER)""")
+    Manifest.execute("""CREATE TABLE IF NOT EXISTS cfourparse(
+            FileHash  TEXT NOT NULL,
+            Parser    TEXT NOT NULL,
+            Parsed    TEXT NOT NULL,
+            PRIMARY KEY (FileHash, Parser))""")
+    return Manifest
+
+def HashFile(DataSource, BlockSize=1048576):
+
+    """
+        Returns the SHA-256 hash (hexadecimal) of the contents of DataSource
+        (see OpenSource), reading the file BlockSize bytes at a time.
+    """
+    import hashlib
+
+    FileHash = hashlib.sha256()
+    with OpenSource(DataSource,'rb') as DataFile:
+        for Block in iter(lambda: DataFile.read(BlockSize),b''):
+            FileHash.update(Block)
+    return FileHash.hexdigest()
+
+def CheckManifest(Manifest, Tasks, TaskEntries, Report=None):
+
+    """
+        Compares the files of each calculation in Tasks (see ParseCalculation)
+        with the manifest. TaskEntries holds the os.DirEntry of each file of the
+        task. A file with the same size and modification time as in the manifest
+        keeps its hash there; any other file is hashed. The files in archives
+        that have to be hashed, and the other files of their calculations, are
+        read in one pass over each archive (see ReadArchiveMembers). Their tasks
+        are returned with the contents of the files, so the archive is not read
+        again to parse them. A file is unchanged if it was loaded into the
+        database (CalcID is set) and has the same hash. A calculation is new if
+        any of its files is not in the manifest or not yet loaded, modified if
+        the contents of a loaded file changed and unchanged otherwise.
+        The files of new and modified calculations are written to the manifest
+        with CalcID NULL. Returns the tasks of the new and modified calculations
+        and, for each of them, the hashes of its prp.dat and JMOLplot (or None).
+        If Report is a dictionary, the number of calculations of each kind
+        ('New', 'Modified', 'Unchanged') is added to it.
+    """
+    import hashlib
+
+    # 1. Read the manifest once: FilePath: [FileSize, FileMTime, FileHash, CalcID]
+    Known = {Row[0]: Row[1:] for Row in Manifest.execute(
+        'SELECT FilePath, FileSize, FileMTime, FileHash, CalcID FROM cfourfiles')}
+
+    def Unknown(Entry):
+        # The size or modification time of the file is not the one in the manifest.
+        FileStat = Entry.stat()
+        return Known.get(Entry.path) is None or Known[Entry.path][:2] != (FileStat.st_size,FileStat.st_mtime_ns)
+
+    # 2. Read the files in archives to be hashed, with the other files of their
+    #    calculations, one archive at a time.
+    ArchiveFiles = {}
+    for Entries in TaskEntries:
+        if any(isinstance(Entry,ArchiveMember) and Unknown(Entry) for Entry in Entries):
+            for Entry in Entries:
+                ArchiveFiles.setdefault(Entry.Source[0],[]).append(Entry.Source[1])
+    MemberData = {}
+    for ArchivePath, MemberNames in ArchiveFiles.items():
+        for MemberName, Data in ReadArchiveMembers(ArchivePath,MemberNames).items():
+            MemberData[ArchivePath,MemberName] = Data
+    NewTasks = []
+    NewHashes = []
+    FileRows = []
+    Counts = {'New': 0, 'Modified': 0, 'Unchanged': 0}
+    for Task, Entries in zip(Tasks,TaskEntries):
+        Comp, calc, basis = Task[:3]
+        labelC = '{COMP}:{CALC}/{BAS}'.format(COMP=Comp,CALC=calc,BAS=basis)
+        Status = 'Unchanged'
+        TaskRows = []
+        Changed = False
+        Sources = Task[3:]
+        for i, Entry in enumerate(Entries):
+            FileStat = Entry.stat()
+            FileInfo = Known.get(Entry.path)
+            Loaded = FileInfo is not None and FileInfo[3] is not None
+            # 3. The contents read from an archive replace the source of the file
+            #    in the task.
+            if isinstance(Entry,ArchiveMember) and tuple(Entry.Source) in MemberData:
+                Sources[i] = MemberData[tuple(Entry.Source)]
+            # 4. Same size and modification time as in the manifest: the hash
+            #    in the manifest is used without reading the file.
+            if not Unknown(Entry):
+                FileHash = FileInfo[2]
+            # 5. Otherwise hash the contents.
+            elif isinstance(Sources[i],bytes):
+                FileHash = hashlib.sha256(Sources[i]).hexdigest()
+                Changed = True
+            else:
+                FileHash = HashFile(EntrySource(Entry))
+                Changed = True
+            TaskRows.append([Entry.path,FileStat.st_size,FileStat.st_mtime_ns,FileHash,labelC,
+                             FileInfo[3] if Loaded else None])
+            if not Loaded:
+                if Status == 'Unchanged': Status = 'New'
+            elif FileInfo[2] != FileHash:
+                Status = 'Modified'
+        Counts[Status] += 1
+        # 6. Files of calculations to parse are not loaded until LinkManifest
+        #    finds the calculation in the database. Unchanged files are only
+        #    written again if their size or modification time changed.
+        if Status != 'Unchanged':
+            NewTasks.append(Task[:3] + Sources)
+            NewHashes.append([Row[3] for Row in TaskRows] + [None]*(2 - len(TaskRows)))
+            for Row in TaskRows: Row[5] = None
+        if Changed or Status != 'Unchanged':
+            FileRows += TaskRows
+    with Manifest:
+        Manifest.executemany("""INSERT OR REPLACE INTO cfourfiles
+                (FilePath, FileSize, FileMTime, FileHash, CalcLabel, CalcID)
+                VALUES (?, ?, ?, ?, ?, ?)""",FileRows)
+    if Report is not None:
+        for Status, Count in Counts.items():
+            Report[Status] = Report.get(Status,0) + Count
+    return NewTasks, NewHashes
+
+def ParseCacheKeys(Task):
+
+    """
+        Returns the names of the parsers of the files of Task in Table
+        cfourparse.
+    """
+    return ['prp.dat','JMOLplot']
+
+def ReadParseCache(Manifest, Tasks, TaskHashes):
+
+    """
+        Looks up the parsed contents of the files of each task in Table
+        cfourparse by their hashes (see CheckManifest). Returns, for each task,
+        the result of ParseCalculation if every file of the task is in the
+        cache, or None if the task has to be parsed.
+    """
+    import json
+
+    Cached = []
+    for Task, Hashes in zip(Tasks,TaskHashes):
+        Result = []
+        for FileHash, Parser in zip(Hashes,ParseCacheKeys(Task)):
+            if FileHash is None:
+                Result.append(None)
+                continue
+            Row = Manifest.execute('SELECT Parsed FROM cfourparse WHERE FileHash = ? AND Parser = ?',
+                                   (FileHash,Parser)).fetchone()
+            if Row is None: break
+            Result.append(json.loads(Row[0]))
+        Cached.append(Result if len(Result) == 2 else None)
+    return Cached
+
+def SaveParseCache(Manifest, ParsedTasks):
+
+    """
+        Saves the parsed contents of the files of each [task, hashes, result of
+        ParseCalculation] in ParsedTasks in Table cfourparse.
+    """
+    import json
+
+    CacheRows = []
+    for Task, Hashes, Result in ParsedTasks:
+        for FileHash, Parser, Parsed in zip(Hashes,ParseCacheKeys(Task),Result):
+            if FileHash is not None:
+                CacheRows.append((FileHash,Parser,json.dumps(Parsed)))
+    with Manifest:
+        Manifest.executemany('INSERT OR REPLACE INTO cfourparse (FileHash, Parser, Parsed) VALUES (?, ?, ?)',
+                             CacheRows)
+
+def LinkManifest(DataUser, Manifest):
+
+    """
+        Sets the CalcID of the files in the manifest that are not yet linked to
+        a calculation, using the label of each calculation in Table
+        calculations. Files whose calculation is not in the database stay
+        unlinked and are parsed again by the next update.
+    """
+    import mariadb
+
+    try:
+        Connection = DataUser.OpenConnection()
+        cur = Connection.cursor()
+        cur.execute('USE moleculardata')
+        cur.execute("""SELECT CONCAT(m.MoleLabel,':',c.CalcType,'/',c.BasisSet) AS Label, c.CalcID
+                FROM calculations AS c 
+                JOIN molecules AS m
+                    ON m.MoleID = c.MoleID""")
+        CalcIDs = cur.fetchall()
+        cur.close()
+        DataUser.CloseConnection(Connection)
+    except mariadb.Error as e:
+        print('Error joining into Table for Calc Dictionary: {error}'.format(error=e))
+        return
+    with Manifest:
+        Manifest.executemany('UPDATE cfourfiles SET CalcID = ? WHERE CalcLabel = ? AND CalcID IS NULL',
+                             [(CalcID, Label) for Label, CalcID in CalcIDs])
+
+def ClearManifest(ManifestName=None):
+
+    """
+        Marks every file in the manifest as not loaded (CalcID NULL). Used when
+        the database is recreated, since the CalcIDs in the manifest no longer
+        exist. The hashes and the parse cache are kept, so the next update
+        reads the unchanged files from the cache instead of parsing them.
+    """
+    Manifest = OpenManifest(ManifestName)
+    with Manifest:
+        Manifest.execute('UPDATE cfourfiles SET CalcID = NULL')
+    Manifest.close()
+
+def WindowResults(WorkerPool, Function, Items, Window):
+
+    """
+        Generator over the results of Function for each of Items computed by
+        WorkerPool, in the order of Items. Unlike Pool.imap, which submits every
+        item at once and keeps each result until it is read, at most Window
+        items are submitted and not yet read, so the results held in memory are
+        bounded when the consumer is slower than the workers.
+    """
+    import collections
+
+    Pending = collections.deque()
+    for Item in Items:
+        Pending.append(WorkerPool.apply_async(Function,(Item,)))
+        if len(Pending) >= Window:
+            yield Pending.popleft().get()
+    while len(Pending) > 0:
+        yield Pending.popleft().get()
+
+class CoordAccumulator:
+
+    """
+        Columnar store of the Cartesian coordinates extracted from the JMOLplot
+        files. Each atom of each calculation is one row of a NumPy structured
+        array (CoordType) holding integer keys (the index of the molecule in
+        MoleLabels, of the calculation in CalcTypes and of the basis set in
+        BasisSets, the number of the atom in the molecule and its atomic number)
+        and the X, Y and Z coordinates. The array is preallocated and doubled
+        when it is full. The labels of the database (CalcLabel and AIMLabel) are
+        only formed when asked for.
+    """
+
+    def __init__(self, MoleLabels, Capacity=1024):
+
+        import numpy as np
+
+        self.MoleLabels = MoleLabels
+        self._Rows = np.empty(Capacity,dtype=CoordType)
+        self._Count = 0
+
+    def __len__(self):
+        return self._Count
+
+    @property
+    def Data(self):
+        """
+            The structured array of the coordinates added so far.
+        """
+        return self._Rows[:self._Count]
+
+    def _Reserve(self, NumRows):
+
+        import numpy as np
+
+        if self._Count + NumRows > len(self._Rows):
+            Rows = np.empty(max(2*len(self._Rows),self._Count + NumRows),dtype=CoordType)
+            Rows[:self._Count] = self._Rows[:self._Count]
+            self._Rows = Rows
+
+    def append(self, MoleIndex, CalcIndex, BasisIndex, CoordData):
+        """
+            Adds the atoms of one calculation. CoordData is [[atomic number, X, Y,
+            Z], ...] in the order of the atoms in the molecule (see ParseCoordFile).
+        """
+        import numpy as np
+
+        NumRows = len(CoordData)
+        if NumRows == 0: return
+        self._Reserve(NumRows)
+        Values = np.array(CoordData,dtype=np.float64).reshape(NumRows,4)
+        Rows = self._Rows[self._Count:self._Count + NumRows]
+        Rows['MoleIndex'] = MoleIndex
+        Rows['CalcIndex'] = CalcIndex
+        Rows['BasisIndex'] = BasisIndex
+        Rows['AtomMolNum'] = np.arange(1,NumRows + 1)
+        Rows['AtomicNum'] = Values[:,0]
+        Rows['XCoord'] = Values[:,1]
+        Rows['YCoord'] = Values[:,2]
+        Rows['ZCoord'] = Values[:,3]
+        self._Count += NumRows
+
+    def extend(self, Other):
+        """
+            Adds the coordinates of another CoordAccumulator with the same
+            MoleLabels.
+        """
+        self._Reserve(len(Other))
+        self._Rows[self._Count:self._Count + len(Other)] = Other.Data
+        self._Count += len(Other)
+
+    def CalcLabel(self, MoleIndex, CalcIndex, BasisIndex):
+        """
+            Label of a calculation: 'compound:calc/basis'.
+        """
+        return '{COMP}:{CALC}/{BAS}'.format(COMP=self.MoleLabels[MoleIndex],CALC=CalcTypes[CalcIndex],
+                                            BAS=BasisSets[BasisIndex])
+
+    def AIMLabel(self, MoleIndex, AtomMolNum):
+        """
+            Label of an atom in a molecule: 'compound_AtomMolNum'.
+        """
+        return '{}_{}'.format(self.MoleLabels[MoleIndex],AtomMolNum)
+
+    def tolist(self):
+        """
+            Returns the coordinates as a list of [CalcLabel, AIMLabel, CoordLabel,
+            AtomicNum, XCoord, YCoord, ZCoord].
+        """
+        CoordList = []
+        for MoleIndex, CalcIndex, BasisIndex, AtomMolNum, AtomicNum, XCoord, YCoord, ZCoord in self.Data.tolist():
+            labelC = self.CalcLabel(MoleIndex,CalcIndex,BasisIndex)
+            CoordList.append([labelC,self.AIMLabel(MoleIndex,AtomMolNum),labelC + '_{}'.format(AtomMolNum),
+                              AtomicNum,XCoord,YCoord,ZCoord])
+        return CoordList
+
+def ExtractMoleculeBlocks(DataUser, MoleculeDataframe, Coords=True, Workers=1, ChunkSize=None,
+                          Manifest=None, Report=None):
+
+    """
+        Extracts the calculation data (prp.dat) and the Cartesian coordinates
+        (JMOLplot) of the molecules in MoleculeDataframe in a single pass over
+        the calculation directories (see WalkCalculations). Coordinates are only
+        read for calculations with both files, and the atoms of each molecule
+        are taken from its scf/pvdz geometry. If Coords is False only the
+        calculation data is read and DataUser is not used.
+        With Workers greater than 1, the calculations are parsed by a pool of
+        worker processes, ChunkSize calculations at a time (by default about
+        four chunks per worker). The calculations read from one archive are
+        sent to a worker together (see ParseCalculations). At most two groups
+        per worker are parsed ahead of the molecule being yielded (see
+        WindowResults). The results are merged in the order of the walk, so the
+        lists are the same as in serial mode.
+        With Manifest (see OpenManifest), only the calculations that are new or
+        modified since they were loaded are extracted (see CheckManifest), and
+        files parsed before are read from the parse cache (see ReadParseCache)
+        instead of being parsed again. Report receives the number of new,
+        modified and unchanged calculations and the number read from the cache
+        ('Cached').
+        Generator that yields CalcList, AtomList and CoordList for one molecule
+        at a time, as soon as its calculations have been parsed. CoordList is a
+        CoordAccumulator.
+    """
+    import os
+    import contextlib
+    import functools
+    import itertools
+    import multiprocessing
+
+    AtomDict = ReadAtomDict(DataUser) if Coords else {}
+    MoleLabels = MoleculeDataframe['MoleLabel'].values.tolist()
+    MoleIndex = {Label: i for i, Label in enumerate(MoleLabels)}
+
+    # 1. List the calculations with a data file. The sources of the files (see
+    #    EntrySource) rather than the entries are kept so the tasks can be sent
+    #    to the worker processes.
+    Tasks = []
+    TaskEntries = []
+    for Comp, calc, basis, Files in WalkCalculations(MoleculeDataframe):
+        # Data file if it exists
+        CalcEntry = Files.get('prp.dat')
+        if CalcEntry is None: continue
+        # Coordinate data if it exists. Data will be pulled from JMOLplot.
+        CoordEntry = Files.get(os.path.normcase('JMOLplot')) if Coords else None
+        Tasks.append([Comp,calc,basis,EntrySource(CalcEntry),EntrySource(CoordEntry) if CoordEntry is not None else None])
+        TaskEntries.append([Entry for Entry in (CalcEntry,CoordEntry) if Entry is not None])
+
+    # 2. Skip the calculations already loaded from the same files and read the
+    #    files parsed before from the cache.
+    TaskHashes = [[None,None]]*len(Tasks)
+    Cached = [None]*len(Tasks)
+    if Manifest is not None:
+        Tasks, TaskHashes = CheckManifest(Manifest,Tasks,TaskEntries,Report)
+        Cached = ReadParseCache(Manifest,Tasks,TaskHashes)
+        if Report is not None:
+            Report['Cached'] = Report.get('Cached',0) + sum(Result is not None for Result in Cached)
+    ParseTasks = [Task for Task, Result in zip(Tasks,Cached) if Result is None]
+
+    # 3. Group the other tasks: the tasks read from one archive form a group and
+    #    the rest are grouped ChunkSize at a time (one at a time in this process).
+    NumWorkers = min(Workers,len(ParseTasks))
+    if NumWorkers <= 1:
+        ChunkSize = 1
+    elif ChunkSize is None:
+        ChunkSize = max(1,len(ParseTasks) // (4*NumWorkers))
+    TaskGroups = []
+    for Task in ParseTasks:
+        Archive = TaskArchive(Task)
+        if (len(TaskGroups) == 0 or Archive != TaskArchive(TaskGroups[-1][-1]) or
+            (Archive is None and len(TaskGroups[-1]) >= ChunkSize)):
+            TaskGroups.append([])
+        TaskGroups[-1].append(Task)
+
+    # 4. Parse the groups, in this process or in the worker pool. WindowResults
+    #    returns the results in the order of ParseTasks.
+    Parser = functools.partial(ParseCalculations,AtomDict=AtomDict)
+    ParsedTasks = []
+    with contextlib.ExitStack() as WorkerStack:
+        # The archives are closed and the parsed files saved in the cache even if
+        # the caller stops early.
+        WorkerStack.callback(CloseArchives)
+        if Manifest is not None:
+            WorkerStack.callback(SaveParseCache,Manifest,ParsedTasks)
+        if NumWorkers <= 1:
+            Results = itertools.chain.from_iterable(map(Parser,TaskGroups))
+        else:
+            WorkerPool = WorkerStack.enter_context(multiprocessing.Pool(processes=NumWorkers))
+            Results = itertools.chain.from_iterable(WindowResults(WorkerPool,Parser,TaskGroups,2*NumWorkers))
+
+        # 5. Add the labels and collect the data of each molecule. The tasks of
+        #    a molecule are consecutive, so it is complete when the next molecule
+        #    starts.
+        CalcList = []
+        AtomList = []
+        CoordList = CoordAccumulator(MoleLabels)
+        for Count, (Task, Hashes, Result) in enumerate(zip(Tasks,TaskHashes,Cached),1):
+            if Result is None:
+                Result = next(Results)
+                ParsedTasks.append([Task[:3],Hashes,Result])
+            CalcValues, CoordData = Result
+            if (Count % 20) == 0: print('*',end='') 
+            Comp, calc, basis = Task[:3]
+            if len(CalcList) > 0 and CalcList[-1][1] != Comp:
+                yield CalcList, AtomList, CoordList
+                CalcList = []
+                AtomList = []
+                CoordList = CoordAccumulator(MoleLabels)
+            # Create a unique label for each calculation
+            labelC = '{COMP}:{CALC}/{BAS}'.format(COMP=Comp,CALC=calc,BAS=basis)
+            # Combine the values and append them to CalcList 
+            CalcList.append([labelC,Comp,calc,basis] + CalcValues)
+            if CoordData is None: continue
+            CoordList.append(MoleIndex[Comp],CalcTypes.index(calc),BasisSets.index(basis),CoordData)
+            if (calc == 'scf') and (basis == 'pvdz'):
+                for i, (AtomicNum, XCoord, YCoord, ZCoord) in enumerate(CoordData,1):
+                    AtomList.append(['{}_{}'.format(Comp,i),Comp,AtomicNum,i])
+        if len(CalcList) > 0:
+            yield CalcList, AtomList, CoordList
+
+def ExtractMoleculeData(DataUser, MoleculeDataframe, Coords=True, Workers=1, ChunkSize=None,
+                        Manifest=None, Report=None):
+
+    """
+        Extracts the calculation data and Cartesian coordinates of all the
+        molecules in MoleculeDataframe (see ExtractMoleculeBlocks).
+        Returns CalcList, AtomList and CoordList (a CoordAccumulator).
+    """
+    CalcList = []
+    AtomList = []
+    CoordList = CoordAccumulator(MoleculeDataframe['MoleLabel'].values.tolist())
+    for MoleCalcList, MoleAtomList, MoleCoordList in ExtractMoleculeBlocks(DataUser,MoleculeDataframe,Coords,Workers,
+                                                                           ChunkSize,Manifest,Report):
+        CalcList += MoleCalcList
+        AtomList += MoleAtomList
+        CoordList.extend(MoleCoordList)
+    return CalcList, AtomList, CoordList
+
+def PipelineUpdate(DataUser, MoleculeDataframe, MoleculeBlocks, BatchSize=50, QueueSize=4, Report=None):
+
+    """
+        Inserts the molecules from MoleculeBlocks (see ExtractMoleculeBlocks)
+        while they are being extracted. The molecules are grouped BatchSize at
+        a time and put on a queue holding at most QueueSize batches. A writer
+        thread inserts each batch with UpdateCalcData and then UpdateCoordData,
+        so the database writes overlap the parsing. At most QueueSize + 2
+        batches are held here, plus the calculations that ExtractMoleculeBlocks
+        parses ahead (two groups per worker). If a batch cannot be written,
+        extraction stops and the error is raised once the writer has finished.
+        Returns the number of calculations, atoms and coordinates extracted and
+        the number of each inserted. If Report is a dictionary, the insert
+        statistics are added to it (see DatabaseTools.InsertRows).
+    """
+    import queue
+    import threading
+
+    BatchQueue = queue.Queue(maxsize=QueueSize)
+    StopWriting = threading.Event()
+    NewCounts = [0,0,0]
+    WriteErrors = []
+
+    def WriteBatches():
+        while True:
+            Batch = BatchQueue.get()
+            if Batch is None: return
+            # After an error the remaining batches are taken off the queue but
+            # not written.
+            if StopWriting.is_set(): continue
+            try:
+                CalcList, AtomList, CoordList = Batch
+                NewCounts[0] += UpdateCalcData(DataUser,MoleculeDataframe,CalcList,Report)
+                NewAtomCount, NewCoordCount = UpdateCoordData(DataUser,MoleculeDataframe,AtomList,CoordList,Report)
+                NewCounts[1] += NewAtomCount
+                NewCounts[2] += NewCoordCount
+            except Exception as e1:
+                WriteErrors.append(e1)
+                StopWriting.set()
+
+    Writer = threading.Thread(target=WriteBatches,daemon=True)
+    Writer.start()
+    MoleLabels = MoleculeDataframe['MoleLabel'].values.tolist()
+    TotalCounts = [0,0,0]
+    Batch = [[],[],CoordAccumulator(MoleLabels)]
+    NumMolecules = 0
+    try:
+        for CalcList, AtomList, CoordList in MoleculeBlocks:
+            if StopWriting.is_set(): break
+            Batch[0] += CalcList
+            Batch[1] += AtomList
+            Batch[2].extend(CoordList)
+            TotalCounts = [TotalCounts[0] + len(CalcList),TotalCounts[1] + len(AtomList),
+                           TotalCounts[2] + len(CoordList)]
+            NumMolecules += 1
+            if NumMolecules == BatchSize:
+                BatchQueue.put(Batch)
+                Batch = [[],[],CoordAccumulator(MoleLabels)]
+                NumMolecules = 0
+        if NumMolecules > 0:
+            BatchQueue.put(Batch)
+    finally:
+        BatchQueue.put(None)
+        Writer.join()
+    if len(WriteErrors) > 0:
+        raise WriteErrors[0]
+    return TotalCounts, NewCounts
+
+def ExtractCalcData(MoleculeDataframe):
+
+    """
+        Returns the calculation data of the molecules in MoleculeDataframe
+        (see ExtractMoleculeData).
+    """
+    CalcList, AtomList, CoordList = ExtractMoleculeData(None,MoleculeDataframe,Coords=False)
+    return CalcList
+
+def ExtractCartCoordData(DataUser,MoleculeDataframe):
+
+    """
+        Returns the atoms and Cartesian coordinates (a CoordAccumulator) of the
+        molecules in MoleculeDataframe (see ExtractMoleculeData).
+    """
+    CalcList, AtomList, CoordList = ExtractMoleculeData(DataUser,MoleculeDataframe)
+    return AtomList, CoordList
+
+def UpdateDatabase(DataUser, Workers=1, Incremental=True, Pipeline=False, BatchSize=50, QueueSize=4):
+
+    """
+        Inserts the molecules in MoleculeTable.xlsx and the calculations and
+        coordinates of the CFOUR outputs under MoleculeDir that are not yet in
+        the database. Molecules already in the database are skipped by the
+        server using the unique keys of the tables (see MigrateDatabase); the
+        calculations, atoms and coordinates already in the database are updated
+        with the values read from their files (see UpdateCalcData). With
+        Workers greater than 1 the outputs are parsed in parallel (see
+        ExtractMoleculeData). If Incremental is True, only files that are new
+        or modified since they were last loaded are extracted, using the local
+        manifest (see OpenManifest); otherwise every file is extracted again.
+        Files parsed before are read from the parse cache in both cases. If
+        Pipeline is True, the molecules are inserted BatchSize at a time by a
+        writer thread while the rest are parsed (see PipelineUpdate); otherwise
+        all the data is extracted before it is inserted. The rows are written
+        in chunks by DatabaseTools.BulkInsert and BulkUpdate and the rate for
+        each table is printed with the summary.
+    """
 
     import mariadb
     import math
     import pandas as pd
     import numpy as np
+    import DatabaseTools
 
     # Preliminaries:
     # 1. Data file for molecules table to be read into dataframe
@@ -915,66 +1782,72 @@ def UpdateDatabase(DataUser):
     MoleculeDataframe = pd.read_excel(RefFileName,index_col=0)
     TotalMoleCount = len(MoleculeDataframe)
 
-    # Insert new molecule information into molecule table
-    # 1. Querry molecule to get current molecules. Each MoleLabel is unique.
-    Connection = DataUser.OpenConnection()
-    cur = Connection.cursor()
-    cur.execute('USE moleculardata')
-    cur.execute('SELECT MoleLabel FROM molecules')
-    CurrentMoleculeQuery = cur.fetchall()
-    cur.close()
-    DataUser.CloseConnection(Connection)
-
-    # 2. Convert query to list of current molecules by flattening two dimensional
-    #    query list [('label #1',),('label #2',), ...] to one dimensional list
-    #    ['label #1', 'label #2', ... ]
-    if len(CurrentMoleculeQuery) > 0: 
-        CurrentMoleculeList = [j for sub in CurrentMoleculeQuery for j in sub]
-    else:
-        CurrentMoleculeList = []
-
-    # 3. Remove any molecules currently in the database from Dataframe to be
-    #    used to insert new molecules (to avoid data duplication).
-    NewMoleculeDataframe = MoleculeDataframe[~MoleculeDataframe['MoleLabel'].isin(CurrentMoleculeList)]
-    NewMoleCount = len(NewMoleculeDataframe)
+    # 2. Databases created before the tables had unique keys are migrated, since the
+    #    keys are what keeps the data from being duplicated.
+    MigrateDatabase(DataUser)
 
-    # 4. Clean Dataframe by adding default PubChemCID (0) and other book keeping
+    # Insert new molecule information into molecule table
+    # 1. Clean Dataframe by adding default PubChemCID (0) and other book keeping
     valuesDic = {'PubChemCID': 0, 'JMOL': 'N'}
     typeDic = {'PubChemCID' : int}
-    NewMoleculeDataframe = NewMoleculeDataframe.fillna(value=valuesDic)
+    NewMoleculeDataframe = MoleculeDataframe.fillna(value=valuesDic)
     NewMoleculeDataframe = NewMoleculeDataframe.astype(typeDic)
 
-    # 5. Convert Dataframe to a list
-    MoleculeList = NewMoleculeDataframe.values.tolist()
-    # Create string to add data
-    if len(MoleculeList) > 0:
+    # 2. Columns of the Dataframe in the order of the table's columns. Each MoleLabel
+    #    is unique (uk_mole_label), so the molecules already in the database are
+    #    skipped by the server.
+    InsertReport = {}
+    NewMoleCount = 0
+    if len(NewMoleculeDataframe) > 0:
         MoleculeColumns = ['PubChemCID', 'MoleGroup', 'MoleLabel', 'MoleFormula',
                            'MoleName', 'SMILES', 'JMOL', 'LCSS', 'Flammable', 
                            'AcuteToxicity', 'Corrosive', 'Irritant', 'Cyclic']
-        # Generate string to insert the data through a SQL query
-        DatabaseMolString = UpdateDatabaseQuery(MoleculeList,MoleculeColumns,'molecules')
+        MoleculeData = {Column: NewMoleculeDataframe.iloc[:,i] for i, Column in enumerate(MoleculeColumns)}
         # SQL query
         try:
             Connection = DataUser.OpenConnection()
             cur = Connection.cursor()
             cur.execute('USE moleculardata')
-            cur.execute(DatabaseMolString)
+            NewMoleCount = DatabaseTools.BulkInsert(Connection,'molecules',MoleculeData,MoleculeColumns,
+                                                    Ignore=True,Report=InsertReport)[0]
             cur.close()
             DataUser.CloseConnection(Connection)
         except mariadb.Error as e1:
             print('Error inserting Database Table molecules: {error}'.format(error=e1))
 
     print('Extracting Data:',end = '')
-    CalcList = ExtractCalcData(MoleculeDataframe)
-    AtomList, CoordList = ExtractCartCoordData(DataUser,MoleculeDataframe)
-    print('\n')
-
-    NewCalcCount = UpdateCalcData(DataUser,MoleculeDataframe,CalcList)
-    NewAtomCount, NewCoordCount = UpdateCoordData(DataUser,MoleculeDataframe,AtomList,CoordList)
-
-    TotalCalcCount = len(CalcList)
-    TotalAtomCount = len(AtomList)
-    TotalCoordCount = len(CoordList)
+    if not Incremental:
+        ClearManifest()
+    Manifest = OpenManifest()
+    FileReport = {}
+    if Pipeline:
+        MoleculeBlocks = ExtractMoleculeBlocks(DataUser,MoleculeDataframe,Workers=Workers,Manifest=Manifest,
+                                               Report=FileReport)
+        try:
+            TotalCounts, NewCounts = PipelineUpdate(DataUser,MoleculeDataframe,MoleculeBlocks,BatchSize,QueueSize,
+                                                    InsertReport)
+        finally:
+            MoleculeBlocks.close()
+        TotalCalcCount, TotalAtomCount, TotalCoordCount = TotalCounts
+        NewCalcCount, NewAtomCount, NewCoordCount = NewCounts
+        print('\n')
+    else:
+        CalcList, AtomList, CoordList = ExtractMoleculeData(DataUser,MoleculeDataframe,Workers=Workers,
+                                                            Manifest=Manifest,Report=FileReport)
+        print('\n')
+
+        NewCalcCount = UpdateCalcData(DataUser,MoleculeDataframe,CalcList,InsertReport)
+        NewAtomCount, NewCoordCount = UpdateCoordData(DataUser,MoleculeDataframe,AtomList,CoordList,InsertReport)
+
+        TotalCalcCount = len(CalcList)
+        TotalAtomCount = len(AtomList)
+        TotalCoordCount = len(CoordList)
+    print('Calculations: {} new, {} modified, {} unchanged (skipped), {} read from the parse cache'.format(
+        FileReport.get('New',0),FileReport.get('Modified',0),FileReport.get('Unchanged',0),
+        FileReport.get('Cached',0)))
+    # Link the files just loaded to their calculations so they are skipped next time.
+    LinkManifest(DataUser,Manifest)
+    Manifest.close()
 
     TableList = ['molecules','calculations','atoms.','cartcoords']
     TotalCountList = [TotalMoleCount,TotalCalcCount,TotalAtomCount,TotalCoordCount]
@@ -988,6 +1861,7 @@ def UpdateDatabase(DataUser):
     SummaryString += '|{:^10}|{:^15}|{:^15}|{:^15}|{:^15}|\n'.format('New',*NewCountList)
     SummaryString += '+{:-<10}+{:-<15}+{:-<15}+{:-<15}+{:-<15}+\n'.format('','','','','')
     print(SummaryString)
+    DatabaseTools.PrintInsertReport(InsertReport)
 
 def UpdateMenu(DataUser):
 
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import DatabaseTools
+
+# Server variables of a server that gives the rows of an INSERT consecutive IDs.
+Variables = {'max_allowed_packet': 16777216, 'auto_increment_increment': 1, 'innodb_autoinc_lock_mode': 1}
+
+def test_add_id_range_merges_following_ranges():
+    IDRanges = DatabaseTools.AddIDRange([],1,100)
+    DatabaseTools.AddIDRange(IDRanges,101,50)
+    assert IDRanges == [[1,150]]
+
+def test_add_id_range_keeps_gaps():
+    IDRanges = DatabaseTools.AddIDRange([[1,100]],201,10)
+    assert IDRanges == [[1,100],[201,210]]
+
+def test_consecutive_ids():
+    assert DatabaseTools.ConsecutiveIDs(Variables)
+    assert not DatabaseTools.ConsecutiveIDs(dict(Variables,auto_increment_increment=2))
+    assert not DatabaseTools.ConsecutiveIDs(dict(Variables,innodb_autoinc_lock_mode=2))
+
+class ChunkCursor:
+
+    # Cursor that gives each chunk the next IDs, skipping the rows listed in Skipped.
+    def __init__(self, Server):
+        self.Server = Server
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def executemany(self, Query, Rows):
+        Inserted = [Row for Row in Rows if Row[0] not in self.Server['Skipped']]
+        self.rowcount = len(Inserted)
+        self.lastrowid = self.Server['NextID'] if Inserted else 0
+        self.Server['NextID'] += len(Inserted)*self.Server['Increment']
+
+    def close(self):
+        pass
+
+class ChunkConnection:
+
+    def __init__(self, Skipped=(), Increment=1):
+        self.Server = {'NextID': 1, 'Skipped': set(Skipped), 'Increment': Increment}
+
+    def cursor(self):
+        return ChunkCursor(self.Server)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+def insert_rows(Connection, RowVariables=Variables):
+    pytest.importorskip('mariadb')
+    DataRows = [[i] for i in range(10)]
+    return DatabaseTools.InsertRows(Connection,'test',['Value'],DataRows,Ignore=True,ChunkSize=4,
+                                    Variables=RowVariables)
+
+def test_insert_rows_id_ranges():
+    assert insert_rows(ChunkConnection()) == (10,[[1,10]])
+
+def test_insert_rows_skipped_rows_have_no_range():
+    # The chunk [4, 5, 6, 7] has a skipped row, so its IDs are not known.
+    assert insert_rows(ChunkConnection(Skipped=[5])) == (9,[[1,4],[8,9]])
+
+def test_insert_rows_increment_has_no_range():
+    RowVariables = dict(Variables,auto_increment_increment=2)
+    assert insert_rows(ChunkConnection(Increment=2),RowVariables) == (10,[])
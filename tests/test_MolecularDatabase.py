@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MolecularDatabase
+
+FixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtures')
+
+# Values of fixtures/prp.dat as read by the original line-by-line parser: every
+# field keeps its last value (the second E(SCF) and the Total CCSD energy), except
+# the rotational constants, which are read from their first occurence.
+ExpectedCalcValues = ['2v ','2v ',24,-76.026799,-76.228,-76.25,-76.251,825604.9,435185.3,284973.5,12.345678]
+
+def test_parse_calc_file():
+    CalcValues = MolecularDatabase.ParseCalcFile(os.path.join(FixtureDir,'prp.dat'))
+    assert CalcValues == ExpectedCalcValues
+
+def test_parse_calc_file_from_memory():
+    # Files read from archives are parsed from their contents (see ReadArchiveMembers).
+    with open(os.path.join(FixtureDir,'prp.dat'),'rb') as DataFile:
+        CalcValues = MolecularDatabase.ParseCalcFile(DataFile.read())
+    assert CalcValues == ExpectedCalcValues